@@ -0,0 +1,362 @@
+import argparse
+import math
+import os
+import sys
+
+
+# =======================================================================
+#          Battle analytics: streaming aggregates, charts on demand
+# =======================================================================
+# Everything here is folded in one event at a time and kept in constant memory per
+# combatant and per reaction: running mean/variance (Welford), fixed-bin histograms
+# and counters, never the hits themselves. Aggregates of separate battles or worker
+# processes merge exactly, so one BattleAnalytics can cover a single fight or a whole
+# Monte Carlo run. matplotlib is imported only when a chart is drawn.
+#
+# Attribution follows the event stream of an action (see engine.format_event): damage
+# events during a player's attack count as that player's, DoT ticks and effects going
+# off in the tick (Toxic Spores) count for "DoT", and a hit after a reaction event in the
+# same action also counts for that reaction.
+
+DOT_SOURCE = 'DoT'
+
+
+class RunningStats:
+    # count, mean and variance in one pass (Welford), plus min/max/total
+    __slots__ = ('count', 'mean', 'm2', 'minimum', 'maximum', 'total')
+
+    def __init__(self):
+        self.count = 0
+        self.mean = 0.0
+        self.m2 = 0.0  # sum of squared differences from the mean
+        self.minimum = math.inf
+        self.maximum = -math.inf
+        self.total = 0.0
+
+    def add(self, value):
+        self.count += 1
+        delta = value - self.mean
+        self.mean += delta / self.count
+        self.m2 += delta * (value - self.mean)
+        self.total += value
+        if value < self.minimum:
+            self.minimum = value
+        if value > self.maximum:
+            self.maximum = value
+
+    def merge(self, other):
+        # Chan et al.'s pairwise combination, exact for any split of the data
+        if not other.count:
+            return self
+        if not self.count:
+            self.count, self.mean, self.m2 = other.count, other.mean, other.m2
+        else:
+            count = self.count + other.count
+            delta = other.mean - self.mean
+            self.mean += delta * other.count / count
+            self.m2 += other.m2 + delta * delta * self.count * other.count / count
+            self.count = count
+        self.total += other.total
+        self.minimum = min(self.minimum, other.minimum)
+        self.maximum = max(self.maximum, other.maximum)
+        return self
+
+    @property
+    def variance(self):
+        # sample variance, 0 below two values
+        return self.m2 / (self.count - 1) if self.count > 1 else 0.0
+
+    @property
+    def stdev(self):
+        return math.sqrt(self.variance)
+
+
+class Histogram:
+    # `bins` equal bins over [low, high); values outside land in the first or last bin
+    __slots__ = ('low', 'high', 'counts')
+
+    def __init__(self, low=0.0, high=100.0, bins=20):
+        self.low = low
+        self.high = high
+        self.counts = [0] * bins
+
+    def add(self, value):
+        bins = len(self.counts)
+        index = int((value - self.low) * bins / (self.high - self.low))
+        self.counts[min(max(index, 0), bins - 1)] += 1
+
+    def merge(self, other):
+        if (other.low, other.high, len(other.counts)) != (self.low, self.high, len(self.counts)):
+            raise ValueError("histograms with different bins do not merge")
+        self.counts = [mine + theirs for mine, theirs in zip(self.counts, other.counts)]
+        return self
+
+    def edges(self):
+        width = (self.high - self.low) / len(self.counts)
+        return [self.low + index * width for index in range(len(self.counts) + 1)]
+
+    def quantile(self, q):
+        # upper edge of the bin holding the q-th value, good to one bin width
+        total = sum(self.counts)
+        if not total:
+            return 0.0
+        seen = 0
+        width = (self.high - self.low) / len(self.counts)
+        for index, count in enumerate(self.counts):
+            seen += count
+            if seen >= q * total:
+                return self.low + (index + 1) * width
+        return self.high
+
+
+class CombatantStats:
+    __slots__ = ('actions', 'dealt', 'taken', 'hits', 'by_round', 'defeats')
+
+    def __init__(self, low=0.0, high=100.0, bins=20):
+        self.actions = 0
+        self.dealt = RunningStats()  # per hit dealt
+        self.taken = RunningStats()  # per hit taken
+        self.hits = Histogram(low, high, bins)  # sizes of the hits dealt
+        self.by_round = []  # damage dealt in round 1, 2, ... summed over battles
+        self.defeats = 0
+
+    def deal(self, amount, round_number):
+        self.dealt.add(amount)
+        self.hits.add(amount)
+        by_round = self.by_round
+        while len(by_round) < round_number:
+            by_round.append(0.0)
+        by_round[round_number - 1] += amount
+
+    def merge(self, other):
+        self.actions += other.actions
+        self.dealt.merge(other.dealt)
+        self.taken.merge(other.taken)
+        self.hits.merge(other.hits)
+        for index, amount in enumerate(other.by_round):
+            if index < len(self.by_round):
+                self.by_round[index] += amount
+            else:
+                self.by_round.append(amount)
+        self.defeats += other.defeats
+        return self
+
+
+class ReactionStats:
+    __slots__ = ('triggers', 'damage')
+
+    def __init__(self):
+        self.triggers = 0
+        self.damage = RunningStats()  # per damage event the reaction caused
+
+    def merge(self, other):
+        self.triggers += other.triggers
+        self.damage.merge(other.damage)
+        return self
+
+
+class BattleAnalytics:
+    def __init__(self, low=0.0, high=100.0, bins=20):
+        self.bins = (low, high, bins)  # hit histogram range of every combatant
+        self.combatants = {}  # name -> CombatantStats
+        self.reactions = {}  # reaction name -> ReactionStats
+        self.battles = 0
+        self.wins = 0
+        self.rounds = RunningStats()  # rounds per battle
+        self.rounds_reached = []  # battles that lasted at least round 1, 2, ...
+
+    def combatant(self, name):
+        stats = self.combatants.get(name)
+        if stats is None:
+            stats = self.combatants[name] = CombatantStats(*self.bins)
+        return stats
+
+    def observe(self, actor, events, round_number):
+        # one action's events; `actor` is the player whose attack it was, None for the
+        # enemy turns that open a fight
+        reaction = None
+        defeated = ()  # the engine can report a defeat twice in one action
+        if actor is not None:
+            self.combatant(actor.name).actions += 1
+        for kind, source, target, amount, _, detail in events:
+            if kind == 'damage':
+                self.combatant(target.name).taken.add(amount)
+                if detail is not None:
+                    # an effect going off in the tick, not part of the attack that ended in it
+                    self.combatant(DOT_SOURCE).deal(amount, round_number)
+                    continue
+                if actor is not None:
+                    self.combatant(actor.name).deal(amount, round_number)
+                if reaction is not None:
+                    reaction.damage.add(amount)
+            elif kind == 'area damage':
+                _, targets, damages = detail
+                for hit, taken in zip(targets, damages):
+                    if taken is not None:
+                        self.combatant(hit.name).taken.add(taken)
+                        if actor is not None:
+                            self.combatant(actor.name).deal(taken, round_number)
+                        if reaction is not None:
+                            reaction.damage.add(taken)
+            elif kind == 'dot damage':
+                self.combatant(target.name).taken.add(amount)
+                self.combatant(DOT_SOURCE).deal(amount, round_number)
+            elif kind == 'attack':
+                attacker = self.combatant(source.name)
+                attacker.actions += 1
+                attacker.deal(amount, round_number)
+                self.combatant(target.name).taken.add(amount)
+            elif kind == 'reaction':
+                reaction = self.reactions.get(detail.name)
+                if reaction is None:
+                    reaction = self.reactions[detail.name] = ReactionStats()
+                reaction.triggers += 1
+            elif kind == 'defeated' and target not in defeated:
+                defeated += (target,)
+                self.combatant(target.name).defeats += 1
+
+    def end_battle(self, encounter):
+        self.battles += 1
+        if not encounter.enemies:
+            self.wins += 1
+        self.rounds.add(encounter.round_number)
+        reached = self.rounds_reached
+        while len(reached) < encounter.round_number:
+            reached.append(0)
+        for index in range(encounter.round_number):
+            reached[index] += 1
+
+    def merge(self, other):
+        for name, stats in other.combatants.items():
+            self.combatant(name).merge(stats)
+        for name, stats in other.reactions.items():
+            self.reactions.setdefault(name, ReactionStats()).merge(stats)
+        self.battles += other.battles
+        self.wins += other.wins
+        self.rounds.merge(other.rounds)
+        for index, count in enumerate(other.rounds_reached):
+            if index < len(self.rounds_reached):
+                self.rounds_reached[index] += count
+            else:
+                self.rounds_reached.append(count)
+        return self
+
+    def damage_per_round(self, name):
+        # mean damage `name` dealt in each round, over the battles that got that far
+        reached = self.rounds_reached
+        return [amount / reached[index] if index < len(reached) and reached[index] else amount
+                for index, amount in enumerate(self.combatants[name].by_round)]
+
+    def report(self):
+        lines = [f"Battles: {self.battles}  Won: {self.wins}  "
+                 f"Rounds: mean {self.rounds.mean:.2f} (sd {self.rounds.stdev:.2f}, max {self.rounds.maximum:g})"
+                 if self.battles else "Battles: 0"]
+        lines.append(f"{'combatant':<16}{'actions':>8}{'hits':>7}{'dealt':>10}{'per hit':>9}{'sd':>7}"
+                     f"{'p90':>7}{'taken':>10}{'defeated':>9}")
+        for name in sorted(self.combatants):
+            stats = self.combatants[name]
+            dealt, taken = stats.dealt, stats.taken
+            lines.append(f"{name:<16}{stats.actions:>8}{dealt.count:>7}{dealt.total:>10.1f}{dealt.mean:>9.2f}"
+                         f"{dealt.stdev:>7.2f}{stats.hits.quantile(0.9):>7.1f}{taken.total:>10.1f}{stats.defeats:>9}")
+        if self.reactions:
+            lines.append(f"{'reaction':<16}{'triggers':>9}{'per battle':>11}{'damage':>10}{'per hit':>9}")
+            for name, stats in sorted(self.reactions.items(), key=lambda item: -item[1].triggers):
+                per_battle = stats.triggers / self.battles if self.battles else 0.0
+                lines.append(f"{name:<16}{stats.triggers:>9}{per_battle:>11.2f}{stats.damage.total:>10.1f}"
+                             f"{stats.damage.mean:>9.2f}")
+        return '\n'.join(lines)
+
+    # ------------------------------------------------------------- charts
+
+    def chart_damage_over_time(self, path=None):
+        # mean damage per round of everyone who dealt any; saved to `path`, shown if None
+        from matplotlib.ticker import MaxNLocator
+        figure, axes = self._figure(path)
+        for name in sorted(self.combatants):
+            per_round = self.damage_per_round(name)
+            if any(per_round):
+                axes.plot(range(1, len(per_round) + 1), per_round, marker='o', label=name)
+        axes.xaxis.set_major_locator(MaxNLocator(integer=True))
+        axes.set_xlabel("Round")
+        axes.set_ylabel("Mean damage dealt")
+        axes.set_title(f"Damage over time ({self.battles} battle{'s' if self.battles != 1 else ''})")
+        axes.legend()
+        return self._finish(figure, path)
+
+    def chart_reactions(self, path=None):
+        figure, axes = self._figure(path)
+        ordered = sorted(self.reactions.items(), key=lambda item: -item[1].triggers)
+        axes.bar([name for name, _ in ordered], [stats.triggers for _, stats in ordered])
+        axes.set_ylabel("Triggers")
+        axes.set_title(f"Reaction frequency ({self.battles} battle{'s' if self.battles != 1 else ''})")
+        axes.tick_params(axis='x', labelrotation=45)
+        figure.tight_layout()
+        return self._finish(figure, path)
+
+    def save_charts(self, directory):
+        # both charts as PNGs; returns their paths
+        os.makedirs(directory, exist_ok=True)
+        paths = (os.path.join(directory, 'damage_over_time.png'), os.path.join(directory, 'reactions.png'))
+        self.chart_damage_over_time(paths[0])
+        self.chart_reactions(paths[1])
+        return paths
+
+    @staticmethod
+    def _figure(path):
+        # a chart that is only saved needs no GUI backend, a bare Figure renders with Agg
+        if path is None:
+            import matplotlib.pyplot as plt
+            return plt.subplots(figsize=(8, 4.5))
+        from matplotlib.figure import Figure
+        figure = Figure(figsize=(8, 4.5))
+        return figure, figure.subplots()
+
+    @staticmethod
+    def _finish(figure, path):
+        if path is None:
+            import matplotlib.pyplot as plt
+            plt.show()
+            plt.close(figure)
+        else:
+            figure.savefig(path)
+        return path
+
+
+def analyze_journal(path, analytics=None):
+    # fold one journaled fight (see replay.py) into `analytics`
+    from replay import Replay
+    analytics = analytics if analytics is not None else BattleAnalytics()
+    replay = Replay.load(path)
+    fight = replay.seek(0)
+    encounter = fight.encounter
+    analytics.observe(None, encounter.events, encounter.round_number)
+    for action in replay.actions:
+        actor = encounter.current_actor()
+        round_number = encounter.round_number
+        fight.play(action)
+        analytics.observe(actor, encounter.events, round_number)
+    analytics.end_battle(encounter)
+    return analytics
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Damage and reaction statistics of journaled fights, one or many.")
+    parser.add_argument('journals', nargs='+', help="fight journals written by dndSim.py")
+    parser.add_argument('--charts', metavar='DIR', help="save damage-over-time and reaction charts here")
+    parser.add_argument('--show', action='store_true', help="open the charts in a window instead")
+    args = parser.parse_args(argv)
+
+    analytics = BattleAnalytics()
+    for path in args.journals:
+        analyze_journal(path, analytics)
+    print(analytics.report())
+    if args.charts:
+        for path in analytics.save_charts(args.charts):
+            print(f"Saved {path}")
+    if args.show:
+        analytics.chart_damage_over_time()
+        analytics.chart_reactions()
+
+
+if __name__ == '__main__':
+    sys.exit(main())
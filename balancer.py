@@ -0,0 +1,348 @@
+import argparse
+import math
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from statistics import NormalDist
+
+from engine import Enemy, default_enemies
+from batch import simulate_batch
+from montecarlo import simulate, parse_player, parse_enemy, parse_dice, load_party
+
+
+# =======================================================================
+#        Encounter auto-balancer (enemy stats for a target win rate)
+# =======================================================================
+# Searches one enemy's max HP and defense plus the flat enemy damage (the game's Enemy
+# Damage field) for a target win rate and, optionally, a target fight length (mean
+# rounds to kill, as montecarlo.py reports it).
+#
+# Each generation lays a small grid over the current ranges and races it: every live
+# candidate plays another `step` fights on the batch engine, then any candidate whose
+# best case (the low end of its confidence interval) is worse than the leader's worst
+# case is dropped. Clearly bad candidates go after one step, close ones keep sampling.
+# The next generation moves the grid over to the winner, or narrows it around the winner
+# when it was already inside. The search stops once a candidate meets the target with
+# confidence. All candidates in a step share a seed (common random numbers), so they
+# are compared on the same dice.
+
+class Candidate:
+    __slots__ = ('max_hp', 'defense', 'damage', 'fights', 'wins', 'rounds', 'round_squares')
+
+    def __init__(self, max_hp, defense, damage):
+        self.max_hp = max_hp
+        self.defense = defense
+        self.damage = damage
+        self.fights = 0
+        self.wins = 0
+        self.rounds = 0  # summed over won fights
+        self.round_squares = 0
+
+    def key(self):
+        return (self.max_hp, self.defense, self.damage)
+
+    def add(self, result):
+        self.fights += result.fights
+        self.wins += result.wins
+        for rounds, count in result.rounds.items():
+            self.rounds += rounds * count
+            self.round_squares += rounds * rounds * count
+
+    def win_rate(self):
+        return self.wins / self.fights if self.fights else 0.0
+
+    def mean_rounds(self):
+        return self.rounds / self.wins if self.wins else math.inf
+
+    def rounds_stderr(self):
+        if self.wins < 2:
+            return math.inf
+        mean = self.rounds / self.wins
+        variance = max(self.round_squares - self.wins * mean * mean, 0.0) / (self.wins - 1)
+        return math.sqrt(variance / self.wins)
+
+    def win_stderr(self):
+        # Agresti-Coull, so 0 or all wins out of a few fights still has some spread
+        adjusted = (self.wins + 2) / (self.fights + 4)
+        return math.sqrt(adjusted * (1 - adjusted) / (self.fights + 4))
+
+
+class BalanceResult:
+    def __init__(self, best, candidates, fights, generations, seconds, met):
+        self.best = best
+        self.candidates = candidates  # tried, all generations
+        self.fights = fights  # simulated, all candidates
+        self.generations = generations
+        self.seconds = seconds
+        self.met = met  # best meets the target with confidence
+
+
+def _play(job):
+    # one step for one candidate; module level so a process pool can run it
+    party, enemies, tuned, candidate, fights, seed, options = job
+    max_hp, defense, damage = candidate
+    enemies = list(enemies)
+    template = enemies[tuned]
+    enemies[tuned] = Enemy(template.name, max_hp, defense=defense, elements_applied=template.elements)
+    return simulate_batch(party, enemies, fights=fights, batch_size=fights, seed=seed, enemy_damage=damage,
+                          **options)
+
+
+class Balancer:
+    def __init__(self, party, enemies, tuned, target_win_rate, target_rounds=None, win_tolerance=0.05,
+                 rounds_tolerance=1.0, step=1000, max_fights=16000, confidence=0.95, resolution=0.5, workers=1, seed=0,
+                 **options):
+        self.party = party
+        self.enemies = enemies
+        self.tuned = tuned  # index into `enemies` of the enemy whose HP/defense are searched
+        self.target_win_rate = target_win_rate
+        self.target_rounds = target_rounds
+        self.win_tolerance = win_tolerance
+        self.rounds_tolerance = rounds_tolerance
+        self.step = step
+        self.max_fights = max_fights  # per candidate
+        self.z = NormalDist().inv_cdf(0.5 + confidence / 2)
+        self.resolution = resolution
+        self.workers = workers
+        self.seed = seed
+        self.options = options  # dice, damage_override, max_actions for the batch engine
+        self.steps = 0
+        self.fights = 0
+
+    # ------------------------------------------------------------- scoring
+
+    def score_bounds(self, candidate):
+        # (low, high) of the distance to the target, in tolerances: below 1 on both
+        # counts means the candidate is within tolerance of the target
+        win_error = abs(candidate.win_rate() - self.target_win_rate)
+        win_margin = self.z * candidate.win_stderr()
+        low = max(win_error - win_margin, 0.0) / self.win_tolerance
+        high = (win_error + win_margin) / self.win_tolerance
+        if self.target_rounds is not None:
+            rounds_margin = self.z * candidate.rounds_stderr()
+            if math.isinf(rounds_margin):
+                # no wins to measure length on; the win rate alone is far off anyway
+                high = math.inf
+            else:
+                rounds_error = abs(candidate.mean_rounds() - self.target_rounds)
+                low += max(rounds_error - rounds_margin, 0.0) / self.rounds_tolerance
+                high += (rounds_error + rounds_margin) / self.rounds_tolerance
+        return low, high
+
+    def score(self, candidate):
+        win = abs(candidate.win_rate() - self.target_win_rate) / self.win_tolerance
+        if self.target_rounds is None:
+            return win
+        return win + abs(candidate.mean_rounds() - self.target_rounds) / self.rounds_tolerance
+
+    def meets_target(self, candidate):
+        # the whole confidence interval is inside tolerance on every count
+        win_error = abs(candidate.win_rate() - self.target_win_rate) + self.z * candidate.win_stderr()
+        if win_error > self.win_tolerance:
+            return False
+        if self.target_rounds is None:
+            return True
+        rounds_error = abs(candidate.mean_rounds() - self.target_rounds) + self.z * candidate.rounds_stderr()
+        return rounds_error <= self.rounds_tolerance
+
+    # ------------------------------------------------------------- racing
+
+    def _run_step(self, candidates, pool):
+        seed = self.seed + self.steps
+        self.steps += 1
+        jobs = [(self.party, self.enemies, self.tuned, candidate.key(), self.step, seed, self.options)
+                for candidate in candidates]
+        results = pool.map(_play, jobs) if pool is not None else map(_play, jobs)
+        for candidate, result in zip(candidates, results):
+            candidate.add(result)
+            self.fights += result.fights
+
+    def race(self, candidates, pool=None):
+        # the best of `candidates`, sampling each only until it is clearly out
+        alive = list(candidates)
+        while True:
+            hungry = [candidate for candidate in alive if candidate.fights < self.max_fights]
+            if not hungry:
+                break
+            self._run_step(hungry, pool)
+            bounds = {candidate: self.score_bounds(candidate) for candidate in alive}
+            best_high = min(high for _, high in bounds.values())
+            alive = [candidate for candidate in alive if bounds[candidate][0] <= best_high]
+            leader = min(alive, key=self.score)
+            if len(alive) == 1 or self.meets_target(leader):
+                break
+            # what is left is too close to call: every interval is already narrower than
+            # `resolution` tolerances, more fights would only split hairs
+            if all(bounds[candidate][1] - bounds[candidate][0] < self.resolution for candidate in alive):
+                break
+        return min(alive, key=self.score)
+
+    # ------------------------------------------------------------- search
+
+    def search(self, hp_range, defense_range, damage_range, generations=8, points=3):
+        start = time.perf_counter()
+        tried = {}
+        best = None
+        ranges = [hp_range, defense_range, damage_range]
+        limits = list(ranges)
+        logs = (True, False, True)
+        pool = ProcessPoolExecutor(max_workers=self.workers) if self.workers > 1 else None
+        try:
+            for generation in range(1, generations + 1):
+                grid = []
+                for max_hp in _spread(*ranges[0], points, log=True):
+                    for defense in _spread(*ranges[1], points):
+                        for damage in _spread(*ranges[2], points, log=True):
+                            key = (int(round(max_hp)), round(defense, 1), round(damage, 1))
+                            if key not in tried:
+                                tried[key] = Candidate(*key)
+                            grid.append(tried[key])
+                if best is not None:
+                    grid.append(best)
+                best = self.race(list(dict.fromkeys(grid)), pool)
+                if self.meets_target(best):
+                    break
+                ranges = [_next_range(bounds, limit, value, log)
+                          for bounds, limit, value, log in zip(ranges, limits, best.key(), logs)]
+        finally:
+            if pool is not None:
+                pool.shutdown()
+        return BalanceResult(best, list(tried.values()), self.fights, generation, time.perf_counter() - start,
+                             self.meets_target(best))
+
+
+def _spread(low, high, points, log=False):
+    if points == 1 or low == high:
+        return [(low + high) / 2]
+    if log and low > 0:
+        ratio = (high / low) ** (1 / (points - 1))
+        return [low * ratio ** index for index in range(points)]
+    return [low + (high - low) * index / (points - 1) for index in range(points)]
+
+def _next_range(bounds, limits, value, log=False):
+    # pattern search: a winner on the edge of the grid moves the window over to it, one
+    # inside the grid halves the window around it. Never leaves the starting limits
+    if log and limits[0] > 0:
+        forward, back = math.log, math.exp
+    else:
+        forward = back = lambda x: x
+    low, high = forward(bounds[0]), forward(bounds[1])
+    floor, ceiling = forward(limits[0]), forward(limits[1])
+    center = forward(value)
+    width = high - low
+    edge = width * 0.01
+    on_edge = (center <= low + edge and low > floor + edge) or (center >= high - edge and high < ceiling - edge)
+    half = width / 2 if on_edge else width / 4
+    low, high = max(center - half, floor), min(center + half, ceiling)
+    return back(low), back(high)
+
+
+def balance(party, enemies=None, tune=None, target_win_rate=0.5, target_rounds=None, hp_range=None,
+            defense_range=None, damage_range=None, enemy_damage=10, generations=8, points=3, **options):
+    # tune: name of the enemy to reshape, default the one with the most HP
+    if enemies is None:
+        enemies = default_enemies()
+    if tune is None:
+        tuned = max(range(len(enemies)), key=lambda index: enemies[index].max_hp)
+    else:
+        names = [enemy.name for enemy in enemies]
+        if tune not in names:
+            raise ValueError(f"no enemy named {tune!r} (have {', '.join(names)})")
+        tuned = names.index(tune)
+    template = enemies[tuned]
+    hp_range = hp_range or (template.max_hp / 4, template.max_hp * 4)
+    defense_range = defense_range or (0.0, max(template.defense * 2, 10.0))
+    damage_range = damage_range or (max(enemy_damage / 4, 1.0), enemy_damage * 3)
+    balancer = Balancer(party, enemies, tuned, target_win_rate, target_rounds, **options)
+    return balancer, balancer.search(hp_range, defense_range, damage_range, generations, points)
+
+
+# =======================================================================
+#                                  CLI
+# =======================================================================
+
+def format_report(balancer, result, tuned_name):
+    best = result.best
+    lines = [
+        f"{tuned_name}: max HP {best.max_hp}, defense {best.defense:g}, enemy damage {best.damage:g}",
+        f"  win rate {best.win_rate() * 100:.1f}% +/- {balancer.z * best.win_stderr() * 100:.1f} "
+        f"(target {balancer.target_win_rate * 100:.0f}% +/- {balancer.win_tolerance * 100:.0f})",
+    ]
+    if best.wins:
+        target = f" (target {balancer.target_rounds:g} +/- {balancer.rounds_tolerance:g})" \
+            if balancer.target_rounds is not None else ""
+        lines.append(f"  rounds to kill {best.mean_rounds():.2f} +/- {balancer.z * best.rounds_stderr():.2f}{target}")
+    lines.append("  meets the target" if result.met else "  closest found, not within tolerance with confidence")
+    sampled = sum(1 for candidate in result.candidates if candidate.fights)
+    dropped_early = sum(1 for candidate in result.candidates if 0 < candidate.fights <= balancer.step)
+    lines.append(f"Search: {result.generations} generation(s), {sampled} candidates "
+                 f"({dropped_early} dropped after one step), {result.fights} fights, {result.seconds:.1f} s")
+    return '\n'.join(lines)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Search an enemy's HP and defense and the enemy damage for a "
+                                                 "target win rate and fight length.")
+    parser.add_argument('--party', default='roster.db', help="roster saved by the menu, or an old players.pkl")
+    parser.add_argument('--player', type=parse_player, action='append', help="NAME:HP:ELEMENT[:INITIATIVE], overrides --party")
+    parser.add_argument('--enemy', type=parse_enemy, action='append', help="NAME:HP[:DEFENSE], default is Harin/Sigurd")
+    parser.add_argument('--tune', default=None, help="enemy to reshape (default: the one with the most HP)")
+    parser.add_argument('--win-rate', type=float, default=0.5, help="target party win rate, 0..1")
+    parser.add_argument('--rounds', type=float, default=None, help="target mean rounds to kill")
+    parser.add_argument('--win-tolerance', type=float, default=0.05)
+    parser.add_argument('--rounds-tolerance', type=float, default=1.0)
+    parser.add_argument('--hp', type=float, nargs=2, metavar=('MIN', 'MAX'), default=None)
+    parser.add_argument('--defense', type=float, nargs=2, metavar=('MIN', 'MAX'), default=None)
+    parser.add_argument('--damage', type=float, nargs=2, metavar=('MIN', 'MAX'), default=None,
+                        help="enemy damage range (default: around --enemy-damage)")
+    parser.add_argument('--enemy-damage', type=float, default=10, help="today's enemy damage, centers --damage")
+    parser.add_argument('--dice', type=parse_dice, default=(8, 3), help="player damage roll, e.g. 3d8")
+    parser.add_argument('--override', type=float, default=None, help="flat player damage instead of dice")
+    parser.add_argument('--max-actions', type=int, default=500)
+    parser.add_argument('--step', type=int, default=1000, help="fights per candidate per racing step")
+    parser.add_argument('--max-fights', type=int, default=16000, help="fights at most per candidate")
+    parser.add_argument('--confidence', type=float, default=0.95)
+    parser.add_argument('--generations', type=int, default=8)
+    parser.add_argument('--points', type=int, default=3, help="grid points per searched stat and generation")
+    parser.add_argument('--workers', type=int, default=None, help="processes racing candidates (default: all cores)")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--verify', type=int, default=0, metavar='FIGHTS',
+                        help="replay the winner this many times on the object engine")
+    args = parser.parse_args(argv)
+
+    party = args.player or load_party(args.party)
+    if not party:
+        parser.error(f"no party: nobody in {args.party} and no --player given")
+    enemies = args.enemy or default_enemies()
+    workers = args.workers or os.cpu_count() or 1
+    try:
+        balancer, result = balance(
+            party, enemies, tune=args.tune, target_win_rate=args.win_rate, target_rounds=args.rounds,
+            hp_range=args.hp, defense_range=args.defense, damage_range=args.damage, enemy_damage=args.enemy_damage,
+            generations=args.generations, points=args.points, win_tolerance=args.win_tolerance,
+            rounds_tolerance=args.rounds_tolerance, step=args.step, max_fights=args.max_fights,
+            confidence=args.confidence, workers=workers, seed=args.seed, dice=args.dice,
+            damage_override=args.override, max_actions=args.max_actions)
+    except ValueError as error:
+        parser.error(str(error))
+    tuned_name = enemies[balancer.tuned].name
+    print(format_report(balancer, result, tuned_name))
+
+    best = result.best
+    specs = ' '.join(f"--enemy {enemy.name}:{best.max_hp}:{best.defense:g}" if index == balancer.tuned
+                     else f"--enemy {enemy.name}:{enemy.max_hp}:{enemy.defense:g}" for index, enemy in enumerate(enemies))
+    print(f"Use: {specs} --enemy-damage {best.damage:g}")
+    if args.verify:
+        tuned = list(enemies)
+        template = tuned[balancer.tuned]
+        tuned[balancer.tuned] = Enemy(template.name, best.max_hp, defense=best.defense,
+                                      elements_applied=template.elements)
+        check = simulate(party, tuned, fights=args.verify, workers=workers, seed=args.seed, dice=args.dice,
+                         damage_override=args.override, enemy_damage=best.damage, max_actions=args.max_actions,
+                         lockstep=False)
+        print(f"Object engine: win rate {check.win_rate() * 100:.1f}% over {check.fights} fights, "
+              f"rounds to kill {check.mean_rounds():.2f}")
+
+
+if __name__ == '__main__':
+    sys.exit(main())
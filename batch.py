@@ -0,0 +1,584 @@
+import argparse
+import itertools
+import math
+import sys
+import time
+from collections import Counter
+
+import numpy as np
+
+from dice import sample_damage
+from engine import (element_bits, element_codes, element_mask, reaction_table, ALL_ELEMENTS, ELEMENT_CODE_BITS,
+                    default_enemies)
+from montecarlo import (SimulationResult, HP_BUCKETS, simulate, parse_player, parse_enemy,
+                        parse_dice, load_party)
+
+
+# =======================================================================
+#        Lockstep batch engine (N encounters as struct-of-arrays)
+# =======================================================================
+# Same rules as engine.Encounter driven the way montecarlo.run_fight drives it:
+# players hit a random living enemy with a dice roll, enemies hit a random
+# living player for a flat amount. One step = one actor in every encounter.
+
+GEO = element_bits['Geo']
+GEO_CODE = element_codes['Geo']
+ANEMO = element_bits['Anemo']
+ELECTRO = element_bits['Electro']
+
+# the ones that end in a plain damage roll on the target come first, up to SUPERCONDUCT
+REACTION_NAMES = ["None", "Melt", "Vaporize", "Superconduct", "Freeze", "Electro-charged", "Swirl",
+                  "Crystallize", "Stabilize", "Petrify", "Overload", "Bloom", "Burning", "Healing Winds",
+                  "Corrosion", "Sandstorm", "Frostbite", "Thunderstorm", "Toxic Spores"]
+(NO_REACTION, MELT, VAPORIZE, SUPERCONDUCT, FREEZE, ELECTRO_CHARGED, SWIRL, CRYSTALLIZE, STABILIZE,
+ PETRIFY, OVERLOAD, BLOOM, BURNING, HEALING_WINDS, CORROSION, SANDSTORM, FROSTBITE, THUNDERSTORM,
+ TOXIC_SPORES) = range(len(REACTION_NAMES))
+
+# debuff timers. The engine's EffectScheduler ticks once per player attack, so each
+# timer here just stores the attack count it runs out at and is live while that is
+# still ahead of the encounter's attack count - nothing has to be decremented.
+TIMER_NAMES = ["Freeze", "Petrify", "Superconduct", "Disarmed", "Disadvantage", "Movement Speed Reduction",
+               "Toxic Spores", "Burning", "Corrosion", "Frostbite"]
+(T_FREEZE, T_PETRIFY, T_SUPERCONDUCT, T_DISARMED, T_DISADVANTAGE, T_SLOWED, T_SPORES,
+ T_BURNING, T_CORROSION, T_FROSTBITE) = range(len(TIMER_NAMES))
+DOT_TIMERS = (T_BURNING, T_CORROSION, T_FROSTBITE)
+
+SHIELD_NONE, SHIELD_REDUCTION, SHIELD_IMMUNITY = 0, 1, 2
+
+TURN_TABLE = 1 << 20  # most entries a batch's table of next turns may have, see next_turns
+LIVING_BITS = 16  # most combatants whose living set fits BatchEncounters.living
+PICK_BITS = 8  # most players (or enemies) picked from a living_picks table
+
+# reactions that only start timers on the target: (timer, duration) pairs
+TIMER_REACTIONS = {
+    FREEZE: [(T_FREEZE, 1)],
+    PETRIFY: [(T_PETRIFY, 1)],
+    OVERLOAD: [(T_DISARMED, 1)],
+    BURNING: [(T_BURNING, 3)],
+    CORROSION: [(T_CORROSION, 2)],
+    FROSTBITE: [(T_FROSTBITE, 3), (T_SLOWED, 3)],
+    TOXIC_SPORES: [(T_SPORES, 3)],
+}
+
+
+def pick_living(alive, rng):
+    # uniform pick among the True rows of each column, like rng.choice(living)
+    # running count of living rows, one row at a time: cheaper than cumsum over a bool matrix
+    counts = [alive[0].astype(np.int32)]
+    for row in alive[1:]:
+        counts.append(counts[-1] + row)
+    pick = (rng.random(alive.shape[1]) * counts[-1]).astype(np.int32)
+    # the pick-th living row is the first whose running count passes pick
+    choice = np.zeros(alive.shape[1], dtype=np.int64)
+    for count in counts[:-1]:
+        choice += count <= pick
+    return choice
+
+def living_picks(width):
+    # for every set of living combatants out of `width` (bit c for combatant c) and every
+    # draw out of lcm(1..width): the (draw * count // lcm)-th of them. The lcm is a
+    # multiple of every count, so a uniform draw picks each living one equally often
+    draws = math.lcm(*range(1, width + 1))
+    running = np.cumsum((np.arange(1 << width)[:, None] >> np.arange(width)) & 1, axis=1)
+    pick = np.arange(draws) * running[:, -1:] // draws
+    nth = (running[:, :, None] <= pick[:, None, :]).sum(axis=1)
+    return np.minimum(nth, width - 1).astype(np.int32)
+
+# element code (Enemy.element_order) -> element bit, 0 for "no element"
+CODE_BITS = np.array([0] + [element_bits[name] for name in sorted(element_codes, key=element_codes.get)], dtype=np.uint8)
+
+def drop_elements(order, mask):
+    # Enemy.remove_elements on packed element orders: the codes in `mask` go, the rest
+    # close up and keep their order
+    kept = np.zeros_like(order)
+    shift = np.zeros_like(order)
+    mask = mask.astype(order.dtype)
+    # only as many positions as the longest order fills, mostly one or two
+    positions = -(-int(order.max()).bit_length() // ELEMENT_CODE_BITS) if order.size else 0
+    for position in range(positions):
+        code = (order >> (ELEMENT_CODE_BITS * position)) & 7
+        keep = (code != 0) & ((mask & CODE_BITS.take(code)) == 0)
+        kept |= (code << shift) * keep
+        shift += keep * ELEMENT_CODE_BITS
+    return kept
+
+def next_turns(orders):
+    # for turn orders (slot -> combatant, one per row), every set of living combatants
+    # (bit c for combatant c) and every cursor: the first living slot after the cursor,
+    # wrapping round, or the cursor itself when nobody else is left, and its combatant
+    count, width = orders.shape
+    living = np.arange(1 << width)[None, :, None]
+    cursor = np.arange(width, dtype=np.int32)
+    table = np.broadcast_to(cursor, (count, 1 << width, width)).copy()
+    # furthest first, so the nearest living slot is what stays
+    for step in range(width - 1, 0, -1):
+        slot = (cursor + step) % width
+        up = (living >> orders[:, None, slot]) & 1
+        table = np.where(up == 1, slot, table)
+    # and who sits there, so _advance needs a single index for both
+    actors = np.take_along_axis(orders[:, None, :], table, axis=2)
+    return table.ravel(), actors.ravel()
+
+def build_reaction_arrays():
+    # engine.reaction_table as flat arrays so a whole batch can be looked up at once
+    size = ALL_ELEMENTS + 1
+    kind = np.zeros(size, dtype=np.int8)
+    multiplier = np.ones(size)
+    remove = np.zeros(size, dtype=np.uint8)
+    for mask, reaction in enumerate(reaction_table):
+        if reaction:
+            kind[mask] = REACTION_NAMES.index(reaction.name)
+            multiplier[mask] = reaction.multiplier
+            remove[mask] = reaction.remove_mask
+    return kind, multiplier, remove
+
+REACTION_KIND, REACTION_MULTIPLIER, REACTION_REMOVE = build_reaction_arrays()
+# the plain hit's multiplier, NaN past SUPERCONDUCT: _damage's fmax makes that nothing
+# whatever the defense
+REACTION_HIT = np.where(REACTION_KIND <= SUPERCONDUCT, REACTION_MULTIPLIER, np.nan)
+
+
+class BatchEncounters:
+    # Arrays are enemy-major, (enemies, n) rather than (n, enemies): numpy is slow at
+    # looping over a 2-wide inner axis, and this way every op runs down a whole row.
+    # The last axis is always the encounter, finished ones are dropped along it.
+    # (timers are compressed apart, and None stands for an array nothing reads)
+    ROW_ARRAYS = ('player_hp', 'hp', 'elements', 'element_order', 'swirled', 'shield_type', 'shield_expiry', 'shield_element',
+                  'order', 'turn_key', 'cursor', 'actor', 'living', 'round_number', 'actions', 'done')
+
+    def __init__(self, party, enemy_templates, n, rng, reroll_initiative=False):
+        self.num_players = num_players = len(party)
+        self.num_enemies = num_enemies = len(enemy_templates)
+        self.player_names = [player.name for player in party]
+        self.enemy_names = [enemy.name for enemy in enemy_templates]
+
+        self.player_max_hp = np.array([player.max_hp for player in party], dtype=float)
+        self.player_element = np.array([element_bits[player.element] for player in party], dtype=np.uint8)
+        self.player_code = np.array([element_codes[player.element] for player in party], dtype=np.int32)
+        self.player_hp = np.repeat(self.player_max_hp[:, None], n, axis=1)
+
+        self.enemy_max_hp = np.array([enemy.max_hp for enemy in enemy_templates], dtype=float)
+        self.defense = np.array([enemy.defense for enemy in enemy_templates], dtype=float)
+        self.hp = np.repeat(self.enemy_max_hp[:, None], n, axis=1)
+        initial_elements = np.array([element_mask(enemy.elements) for enemy in enemy_templates], dtype=np.uint8)
+        self.elements = np.repeat(initial_elements[:, None], n, axis=1)
+        # the same elements in application order, packed like Enemy.element_order: Crystallize
+        # shields the newest one
+        initial_order = np.array([enemy.element_order for enemy in enemy_templates], dtype=np.int32)
+        self.element_order = np.repeat(initial_order[:, None], n, axis=1)
+        # only Crystallize reads it, and that needs Geo from a player or an enemy's start
+        if not ((self.player_element & GEO).any() or (initial_elements & GEO).any()):
+            self.element_order = None
+        self.swirled = np.zeros((num_enemies, n), dtype=np.uint8)
+        self.shield_type = np.zeros((num_enemies, n), dtype=np.int8)
+        self.shield_expiry = np.zeros((num_enemies, n), dtype=np.int32)
+        self.shield_element = np.zeros((num_enemies, n), dtype=np.uint8)
+        self.timers = np.zeros((len(TIMER_NAMES), num_enemies, n), dtype=np.int32)
+        self.latest = [0] * len(TIMER_NAMES)  # latest expiry ever set per timer, to skip ticks nothing is due on
+        self.shield_latest = 0  # the same for shields
+        self.clock = 0  # no encounter's clock is behind this, see run
+
+        # turn order: slot -> combatant, players are 0..P-1 and enemies P..P+E-1
+        if reroll_initiative:
+            player_initiative = rng.integers(1, 21, (n, num_players))
+        else:
+            player_initiative = np.tile([player.initiative for player in party], (n, 1))
+        enemy_initiative = rng.integers(1, 21, (n, num_enemies))
+        initiative = np.concatenate([player_initiative, enemy_initiative], axis=1)
+        # stable, so ties keep players-then-enemies order like list.sort(reverse=True)
+        order = np.argsort(-initiative, axis=1, kind='stable').astype(np.int32)
+        self.order = np.ascontiguousarray(order.T)
+        # a batch rarely holds more than a few dozen different orders (only the enemies
+        # reroll), so whose turn is next can be looked up in a table, see _advance
+        width = num_players + num_enemies
+        self.turn_table = self.turn_actor = None
+        self.turn_key = np.zeros(n, dtype=np.int32)
+        if width << width <= TURN_TABLE:
+            # each order packed into one number, 4 bits a slot, to tell them apart
+            packed = (order.astype(np.int64) << (4 * np.arange(width))).sum(axis=1)
+            _, first, order_id = np.unique(packed, return_index=True, return_inverse=True)
+            if len(first) * width << width <= TURN_TABLE:
+                self.turn_table, self.turn_actor = next_turns(order[first])
+                self.turn_key = (order_id.astype(np.int32) << width).ravel()
+        self.cursor = np.zeros(n, dtype=np.int32)
+        self.actor = self.order[0].copy()  # whose turn it is, the combatant at the cursor
+        if self.turn_table is not None:
+            self.order = None
+        # bit c set for every combatant c still standing, numbered like `order`, when they
+        # fit: targets are then picked from it, see _pick
+        self.player_picks = self.enemy_picks = None
+        self.living = np.zeros(n, dtype=np.int32)
+        if width <= LIVING_BITS:
+            self.living = self._living()
+            if num_players <= PICK_BITS:
+                self.player_picks = living_picks(num_players)
+            if num_enemies <= PICK_BITS:
+                self.enemy_picks = living_picks(num_enemies)
+        self.round_number = np.ones(n, dtype=np.int32)
+        self.actions = np.zeros(n, dtype=np.int32)  # player attacks so far, also the debuff clock
+        self.done = np.zeros(n, dtype=bool)
+
+    def run(self, rng, result, dice=(8, 3), damage_override=None, enemy_damage=10, max_actions=500):
+        max_steps = (max_actions + 1) * (self.num_players + self.num_enemies) * 2
+        for _ in range(max_steps):
+            live = len(self.done)
+            if not live:
+                break
+            # keep the arrays dense so every op below runs on live encounters only
+            if np.count_nonzero(self.done) * 4 > live:
+                self._retire(result)
+                live = len(self.done)
+                if not live:
+                    break
+            # a timer or shield expiring at or before every encounter's clock can't be running
+            self.clock = int(self.actions.min())
+            actor = self.actor
+            is_player = actor < self.num_players
+            self._player_attacks(is_player & ~self.done, actor, rng, dice, damage_override)
+            self._enemy_turns(~is_player & ~self.done, actor - self.num_players, rng, enemy_damage)
+            self._advance(max_actions)
+        self.done[:] = True
+        self._retire(result)
+        return result
+
+    # ------------------------------------------------------------------ rules
+
+    # one (enemy, encounter) pair is addressed by its flat index into the (enemies, n)
+    # arrays, take/put on a flat index is a lot cheaper than arr[cols, rows]
+    def _cells(self, rows, cols):
+        return cols * len(self.done) + rows
+
+    def _living(self):
+        living = (self.player_hp[0] > 0).astype(np.uint16)
+        for bit, hp in enumerate(itertools.chain(self.player_hp[1:], self.hp), 1):
+            living |= np.left_shift(hp > 0, np.uint16(bit), dtype=np.uint16)
+        return living.astype(np.int32)
+
+    def _pick(self, picks, living, rng):
+        # uniform pick among the `living` set of each row, like pick_living
+        draws = picks.shape[1]
+        return picks.take(living * np.int32(draws) + rng.integers(0, draws, living.size, dtype=np.int16))
+
+    def _damage(self, rows, cols, damage, attack_element=0, cells=None):
+        # Enemy.calculate_damage for one (encounter, enemy) pair per row. Superconduct and
+        # shields are only looked up once one could still be running
+        if cells is None:
+            cells = self._cells(rows, cols)
+        defense = self.defense.take(cols)
+        if self.latest[T_SUPERCONDUCT] > self.clock:
+            superconduct = self.timers[T_SUPERCONDUCT].ravel().take(cells) > self.actions.take(rows)
+            defense *= 1.0 - 0.5 * superconduct
+        damage = damage - defense
+        if self.shield_latest > self.clock:
+            shielded = self.shield_expiry.ravel().take(cells) > self.actions.take(rows)
+            if shielded.any():
+                shield = np.where(shielded, self.shield_type.ravel().take(cells), SHIELD_NONE)
+                damage = np.where(shield == SHIELD_REDUCTION, damage * (1 - 0.3), damage)
+                if attack_element:
+                    immune = (shield == SHIELD_IMMUNITY) & (self.shield_element.ravel().take(cells) == attack_element)
+                    damage = np.where(immune, 0.0, damage)
+        # ufunc.at is numpy's quickest scatter-subtract for an array of amounts
+        np.subtract.at(self.hp.ravel(), cells, np.fmax(damage, 0.0))
+
+    def _damage_all(self, rows, damage, attack_element):
+        # same as _damage but against every enemy of each row: the dead only drop further
+        # below 0, which nothing tells apart (the DoT tick does the same)
+        for col in range(self.num_enemies):
+            self._damage(rows, col, damage, attack_element)
+
+    def _player_attacks(self, attacking, actor, rng, dice, damage_override):
+        rows = np.flatnonzero(attacking)
+        if not rows.size:
+            return
+        n = rows.size
+        alive = self.hp > 0
+        # random living enemy, like rng.choice(encounter.enemies)
+        if self.enemy_picks is not None:
+            target = self._pick(self.enemy_picks, self.living.take(rows) >> self.num_players, rng)
+        else:
+            target = pick_living(alive.take(rows, axis=1), rng)
+
+        # one uniform draw per roll against the exact dice distribution
+        selected_dice, dice_quantity = dice
+        base_damage = sample_damage(rng, n, selected_dice, dice_quantity, damage_override)
+
+        player_index = actor[rows]
+        attack_element = self.player_element.take(player_index)
+        cells = self._cells(rows, target)
+        elements, swirled = self.elements.ravel(), self.swirled.ravel()
+        held = elements.take(cells)
+        applied = held | attack_element
+        # Enemy.apply_element: a new element goes on top of the order, a held one stays put
+        if self.element_order is not None:
+            element_order = self.element_order.ravel()
+            new = (held & attack_element) == 0
+            placed = element_order.take(cells) << (np.int32(ELEMENT_CODE_BITS) * new)
+            placed |= self.player_code.take(player_index) * new
+        key = applied | swirled.take(cells)
+        kind = REACTION_KIND.take(key)
+
+        superconduct = np.flatnonzero(kind == SUPERCONDUCT)
+        if superconduct.size:
+            now = self.actions.take(rows.take(superconduct))
+            self.timers[T_SUPERCONDUCT].ravel()[cells.take(superconduct)] = now + 1
+            self.latest[T_SUPERCONDUCT] = max(self.latest[T_SUPERCONDUCT], int(now.max()) + 1)
+        # every row goes through the plain hit, the other reactions' as NaN: cheaper than
+        # pulling the direct rows out
+        self._damage(rows, target, base_damage * REACTION_HIT.take(key), cells=cells)
+
+        # the rest grouped by reaction, each group in row order: one sort instead of a
+        # mask over every row per reaction
+        special = np.flatnonzero(kind > SUPERCONDUCT)
+        special_kind = kind.take(special)
+        present = np.bincount(special_kind, minlength=len(REACTION_NAMES))
+        grouped = special.take(np.argsort(special_kind, kind='stable'))
+        ends = np.cumsum(present)
+        for reaction in np.flatnonzero(present):
+            m = grouped[ends[reaction] - present[reaction]:ends[reaction]]
+            r, c = rows.take(m), cells.take(m)
+            now = self.actions[r]
+            if reaction in TIMER_REACTIONS:
+                for timer, duration in TIMER_REACTIONS[reaction]:
+                    self.timers[timer].ravel()[c] = now + duration
+                    self.latest[timer] = max(self.latest[timer], int(now.max()) + duration)
+            elif reaction == BLOOM:
+                max_hp = self.enemy_max_hp.take(target.take(m))
+                hp = self.hp.ravel()
+                hp[c] = np.minimum(max_hp, hp[c] + max_hp * 0.25)
+            elif reaction == STABILIZE:
+                self.shield_type.ravel()[c] = SHIELD_REDUCTION
+                self.shield_expiry.ravel()[c] = now + 2
+                self.shield_latest = max(self.shield_latest, int(now.max()) + 2)
+            elif reaction == CRYSTALLIZE:
+                # the newest element that isn't Geo, like Enemy.newest_element(excluding='Geo')
+                newest = placed[m] & 7
+                newest = np.where(newest == GEO_CODE, (placed[m] >> ELEMENT_CODE_BITS) & 7, newest)
+                shield_element = CODE_BITS.take(newest)
+                has_element = shield_element != 0
+                c = c[has_element]
+                self.shield_type.ravel()[c] = SHIELD_IMMUNITY
+                self.shield_expiry.ravel()[c] = now[has_element] + 1
+                self.shield_element.ravel()[c] = shield_element[has_element]
+                if c.size:
+                    self.shield_latest = max(self.shield_latest, int(now.max()) + 1)
+            elif reaction == ELECTRO_CHARGED:
+                self._damage_all(r, base_damage.take(m) * REACTION_MULTIPLIER.take(key.take(m)), ELECTRO)
+            elif reaction == THUNDERSTORM:
+                self._damage_all(r, self.player_max_hp[player_index[m]] * 0.4, ELECTRO)
+            elif reaction == SANDSTORM:
+                disadvantage = self.timers[T_DISADVANTAGE]
+                disadvantage[:, r] = np.where(alive[:, r], now + 1, disadvantage[:, r])
+                self.latest[T_DISADVANTAGE] = max(self.latest[T_DISADVANTAGE], int(now.max()) + 1)
+            elif reaction == SWIRL:
+                swirl = applied[m] & np.uint8(~ANEMO & ALL_ELEMENTS)
+                for swirled_row, alive_row in zip(self.swirled, alive):
+                    swirled_row[r] |= swirl * alive_row.take(r)
+            elif reaction == HEALING_WINDS:
+                player_hp = self.player_hp[:, r]
+                healed = np.minimum(self.player_max_hp[:, None], player_hp + self.player_max_hp[:, None] * 0.2)
+                self.player_hp[:, r] = np.where(player_hp > 0, healed, player_hp)
+
+        # swirled is read back here since Swirl may have just added to the target's set
+        remove = REACTION_REMOVE.take(key)
+        keep = ~remove
+        elements[cells] = applied & keep
+        swirled[cells] = swirled.take(cells) & keep
+        # most reactions clear every element, only a few (Swirl, Stabilize, Petrify) drop one
+        if self.element_order is not None:
+            placed *= remove != ALL_ELEMENTS
+            partial = np.flatnonzero((remove != 0) & (remove != ALL_ELEMENTS))
+            if partial.size:
+                placed[partial] = drop_elements(placed[partial], remove[partial])
+            element_order[cells] = placed
+
+        self._process_turn(attacking)
+
+    def _process_turn(self, attacking):
+        # the end-of-attack effect tick: DoTs, then one tick off every debuff and shield,
+        # then Toxic Spores that ran out go off
+        timers, latest = self.timers, self.latest
+        # a timer set to expire at or before every encounter's clock can't be running
+        clock = int(self.actions.min())
+        if max(latest[timer] for timer in DOT_TIMERS) > clock:
+            # only the encounters that attacked tick: when they're a minority (many enemies
+            # taking turns) pulling their columns out beats masking the whole matrix
+            cols = np.flatnonzero(attacking)
+            if cols.size * 2 < attacking.size:
+                now = self.actions[cols]
+                burning, corrosion, frostbite = (timers[timer].take(cols, axis=1) for timer in DOT_TIMERS)
+            else:
+                cols = slice(None)
+                now = np.where(attacking, self.actions, np.iinfo(np.int32).max)
+                burning, corrosion, frostbite = (timers[timer] for timer in DOT_TIMERS)
+            dot_percent = (burning > now) * 3.0
+            dot_percent += (corrosion > now) * 5.0
+            dot_percent += (frostbite > now) * 3.0
+            dot_percent *= (self.enemy_max_hp / 100)[:, None]
+            self.hp[:, cols] -= dot_percent
+        self.actions += attacking
+        # after the tick, so shields and Superconduct that ended with it no longer count
+        if latest[T_SPORES] > clock:
+            cols, rows = np.nonzero((timers[T_SPORES] == self.actions) & attacking)
+            if rows.size:
+                self._damage(rows, cols, self.enemy_max_hp[cols] * 0.05)
+
+    def _enemy_turns(self, acting, enemy_index, rng, enemy_damage):
+        rows = np.flatnonzero(acting)
+        if not rows.size:
+            return
+        if max(self.latest[T_FREEZE], self.latest[T_PETRIFY]) > self.clock:
+            cells = self._cells(rows, enemy_index[rows])
+            now = self.actions[rows]
+            stunned = self.timers[T_FREEZE].ravel().take(cells) > now
+            stunned |= self.timers[T_PETRIFY].ravel().take(cells) > now
+            rows = rows[~stunned]
+            if not rows.size:
+                return
+        if self.player_picks is not None:
+            target = self._pick(self.player_picks, self.living.take(rows) & (1 << self.num_players) - 1, rng)
+        else:
+            target = pick_living(self.player_hp.take(rows, axis=1) > 0, rng)
+        player_hp = self.player_hp.ravel()
+        player_hp[target * len(self.done) + rows] -= enemy_damage
+
+    def _advance(self, max_actions):
+        live = len(self.done)
+        width = self.num_players + self.num_enemies
+        cursor = self.cursor
+        players = (1 << self.num_players) - 1
+        if self.turn_table is not None:
+            # the table only exists for up to LIVING_BITS combatants, see TURN_TABLE
+            living = self.living = self._living()
+            index = (self.turn_key | living) * width + cursor
+            next_cursor = self.turn_table.take(index)
+            self.actor = self.turn_actor.take(index)
+            over = ((living & players) == 0) | (living <= players)
+        else:
+            # next living slot after the cursor, wrapping round; deaths are rare so
+            # only the rows whose next slot is empty take another look
+            alive = np.concatenate([self.player_hp > 0, self.hp > 0])
+            over = ~alive[:self.num_players].any(axis=0) | ~alive[self.num_players:].any(axis=0)
+            alive = alive.ravel()
+            if width <= LIVING_BITS:
+                self.living = self._living()
+            rows = np.arange(live)
+            order = self.order.ravel()
+            next_cursor = cursor + 1
+            next_cursor -= width * (next_cursor == width)
+            lookup = np.flatnonzero(~alive.take(order.take(next_cursor * live + rows) * live + rows))
+            for _ in range(width - 1):
+                if not lookup.size:
+                    break
+                candidate = (next_cursor.take(lookup) + 1) % width
+                next_cursor[lookup] = candidate
+                combatant = order.take(candidate * live + lookup)
+                lookup = lookup[~alive.take(combatant * live + lookup)]
+            self.actor = order.take(next_cursor * live + rows)
+        # finished encounters move on too, nothing reads their cursor
+        self.round_number += (next_cursor <= cursor) & ~self.done
+        self.cursor = next_cursor
+
+        capped = (self.actions >= max_actions) & (self.actor < self.num_players)
+        self.done |= over | capped
+
+    # ------------------------------------------------------------------ results
+
+    def _retire(self, result):
+        done = self.done
+        hp, player_hp = np.compress(done, self.hp, axis=1), np.compress(done, self.player_hp, axis=1)
+        won = ~(hp > 0).any(axis=0)
+        lost = ~won & ~(player_hp > 0).any(axis=0)
+        result.fights += len(won)
+        result.wins += int(won.sum())
+        result.losses += int(lost.sum())
+        result.draws += int((~won & ~lost).sum())
+        rounds, counts = np.unique(self.round_number.compress(done).compress(won), return_counts=True)
+        result.rounds.update(dict(zip(rounds.tolist(), counts.tolist())))
+        for names, values, max_hp in ((self.player_names, player_hp, self.player_max_hp),
+                                      (self.enemy_names, hp, self.enemy_max_hp)):
+            fraction = np.maximum(values, 0) / np.where(max_hp, max_hp, 1)[:, None]
+            buckets = np.minimum((HP_BUCKETS * fraction).astype(int), HP_BUCKETS)
+            for name, row in zip(names, buckets):
+                counts = np.bincount(row, minlength=HP_BUCKETS + 1)
+                counter = result.hp_remaining.setdefault(name, Counter())
+                for bucket, count in enumerate(counts.tolist()):
+                    if count:
+                        counter[bucket] += count
+
+        keep = ~done
+        # a timer that ran out in every encounter has nothing worth keeping, see run
+        timers = np.zeros(self.timers.shape[:2] + (len(done) - len(won),), dtype=np.int32)
+        for timer, latest in enumerate(self.latest):
+            if latest > self.clock:
+                timers[timer] = np.compress(keep, self.timers[timer], axis=-1)
+        self.timers = timers
+        # compress along the encounter axis, keeps everything C-ordered so ravel() stays a view
+        for name in self.ROW_ARRAYS:
+            if getattr(self, name) is not None:
+                setattr(self, name, np.compress(keep, getattr(self, name), axis=-1))
+
+
+def simulate_batch(party, enemy_templates=None, fights=1000000, batch_size=65536, seed=None,
+                   reroll_initiative=False, **options):
+    if enemy_templates is None:
+        enemy_templates = default_enemies()
+    rng = np.random.default_rng(seed)
+    result = SimulationResult()
+    start = time.process_time()
+    remaining = fights
+    # as many batches as batch_size calls for, but evened out: a step costs much the same
+    # for a few encounters as for thousands, so a small last batch is nearly all overhead
+    batches = -(-fights // batch_size)
+    while remaining > 0:
+        size = -(-remaining // batches)
+        batches -= 1
+        batch = BatchEncounters(party, enemy_templates, size, rng, reroll_initiative=reroll_initiative)
+        batch.run(rng, result, **options)
+        remaining -= size
+    result.cpu_seconds = time.process_time() - start
+    return result
+
+
+# =======================================================================
+#                                  CLI
+# =======================================================================
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Vectorized batch fights, optionally checked against montecarlo.py.")
+    parser.add_argument('-n', '--fights', type=int, default=1000000)
+    parser.add_argument('--party', default='roster.db', help="roster saved by the menu, or an old players.pkl")
+    parser.add_argument('--player', type=parse_player, action='append', help="NAME:HP:ELEMENT[:INITIATIVE]")
+    parser.add_argument('--enemy', type=parse_enemy, action='append', help="NAME:HP[:DEFENSE]")
+    parser.add_argument('--dice', type=parse_dice, default=(8, 3))
+    parser.add_argument('--override', type=float, default=None)
+    parser.add_argument('--enemy-damage', type=float, default=10)
+    parser.add_argument('--max-actions', type=int, default=500)
+    parser.add_argument('--batch-size', type=int, default=65536)
+    parser.add_argument('--seed', type=int, default=None)
+    parser.add_argument('--compare', type=int, default=0, metavar='FIGHTS',
+                        help="also run this many object-engine fights and compare")
+    args = parser.parse_args(argv)
+
+    party = args.player or load_party(args.party)
+    if not party:
+        parser.error(f"no party: nobody in {args.party} and no --player given")
+    enemy_templates = args.enemy or default_enemies()
+    options = dict(dice=args.dice, damage_override=args.override, enemy_damage=args.enemy_damage,
+                   max_actions=args.max_actions)
+
+    batch = simulate_batch(party, enemy_templates, fights=args.fights, batch_size=args.batch_size,
+                           seed=args.seed, **options)
+    print(f"batch:  {batch.fights} fights, win rate {batch.win_rate() * 100:.2f}%, "
+          f"mean rounds {batch.mean_rounds():.2f}, {batch.fights_per_cpu_second():.0f} fights/s")
+    if args.compare:
+        objects = simulate(party, enemy_templates, fights=args.compare, workers=1, seed=args.seed, lockstep=False,
+                           **options)
+        rate = objects.win_rate()
+        stderr = (rate * (1 - rate) / objects.fights) ** 0.5
+        print(f"object: {objects.fights} fights, win rate {rate * 100:.2f}% +/- {stderr * 196:.2f}, "
+              f"mean rounds {objects.mean_rounds():.2f}, {objects.fights_per_cpu_second():.0f} fights/s")
+        print(f"speedup: {batch.fights_per_cpu_second() / objects.fights_per_cpu_second():.1f}x")
+
+
+if __name__ == '__main__':
+    sys.exit(main())
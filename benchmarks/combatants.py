@@ -0,0 +1,325 @@
+import argparse
+import os
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from engine import Enemy, Player, Shield, EffectScheduler, element_mask, element_bits, reaction_table
+
+
+# =======================================================================
+#      Combatant memory / throughput: slotted records vs the old dicts
+# =======================================================================
+# LegacyEnemy/LegacyPlayer are the dict-backed classes the engine used before the
+# slotted rewrite, trimmed to the methods the cases below call.
+
+class LegacyPlayer:
+    def __init__(self, name, max_hp, ac, movement, initiative, element, temp_hp=0):
+        self.name = name
+        self.max_hp = max_hp
+        self.current_hp = max_hp
+        self.temp_hp = temp_hp
+        self.ac = ac
+        self.movement = movement
+        self.initiative = initiative
+        self.element = element
+        self.type = 'Player'
+        self.version = 0
+        self.actions_taken = 0
+        self.total_damage_dealt = 0
+        self.total_damage_taken = 0
+
+class LegacyEnemy:
+    def __init__(self, name, max_hp, defense=0, elements_applied=[], is_frozen=False, is_petrified=False, initiative=0):
+        self.name = name
+        self.max_hp = max_hp
+        self.current_hp = max_hp
+        self.elements = elements_applied.copy()
+        self.swirled_elements = []
+        self.defense = defense
+        self.damage_log = []
+        self.debuffs = {}
+        self.is_frozen = is_frozen
+        self.is_petrified = is_petrified
+        self.marked = False
+        self.shield = None
+        self.rect = None
+        self.initiative = initiative
+        self.type = 'Enemy'
+        self.version = 0
+        self.actions_taken = 0
+        self.total_damage_dealt = 0
+        self.total_damage_taken = 0
+
+    def apply_element(self, element):
+        if element not in self.elements:
+            self.elements.append(element)
+            self.version += 1
+            return f"{element} applied to {self.name}."
+        else:
+            return f"{self.name} already has {element} applied."
+
+    def mitigate_damage(self, base_damage, multiplier=1.0, attack_element=None, defense_halved=False):
+        defense = self.defense
+        if defense_halved or "Superconduct" in self.debuffs:
+            defense *= 0.5
+        damage = (base_damage * multiplier) - defense
+        if self.shield:
+            if self.shield['type'] == 'Damage Reduction':
+                damage *= (1 - self.shield.get('reduction', 0))
+            elif self.shield['type'] == 'Elemental Immunity':
+                if attack_element == self.shield.get('element'):
+                    return None
+        return max(damage, 0)
+
+    def calculate_damage(self, base_damage, multiplier=1.0, attack_element=None):
+        damage = self.mitigate_damage(base_damage, multiplier, attack_element)
+        if damage is None:
+            return f"{self.name} is immune to {attack_element} damage!"
+        self.current_hp -= damage
+        self.version += 1
+        self.damage_log.append(damage)
+        self.total_damage_taken += damage
+        return f"{self.name} takes {damage:.2f} damage! Remaining HP: {self.current_hp:.2f}"
+
+    def reset_elements(self):
+        self.elements = []
+        self.swirled_elements = []
+        self.version += 1
+
+    def apply_debuff(self, debuff_name, duration):
+        self.debuffs[debuff_name] = duration
+        self.version += 1
+        return f"{self.name} is affected by {debuff_name} for {duration} turn(s)."
+
+    def update_debuffs(self):
+        to_remove = []
+        if self.debuffs:
+            self.version += 1
+        for debuff in list(self.debuffs.keys()):
+            if isinstance(self.debuffs[debuff], dict):
+                self.debuffs[debuff]['duration'] -= 1
+                if self.debuffs[debuff]['duration'] <= 0:
+                    to_remove.append(debuff)
+            else:
+                self.debuffs[debuff] -= 1
+                if self.debuffs[debuff] <= 0:
+                    to_remove.append(debuff)
+                    if debuff == "Freeze":
+                        self.is_frozen = False
+                    if debuff == "Petrify":
+                        self.is_petrified = False
+        for debuff in to_remove:
+            del self.debuffs[debuff]
+        return []
+
+    def update_shield(self):
+        if self.shield:
+            self.version += 1
+            self.shield['duration'] -= 1
+            if self.shield['duration'] <= 0:
+                self.shield = None
+        return []
+
+    def apply_dot(self, percentage, duration, dot_name):
+        self.debuffs[dot_name] = {'duration': duration, 'percentage': percentage}
+        self.version += 1
+        return f"{dot_name} will deal {self.max_hp * (percentage / 100):.2f} damage per turn for {duration} turns."
+
+    def process_dot(self):
+        total_dot_damage = 0
+        messages = []
+        for debuff in list(self.debuffs.keys()):
+            debuff_info = self.debuffs[debuff]
+            if isinstance(debuff_info, dict) and 'percentage' in debuff_info:
+                dot_damage = self.max_hp * (debuff_info['percentage'] / 100)
+                self.current_hp -= dot_damage
+                total_dot_damage += dot_damage
+                self.total_damage_taken += dot_damage
+        if total_dot_damage > 0:
+            self.version += 1
+            messages.append(f"{self.name} takes {total_dot_damage:.2f} DoT damage! Remaining HP: {self.current_hp:.2f}")
+        return messages
+
+    def process_turn(self):
+        messages = []
+        messages.extend(self.process_dot())
+        messages.extend(self.update_debuffs())
+        messages.extend(self.update_shield())
+        if "Toxic Spores" in self.debuffs and self.debuffs["Toxic Spores"] == 0:
+            messages.append(self.calculate_damage(self.max_hp * 0.05))
+            del self.debuffs["Toxic Spores"]
+        return messages
+
+def legacy_swirl(target_enemy, enemies):
+    for elem in [elem for elem in target_enemy.elements if elem != 'Anemo']:
+        for enemy in enemies:
+            if elem not in enemy.swirled_elements:
+                enemy.swirled_elements.append(elem)
+                enemy.version += 1
+
+def legacy_reaction(enemy, element):
+    return reaction_table[element_mask(enemy.elements) | element_mask(enemy.swirled_elements) | element_bits[element]]
+
+def slotted_swirl(target_enemy, enemies):
+    to_swirl = target_enemy.element_mask & ~element_bits['Anemo']
+    for enemy in enemies:
+        if to_swirl & ~enemy.swirled_mask:
+            enemy.swirled_mask |= to_swirl
+            enemy.version += 1
+
+def slotted_reaction(enemy, element):
+    return reaction_table[enemy.element_mask | enemy.swirled_mask | element_bits[element]]
+
+
+# =======================================================================
+#                                 Cases
+# =======================================================================
+
+def mid_fight_enemy(enemy_class, index, legacy):
+    # what a fighting enemy usually carries: two elements, a debuff, a DoT and a shield
+    enemy = enemy_class(f"Enemy {index}", 100, defense=5, elements_applied=['Pyro', 'Anemo'], initiative=index % 20)
+    enemy.apply_debuff("Disadvantage", 2)
+    enemy.apply_dot(3, 3, "Burning")
+    if legacy:
+        enemy.shield = {'type': 'Damage Reduction', 'duration': 2, 'reduction': 0.3}
+    else:
+        enemy.apply_shield('Damage Reduction', 2, reduction=0.3)
+    return enemy
+
+def bytes_per_instance(build, count):
+    tracemalloc.start()
+    before = tracemalloc.take_snapshot()
+    objects = [build(index) for index in range(count)]
+    after = tracemalloc.take_snapshot()
+    tracemalloc.stop()
+    total = sum(stat.size_diff for stat in after.compare_to(before, 'filename'))
+    del objects
+    # the list holding them is not part of the combatants
+    return (total - 8 * count) / count
+
+def throughput(legacy_run, slotted_run, count, repeat=9):
+    # operations per second of each, best of `repeat`; the two alternate so that
+    # machine noise hits both the same way
+    best = [None, None]
+    for _ in range(repeat):
+        for side, run in enumerate((legacy_run, slotted_run)):
+            start = time.perf_counter()
+            run(count)
+            elapsed = time.perf_counter() - start
+            best[side] = elapsed if best[side] is None else min(best[side], elapsed)
+    return count / best[0], count / best[1]
+
+def case_apply_element(enemy_class):
+    enemy = enemy_class("Target", 100)
+    def run(count):
+        for _ in range(count // 3):
+            enemy.apply_element('Pyro')
+            enemy.apply_element('Cryo')
+            enemy.apply_element('Pyro')
+            enemy.reset_elements()
+    return run
+
+def case_calculate_damage(enemy_class, legacy):
+    enemies = [mid_fight_enemy(enemy_class, index, legacy) for index in range(100)]
+    def run(count):
+        for index in range(count):
+            enemy = enemies[index % 100]
+            enemy.current_hp = 100
+            if legacy:
+                enemy.damage_log.clear()
+            enemy.calculate_damage(12, 1.5, attack_element='Pyro')
+    return run
+
+def effect_tick(enemy_class, enemies):
+    # the end-of-attack tick: process_turn on every enemy before, one scheduler tick now
+    if enemy_class is LegacyEnemy:
+        def tick():
+            for enemy in enemies:
+                enemy.process_turn()
+    else:
+        effects = EffectScheduler()
+        for enemy in enemies:
+            effects.adopt(enemy)
+        def tick():
+            for enemy, expired in effects.advance().items():
+                enemy.tick_effects(expired)
+    return tick
+
+def case_effect_tick(enemy_class, size, affected):
+    # `size` enemies, `affected` of them with two DoTs and a debuff running; counts enemy-ticks
+    enemies = [enemy_class(f"Enemy {index}", 100) for index in range(size)]
+    tick = effect_tick(enemy_class, enemies)
+    def run(count):
+        for start in range(0, count, size):
+            for enemy in enemies[:affected]:
+                enemy.current_hp = 100
+                enemy.apply_dot(3, 3, "Burning")
+                enemy.apply_dot(5, 2, "Corrosion")
+                enemy.apply_debuff("Superconduct", 1)
+            tick()
+    return run
+
+def case_swirl(enemy_class, swirl):
+    enemies = [enemy_class(f"Enemy {index}", 100) for index in range(10)]
+    target = enemy_class("Target", 100, elements_applied=['Pyro', 'Cryo', 'Anemo'])
+    def run(count):
+        for _ in range(count):
+            swirl(target, enemies)
+            for enemy in enemies:
+                enemy.reset_elements()
+    return run
+
+def case_reaction(enemy_class, lookup):
+    enemy = enemy_class("Target", 100, elements_applied=['Hydro', 'Anemo'])
+    def run(count):
+        for _ in range(count // 4):
+            lookup(enemy, 'Pyro')
+            lookup(enemy, 'Electro')
+            lookup(enemy, 'Dendro')
+            lookup(enemy, 'Geo')
+    return run
+
+
+def compare(count=100000, instances=100000):
+    # (case, unit, legacy, slotted) rows
+    rows = [
+        ("Enemy memory", "bytes", bytes_per_instance(lambda index: mid_fight_enemy(LegacyEnemy, index, True), instances),
+         bytes_per_instance(lambda index: mid_fight_enemy(Enemy, index, False), instances)),
+        ("Player memory", "bytes", bytes_per_instance(lambda index: LegacyPlayer(f"P{index}", 50, 12, 30, 5, 'Pyro'), instances),
+         bytes_per_instance(lambda index: Player(f"P{index}", 50, 12, 30, 5, 'Pyro'), instances)),
+        ("apply_element", "ops/s",
+         *throughput(case_apply_element(LegacyEnemy), case_apply_element(Enemy), count)),
+        ("calculate_damage", "ops/s",
+         *throughput(case_calculate_damage(LegacyEnemy, True), case_calculate_damage(Enemy, False), count)),
+        ("effect tick, all DoTs", "ops/s",
+         *throughput(case_effect_tick(LegacyEnemy, 100, 100), case_effect_tick(Enemy, 100, 100), count)),
+        ("effect tick, 1% DoTs", "ops/s",
+         *throughput(case_effect_tick(LegacyEnemy, 1000, 10), case_effect_tick(Enemy, 1000, 10), count)),
+        ("Swirl over 10 enemies", "ops/s",
+         *throughput(case_swirl(LegacyEnemy, legacy_swirl), case_swirl(Enemy, slotted_swirl), count // 10)),
+        ("reaction lookup", "ops/s",
+         *throughput(case_reaction(LegacyEnemy, legacy_reaction), case_reaction(Enemy, slotted_reaction), count)),
+    ]
+    return rows
+
+def format_report(rows):
+    lines = [f"{'case':<24}{'unit':>7}{'dict-backed':>14}{'slotted':>14}{'ratio':>8}"]
+    for case, unit, legacy, slotted in rows:
+        lines.append(f"{case:<24}{unit:>7}{legacy:>14,.0f}{slotted:>14,.0f}{slotted / legacy:>7.2f}x")
+    return '\n'.join(lines)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Memory and hot-path throughput of the combatant classes "
+                                                 "against the old dict-backed ones.")
+    parser.add_argument('-n', '--operations', type=int, default=100000, help="operations per throughput case")
+    parser.add_argument('--instances', type=int, default=100000, help="combatants built for the memory cases")
+    args = parser.parse_args(argv)
+    print(format_report(compare(args.operations, args.instances)))
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,395 @@
+import argparse
+import itertools
+import json
+import os
+import platform
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from engine import Enemy, Encounter, Player, elements, reaction_table, element_mask
+from montecarlo import run_fight
+
+
+# =======================================================================
+#           Combat hot paths: timings saved as JSON for comparing runs
+# =======================================================================
+# Every case times one operation (a reaction, a turn, a fight, a frame) and keeps the
+# best of `repeat` runs, as seconds per operation. Setup (building encounters, the
+# first card render) happens outside the timed loop. Runs headless: rendering goes
+# through SDL's dummy video driver, so it needs pygame but no display.
+#
+#   python benchmarks/hotpaths.py --json before.json
+#   ...change something...
+#   python benchmarks/hotpaths.py --json after.json --compare before.json
+
+GROUPS = ('reactions', 'dots', 'aoe', 'encounter', 'batch', 'draw')
+
+# enemies that never die during a case, so every operation does the same work
+TOUGH = 10 ** 9
+
+
+def best_of(run, repeat):
+    # run() -> (seconds, operations); the best seconds per operation of `repeat` runs
+    best = None
+    for _ in range(repeat):
+        seconds, operations = run()
+        per_op = seconds / operations
+        if best is None or per_op < best:
+            best = per_op
+    return best
+
+def reaction_name(applied, attack):
+    reaction = reaction_table[element_mask(applied) | element_mask([attack])]
+    return reaction.name if reaction else 'none'
+
+
+# -------------------------------------------------------------- reactions
+
+def time_reaction(applied, attack, operations):
+    # one attack of `attack` on an enemy carrying `applied`: the element goes on, the
+    # reaction resolves and the end-of-attack tick runs, like Encounter.attack minus
+    # the turn advance. The elements are put back before every attack.
+    def run():
+        player = Player("Bench", TOUGH, 10, 30, 20, attack)
+        enemy = Enemy("Target", TOUGH, defense=2)
+        encounter = Encounter([player], [enemy], history=0)
+        events = encounter.events
+        start = time.perf_counter()
+        for _ in range(operations):
+            enemy.elements = applied
+            events.append(enemy.apply_element(attack))
+            encounter.calculate_elemental_reaction(player, enemy, 10.0)
+            events.clear()
+        return time.perf_counter() - start, operations
+    return run
+
+def reaction_cases(operations, repeat):
+    # every element on its own plus every attacking element (pairs), and every two
+    # different elements plus every attacking element (triples)
+    combinations = [((first,), attack) for first in elements for attack in elements]
+    combinations += [(applied, attack) for applied in itertools.combinations(elements, 2) for attack in elements]
+    for applied, attack in combinations:
+        group = 'pair' if len(applied) == 1 else 'triple'
+        name = f"reaction {'+'.join(applied)} <- {attack}"
+        yield name, {'group': 'reactions', 'kind': group, 'reaction': reaction_name(applied, attack),
+                     'seconds': best_of(time_reaction(applied, attack, operations), repeat)}
+
+
+# -------------------------------------------------------------- DoT-heavy turns
+
+def time_dot_turns(size, turns):
+    # full turns (the attack plus every enemy's turn after it) with each of `size` enemies
+    # carrying two long DoTs, and a short Frostbite put on the next enemy every turn so
+    # the timer wheel keeps expiring entries. The DoTs are tiny so nobody dies.
+    def run():
+        player = Player("Bench", TOUGH, 10, 30, 20, 'Pyro')
+        enemies = [Enemy(f"E{index}", TOUGH, elements_applied=['Pyro'], initiative=10) for index in range(size)]
+        for enemy in enemies:
+            enemy.apply_dot(0.0001, 10 ** 6, 'Burning')
+            enemy.apply_dot(0.0001, 10 ** 6, 'Corrosion')
+        encounter = Encounter([player], enemies, history=0)
+        encounter.start()
+        start = time.perf_counter()
+        for turn in range(turns):
+            enemies[turn % size].apply_dot(0.0001, 3, 'Frostbite')
+            # Pyro on Pyro: no reaction, and 0 damage after defense
+            encounter.attack(player, enemies[0], 0)
+        return time.perf_counter() - start, turns
+    return run
+
+def dot_cases(sizes, turns, repeat):
+    for size in sizes:
+        yield f"dot turn {size} enemies", {'group': 'dots', 'enemies': size,
+                                            'seconds': best_of(time_dot_turns(size, turns), repeat)}
+
+
+# -------------------------------------------------------------- AoE reactions
+
+# reactions that reach every enemy: (elements on the target, attacking element).
+# Sandstorm is missing because Stabilize (Geo alone) always matches before it.
+AOE_CASES = {
+    'Electro-charged': (['Hydro'], 'Electro'),
+    'Thunderstorm': (['Anemo', 'Hydro'], 'Electro'),
+    'Swirl': (['Pyro', 'Anemo'], 'Anemo'),
+}
+
+def time_aoe(applied, attack, size, operations):
+    def run():
+        # 1 max HP keeps Thunderstorm (40% of the caster's max HP) from killing anything
+        player = Player("Bench", 1, 10, 30, 20, attack)
+        enemies = [Enemy(f"E{index}", TOUGH) for index in range(size)]
+        encounter = Encounter([player], enemies, history=0)
+        target = enemies[0]
+        events = encounter.events
+        start = time.perf_counter()
+        for _ in range(operations):
+            target.elements = applied
+            for enemy in enemies[1:3]:
+                # Swirl only touches enemies missing the swirled elements
+                enemy.swirled_mask = 0
+            events.append(target.apply_element(attack))
+            encounter.calculate_elemental_reaction(player, target, 10.0)
+            events.clear()
+        return time.perf_counter() - start, operations
+    return run
+
+def aoe_cases(sizes, operations, repeat):
+    for reaction, (applied, attack) in AOE_CASES.items():
+        for size in sizes:
+            # the same total work per run whatever the size
+            count = max(operations // size, 20)
+            yield f"aoe {reaction} {size} enemies", {'group': 'aoe', 'reaction': reaction, 'enemies': size,
+                                                      'seconds': best_of(time_aoe(applied, attack, size, count), repeat)}
+
+
+# -------------------------------------------------------------- full encounters
+
+def encounter_party():
+    return [Player("Pyro", 60, 14, 30, 15, 'Pyro'), Player("Hydro", 60, 12, 30, 12, 'Hydro'),
+            Player("Electro", 55, 13, 30, 9, 'Electro'), Player("Anemo", 50, 12, 30, 5, 'Anemo')]
+
+def encounter_enemies(size):
+    rng = random.Random(size)
+    return [Enemy(f"E{index}", 60, defense=2, elements_applied=[rng.choice(elements)]) for index in range(size)]
+
+def time_encounters(size, fights):
+    # whole fights as the Monte Carlo runner plays them, same seed every run
+    party = encounter_party()
+    templates = encounter_enemies(size)
+
+    def run():
+        rng = random.Random(0)
+        start = time.perf_counter()
+        for _ in range(fights):
+            run_fight(party, templates, rng)
+        return time.perf_counter() - start, fights
+    return run
+
+def encounter_cases(sizes, fights, repeat):
+    for size in sizes:
+        yield f"encounter {size} enemies", {'group': 'encounter', 'enemies': size,
+                                             'seconds': best_of(time_encounters(size, fights), repeat)}
+
+def time_batch(size, fights):
+    # the same fights played in lockstep by batch.py, one batch of `fights` per run
+    from batch import simulate_batch
+    party = encounter_party()
+    templates = encounter_enemies(size)
+
+    def run():
+        start = time.perf_counter()
+        simulate_batch(party, templates, fights=fights, seed=0)
+        return time.perf_counter() - start, fights
+    return run
+
+def batch_cases(sizes, fights, repeat):
+    for size in sizes:
+        yield f"batch {size} enemies", {'group': 'batch', 'enemies': size,
+                                         'seconds': best_of(time_batch(size, fights), repeat)}
+
+
+# -------------------------------------------------------------- drawing
+
+def load_ui():
+    # importing dndSim only defines the UI; the window and fonts come from init_display
+    os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')
+    import dndSim
+    if dndSim.window is None:
+        dndSim.init_display()
+    return dndSim
+
+def time_draw(ui, size, frames, changed):
+    # draw_enemies_status frames over `size` enemies, cards already rendered once. A full
+    # frame is what an expose or the first frame costs; otherwise one enemy changes per frame.
+    def run():
+        enemies = [Enemy(f"E{index}", TOUGH, elements_applied=['Pyro', 'Hydro']) for index in range(size)]
+        for enemy in enemies[::3]:
+            enemy.apply_debuff('Freeze', 2)
+            enemy.is_frozen = True
+        ui.selected_enemy_index = 0
+        ui.enemy_cards.cards.clear()
+        ui.dirty.invalidate()
+        ui.draw_enemies_status(ui.window, enemies)
+        ui.dirty.full = False
+        ui.dirty.rects.clear()
+        start = time.perf_counter()
+        for frame in range(frames):
+            if changed:
+                enemy = enemies[frame % size]
+                enemy.current_hp -= 1
+                enemy.version += 1
+            else:
+                ui.dirty.full = True
+            ui.draw_enemies_status(ui.window, enemies)
+            ui.dirty.full = False
+            ui.dirty.rects.clear()
+        return time.perf_counter() - start, frames
+    return run
+
+def time_preview(ui, size, frames, changed):
+    # draw_outcome_preview frames with the pointer on a different visible enemy each
+    # frame, after one sweep has filled the memo; `changed` also changes that enemy
+    # first, so every frame works its hit out again
+    def run():
+        enemies = [Enemy(f"E{index}", TOUGH, elements_applied=['Pyro']) for index in range(size)]
+        ui.encounter = Encounter([Player("Cryo", 60, 14, 30, 30, 'Cryo')], enemies, history=0)
+        ui.selected_dice = 8
+        ui.dice_quantity_input = ui.TextInput(10, 0, 180, 32, '3')
+        ui.damage_override_input = ui.TextInput(10, 0, 180, 32, '')
+        ui.hit_previews.clear()
+        ui.dirty.invalidate()
+        ui.draw_enemies_status(ui.window, enemies)
+        pointers = [(x + 5, y + 5) for x, y in map(ui.enemy_view.slot, ui.enemy_view.visible())]
+        for pointer in pointers:
+            ui.draw_outcome_preview(ui.window, pointer)
+        ui.dirty.full = False
+        ui.dirty.rects.clear()
+        start = time.perf_counter()
+        for frame in range(frames):
+            pointer = pointers[frame % len(pointers)]
+            if changed:
+                enemy = enemies[ui.enemy_view.index_at(pointer)]
+                enemy.current_hp -= 1
+                enemy.version += 1
+            ui.draw_outcome_preview(ui.window, pointer)
+            ui.dirty.rects.clear()
+        return time.perf_counter() - start, frames
+    return run
+
+def draw_cases(sizes, frames, repeat):
+    ui = load_ui()
+    for size in sizes:
+        for changed, label in ((False, 'full'), (True, 'one changed')):
+            yield f"draw enemies {size} {label}", {
+                'group': 'draw', 'enemies': size, 'frame': label,
+                'seconds': best_of(time_draw(ui, size, frames, changed), repeat)}
+    for size in sizes:
+        for changed, label in ((False, 'hover'), (True, 'hover, hit changed')):
+            yield f"preview {size} {label}", {
+                'group': 'draw', 'enemies': size, 'frame': label,
+                'seconds': best_of(time_preview(ui, size, frames, changed), repeat)}
+
+
+# =======================================================================
+#                          Running and comparing
+# =======================================================================
+
+def run_suite(groups, operations=2000, turns=500, fights=50, frames=50, repeat=3, batch_fights=50000,
+              aoe_sizes=(10, 100, 1000), dot_sizes=(10, 100), encounter_sizes=(3, 12),
+              draw_sizes=(8, 100, 1000)):
+    suites = {
+        'reactions': lambda: reaction_cases(operations, repeat),
+        'dots': lambda: dot_cases(dot_sizes, turns, repeat),
+        'aoe': lambda: aoe_cases(aoe_sizes, operations * 10, repeat),
+        'encounter': lambda: encounter_cases(encounter_sizes, fights, repeat),
+        'batch': lambda: batch_cases(encounter_sizes, batch_fights, repeat),
+        'draw': lambda: draw_cases(draw_sizes, frames, repeat),
+    }
+    cases = {}
+    for group in groups:
+        for name, case in suites[group]():
+            cases[name] = case
+    return cases
+
+def describe_run(cases, repeat):
+    try:
+        import pygame
+        pygame_version = pygame.version.ver
+    except ImportError:
+        pygame_version = None
+    return {
+        'created': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'python': platform.python_version(),
+        'implementation': platform.python_implementation(),
+        'machine': platform.machine(),
+        'system': platform.platform(),
+        'pygame': pygame_version,
+        'repeat': repeat,
+        'cases': cases,
+    }
+
+def format_time(seconds):
+    if seconds >= 1e-3:
+        return f"{seconds * 1e3:.2f} ms"
+    return f"{seconds * 1e6:.2f} us"
+
+def format_report(cases, verbose=False):
+    lines = []
+    reactions = {name: case for name, case in cases.items() if case['group'] == 'reactions'}
+    if reactions and not verbose:
+        # a couple of hundred combinations: summarized, all of them are in the JSON
+        for kind in ('pair', 'triple'):
+            times = [case['seconds'] for case in reactions.values() if case['kind'] == kind]
+            lines.append(f"{f'reaction {kind}s ({len(times)}), mean':<56}{format_time(sum(times) / len(times)):>12}")
+        for name, case in sorted(reactions.items(), key=lambda item: -item[1]['seconds'])[:5]:
+            lines.append(f"{'  slowest: ' + name + ' (' + case['reaction'] + ')':<56}{format_time(case['seconds']):>12}")
+    for name, case in cases.items():
+        if case['group'] == 'reactions' and not verbose:
+            continue
+        lines.append(f"{name:<56}{format_time(case['seconds']):>12}")
+    for name, case in cases.items():
+        # how many times faster per fight the batch engine is than run_fight
+        engine = cases.get(name.replace('batch', 'encounter', 1))
+        if case['group'] == 'batch' and engine:
+            lines.append(f"{name + ' speedup over encounter':<56}{engine['seconds'] / case['seconds']:>11.1f}x")
+    return '\n'.join(lines)
+
+def compare_runs(old, new, threshold=1.25):
+    # (report lines, regressions) for the cases both runs have; a case regressed when it
+    # got more than `threshold` times slower
+    lines = [f"{'case':<56}{'old':>12}{'new':>12}{'ratio':>8}"]
+    regressions = []
+    for name, case in new['cases'].items():
+        before = old['cases'].get(name)
+        if before is None:
+            continue
+        ratio = case['seconds'] / before['seconds']
+        if ratio > threshold:
+            regressions.append(name)
+        if ratio > threshold or ratio < 1 / threshold:
+            lines.append(f"{name:<56}{format_time(before['seconds']):>12}{format_time(case['seconds']):>12}"
+                         f"{ratio:>7.2f}x{'  SLOWER' if ratio > threshold else ''}")
+    shared = sum(name in old['cases'] for name in new['cases'])
+    lines.append(f"{shared} cases compared, {len(regressions)} more than {threshold:.2f}x slower")
+    return '\n'.join(lines), regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Time the combat hot paths (reactions, DoT turns, AoE, whole "
+                                                 "fights, batched fights, enemy card drawing, hit previews) headless and save the results as JSON.")
+    parser.add_argument('--only', nargs='+', choices=GROUPS, default=list(GROUPS), help="case groups to run")
+    parser.add_argument('--json', metavar='PATH', help="save the results here")
+    parser.add_argument('--compare', metavar='OLD', help="results of an earlier run to compare against")
+    parser.add_argument('--threshold', type=float, default=1.25,
+                        help="slowdown ratio that counts as a regression (default: 1.25)")
+    parser.add_argument('-n', '--operations', type=int, default=2000, help="reactions per reaction case")
+    parser.add_argument('--turns', type=int, default=500, help="turns per DoT case")
+    parser.add_argument('--fights', type=int, default=50, help="fights per encounter case")
+    parser.add_argument('--batch-fights', type=int, default=50000, help="fights per batch case")
+    parser.add_argument('--frames', type=int, default=50, help="frames per drawing case")
+    parser.add_argument('--repeat', type=int, default=3, help="runs per case, the best one counts")
+    parser.add_argument('-v', '--verbose', action='store_true', help="list every reaction case, not a summary")
+    args = parser.parse_args(argv)
+
+    groups = [group for group in GROUPS if group in args.only]
+    cases = run_suite(groups, args.operations, args.turns, args.fights, args.frames, args.repeat, args.batch_fights)
+    result = describe_run(cases, args.repeat)
+    print(format_report(cases, args.verbose))
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(result, f, indent=1)
+    if args.compare:
+        with open(args.compare) as f:
+            old = json.load(f)
+        report, regressions = compare_runs(old, result, args.threshold)
+        print()
+        print(report)
+        # non-zero exit so a script can stop on a regression
+        return 1 if regressions else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,103 @@
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from engine import Enemy, Player, InitiativeOrder
+
+
+# =======================================================================
+#        Swarm turn order: InitiativeOrder vs the old sorted list
+# =======================================================================
+# LegacyTurnOrder is the list + index bookkeeping Encounter used before, pulled out
+# into the same interface.
+
+class LegacyTurnOrder:
+    def __init__(self, combatants):
+        self.turn_order = sorted(combatants, key=lambda x: x.initiative, reverse=True)
+        self.current_actor_index = 0
+
+    @property
+    def current(self):
+        return self.turn_order[self.current_actor_index]
+
+    def insert(self, combatant):
+        index = len(self.turn_order)
+        for position, other in enumerate(self.turn_order):
+            if other.initiative < combatant.initiative:
+                index = position
+                break
+        self.turn_order.insert(index, combatant)
+        if index <= self.current_actor_index:
+            self.current_actor_index += 1
+
+    def discard(self, combatant):
+        if combatant in self.turn_order:
+            index = self.turn_order.index(combatant)
+            self.turn_order.pop(index)
+            if index <= self.current_actor_index and self.current_actor_index > 0:
+                self.current_actor_index -= 1
+
+    def advance(self):
+        previous = self.current_actor_index
+        self.current_actor_index = (self.current_actor_index + 1) % len(self.turn_order)
+        return self.current_actor_index <= previous
+
+
+def swarm(size, seed=0):
+    rng = random.Random(seed)
+    players = [Player(f"P{index}", 50, 12, 30, rng.randint(1, 20), 'Pyro') for index in range(4)]
+    enemies = [Enemy(f"E{index}", 10, initiative=rng.randint(1, 20)) for index in range(size)]
+    return players, enemies
+
+def run_swarm(order_class, size, turns):
+    # a swarm at steady state: every turn one enemy dies (AoE, a DoT) and one joins,
+    # then the turn advances
+    rng = random.Random(size)
+    players, enemies = swarm(size)
+    order = order_class(players + enemies)
+    alive = list(enemies)
+    newcomers = [Enemy(f"R{index}", 10, initiative=rng.randint(1, 20)) for index in range(turns)]
+    victims = [rng.randrange(size) for _ in range(turns)]
+    start = time.perf_counter()
+    for turn in range(turns):
+        index = victims[turn]
+        order.discard(alive[index])
+        alive[index] = newcomers[turn]
+        order.insert(newcomers[turn])
+        order.advance()
+    return turns / (time.perf_counter() - start)
+
+def compare(sizes, turns=20000, repeat=5):
+    # (size, legacy turns/s, indexed turns/s) rows, best of `repeat`, alternating
+    rows = []
+    for size in sizes:
+        best = [0, 0]
+        for _ in range(repeat):
+            for side, order_class in enumerate((LegacyTurnOrder, InitiativeOrder)):
+                best[side] = max(best[side], run_swarm(order_class, size, turns))
+        rows.append((size, *best))
+    return rows
+
+def format_report(rows):
+    lines = [f"{'enemies':>8}{'list turns/s':>15}{'indexed turns/s':>18}{'ratio':>8}"]
+    for size, legacy, indexed in rows:
+        lines.append(f"{size:>8}{legacy:>15,.0f}{indexed:>18,.0f}{indexed / legacy:>7.2f}x")
+    return '\n'.join(lines)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Turns per second in swarm fights where an enemy dies and a "
+                                                 "reinforcement joins every turn, InitiativeOrder against the old list.")
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10, 100, 1000, 5000], help="enemies in the swarm")
+    parser.add_argument('-n', '--turns', type=int, default=20000, help="turns per run")
+    parser.add_argument('--repeat', type=int, default=5, help="runs per size, the best one counts")
+    args = parser.parse_args(argv)
+    print(format_report(compare(args.sizes, args.turns, args.repeat)))
+
+
+if __name__ == '__main__':
+    sys.exit(main())
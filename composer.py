@@ -0,0 +1,389 @@
+import argparse
+import heapq
+import os
+import random
+import sys
+import time
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+
+from engine import Player, Enemy, Encounter, elements, default_enemies, roll_damage
+from dice import damage_pmf, uses_rolled_damage
+from montecarlo import parse_player, parse_enemy, parse_dice, load_party
+
+
+# =======================================================================
+#        Party element composition search (reaction throughput)
+# =======================================================================
+# Ranks element assignments and turn orders for a party by the damage they deal per round
+# while focusing one target, plus what AoE reactions do to the other enemies. A
+# composition is a cycle of seats, each a player and the element it attacks with. Each
+# seat's attack plays out on the real engine, never on a copy of the rules.
+#
+# The target between two attacks is a small state: applied elements in order, swirled
+# elements, shield and debuffs with their remaining ticks. Enemies never die in the model
+# and their turns change nothing on the target, so one attack is a pure function of
+# (state, element, attacker max HP). Those transitions are memoized, and every
+# composition is a walk over that table. Seats are filled depth first, so compositions
+# sharing a prefix share the target state that prefix leaves behind. Later rounds stop
+# once the state at the start of a round repeats, and the rest of the horizon is that
+# cycle again. Bloom heals are counted in full, as if the target were already hurt.
+
+ALIVE = 1e12  # scratch enemies' HP, so nothing dies halfway through a transition
+FRESH = (0, 0, None, ())  # element order, swirled mask, shield, debuffs
+
+
+def hp_change(events, enemies):
+    # HP the events took off `enemies`, net of heals
+    total = 0.0
+    for kind, _, target, amount, _, _ in events:
+        if kind == 'area damage':
+            # area reactions only ever hit the encounter's enemies
+            total += amount
+        elif target in enemies:
+            if kind == 'damage' or kind == 'dot damage':
+                total += amount
+            elif kind == 'heal':
+                total -= amount
+    return total
+
+
+class RotationModel:
+    def __init__(self, target, others=(), pmf=((1, 1.0),)):
+        self.target = target  # the enemy everyone attacks
+        self.others = list(others)  # only take AoE
+        self.pmf = pmf  # base damage distribution, see dice.damage_pmf
+        self.transitions = {}  # (state, element, max_hp) -> (state, damage, reaction name, DoT ticked)
+
+    def _scratch_target(self, state):
+        order, swirled, shield, debuffs = state
+        template = self.target
+        enemy = Enemy(template.name, template.max_hp, defense=template.defense)
+        enemy.current_hp = ALIVE
+        enemy.element_mask = 0
+        while order:
+            enemy.element_mask |= 1 << ((order & 7) - 1)
+            order >>= 3
+        enemy.element_order = state[0]
+        enemy.swirled_mask = swirled
+        # no clock yet, so remaining ticks are expiry ticks; Encounter adopts them as they are
+        for name, remaining, percentage in debuffs:
+            if percentage:
+                enemy.apply_dot(percentage, remaining, name)
+            else:
+                enemy.apply_debuff(name, remaining)
+        if shield is not None:
+            enemy.apply_shield(shield[0], shield[3], element=shield[1], reduction=shield[2])
+        return enemy
+
+    def _play(self, state, element, max_hp, base_damage):
+        target = self._scratch_target(state)
+        others = [Enemy(other.name, other.max_hp, defense=other.defense) for other in self.others]
+        for other in others:
+            other.current_hp = ALIVE
+        player = Player('seat', max_hp, 0, 0, 0, element)
+        encounter = Encounter([player], [target] + others, history=0)
+        target.apply_element(element)
+        encounter.calculate_elemental_reaction(player, target, base_damage)
+        events = encounter.events
+        now = encounter.effects.now
+        shield = target.shield
+        next_state = (
+            target.element_order,
+            target.swirled_mask,
+            None if shield is None else (shield.type, shield.element, shield.reduction, shield.expires - now),
+            tuple(sorted((name, record.expires - now, record.percentage) for name, record in target.debuffs.items())),
+        )
+        reaction = next((event[5] for event in events if event[0] == 'reaction'), None)
+        dot_ticked = any(event[0] == 'dot damage' and event[2] is target for event in events)
+        return next_state, hp_change(events, [target] + others), reaction, dot_ticked
+
+    def step(self, state, element, max_hp):
+        key = (state, element, max_hp)
+        hit = self.transitions.get(key)
+        if hit is None:
+            pmf = self.pmf
+            next_state, damage, reaction, dot_ticked = self._play(state, element, max_hp, pmf[0][0])
+            if len(pmf) > 1 and uses_rolled_damage(reaction):
+                # the state never depends on the roll, only the damage does
+                damage = pmf[0][1] * damage + sum(probability * self._play(state, element, max_hp, value)[1]
+                                                  for value, probability in pmf[1:])
+            hit = self.transitions[key] = (next_state, damage, reaction.name if reaction else None, dot_ticked)
+        return hit
+
+    def play_round(self, state, seats, totals):
+        # seats: ((element, max_hp), ...); totals: [damage, reactions, DoT ticks]
+        step = self.step
+        for element, max_hp in seats:
+            state, damage, reaction, dot_ticked = step(state, element, max_hp)
+            totals[0] += damage
+            if reaction:
+                totals[1] += 1
+            totals[2] += dot_ticked
+        return state
+
+    def evaluate(self, seats, rounds, opener=None):
+        # (damage, reactions, DoT ticks) over `rounds` rounds from a fresh target;
+        # `opener` is (state, totals) after round 1 when already known
+        seen = {FRESH: 0}
+        played = []  # totals of each round
+        if opener is None:
+            totals = [0.0, 0, 0]
+            state = self.play_round(FRESH, seats, totals)
+        else:
+            state, totals = opener
+        played.append(totals)
+        while len(played) < rounds:
+            if state in seen:
+                # the same round start as before: the rest of the horizon repeats that cycle
+                cycle = played[seen[state]:]
+                full, extra = divmod(rounds - len(played), len(cycle))
+                repeats = cycle * full + cycle[:extra]
+                played.extend(repeats)
+                break
+            seen[state] = len(played)
+            totals = [0.0, 0, 0]
+            state = self.play_round(state, seats, totals)
+            played.append(totals)
+        return tuple(map(sum, zip(*played)))
+
+    def reaction_counts(self, seats, rounds):
+        # which reactions the rotation sets off over the horizon, for the ones worth showing
+        names = Counter()
+        state = FRESH
+        for _ in range(rounds):
+            for element, max_hp in seats:
+                state, _, reaction, _ = self.step(state, element, max_hp)
+                if reaction:
+                    names[reaction] += 1
+        return names
+
+
+# =======================================================================
+#                               Search
+# =======================================================================
+# Players with the same max HP are interchangeable to the rules, so seats hold a max HP
+# rather than a player and the names are handed out in seat order at the end. Turn orders
+# are cycles: seat 0 always holds the first HP class and only the smallest rotation of a
+# cycle among those starting with it is kept. Branches on the first two seats are the
+# parallel jobs; every worker process builds its own transition table.
+
+class Composition:
+    __slots__ = ('seats', 'damage_per_round', 'reaction_uptime', 'dot_uptime', 'reactions')
+
+    def __init__(self, seats, rounds, damage, reactions, dot_ticks):
+        attacks = rounds * len(seats)
+        self.seats = seats  # ((element, max_hp), ...) in turn order
+        self.damage_per_round = damage / rounds
+        self.reaction_uptime = reactions / attacks  # share of attacks that set off a reaction
+        self.dot_uptime = dot_ticks / attacks  # share of attacks with a DoT ticking on the target
+        self.reactions = None  # Counter of reaction names, filled in for the ranked ones
+
+    def rank_key(self):
+        return (self.damage_per_round, self.reaction_uptime, self.dot_uptime)
+
+
+_models = {}  # per process: model key -> RotationModel, reused across jobs
+
+def _model(target, others, pmf):
+    key = ((target.name, target.max_hp, target.defense),
+           tuple((other.name, other.max_hp, other.defense) for other in others), pmf)
+    model = _models.get(key)
+    if model is None:
+        model = _models[key] = RotationModel(target, others, pmf)
+    return model
+
+def _is_canonical(seats, first_class):
+    return all(seats[index:] + seats[:index] >= seats
+               for index in range(1, len(seats)) if seats[index][1] == first_class)
+
+def _search_branch(job):
+    # the best `keep` compositions starting with `prefix`, as (rank key, seats, result)
+    target, others, pmf, classes, prefix, rounds, candidate_elements, keep = job
+    model = _model(target, others, pmf)
+    first_class = classes[0][0]
+    size = sum(count for _, count in classes)
+    best = []  # min-heap of (rank key, tie breaker, Composition)
+    evaluated = 0
+    left = dict(classes)
+    for _, max_hp in prefix:
+        left[max_hp] -= 1
+    opening = [0.0, 0, 0]
+    state = model.play_round(FRESH, prefix, opening)
+
+    def extend(seats, state, totals):
+        nonlocal evaluated
+        if len(seats) == size:
+            if not _is_canonical(seats, first_class):
+                return
+            evaluated += 1
+            result = Composition(seats, rounds, *model.evaluate(seats, rounds, opener=(state, totals)))
+            entry = (result.rank_key(), evaluated, result)
+            if len(best) < keep:
+                heapq.heappush(best, entry)
+            elif entry[0] > best[0][0]:
+                heapq.heapreplace(best, entry)
+            return
+        for max_hp, count in left.items():
+            if not count:
+                continue
+            left[max_hp] -= 1
+            for element in candidate_elements:
+                seat = ((element, max_hp),)
+                branch = totals[:]
+                extend(seats + seat, model.play_round(state, seat, branch), branch)
+            left[max_hp] += 1
+
+    extend(tuple(prefix), state, opening)
+    kept = [entry[2] for entry in best]
+    for composition in kept:
+        composition.reactions = model.reaction_counts(composition.seats, rounds)
+    return kept, evaluated
+
+
+class SearchResult:
+    def __init__(self, ranked, evaluated, seconds):
+        self.ranked = ranked  # best first
+        self.evaluated = evaluated  # compositions scored after pruning rotations
+        self.seconds = seconds
+
+
+def search(players, enemies=None, target=None, dice=(8, 3), damage_override=None, rounds=10, top=10,
+           candidate_elements=elements, workers=None):
+    # target: name of the enemy the party focuses, default the first one
+    if enemies is None:
+        enemies = default_enemies()
+    names = [enemy.name for enemy in enemies]
+    if target is None:
+        target = names[0]
+    elif target not in names:
+        raise ValueError(f"no enemy named {target!r} (have {', '.join(names)})")
+    focus = enemies[names.index(target)]
+    others = [enemy for enemy in enemies if enemy is not focus]
+    pmf = damage_pmf(*dice, damage_override)
+    classes = tuple(sorted(Counter(player.max_hp for player in players).items(), reverse=True))
+    first_class = classes[0][0]
+
+    start = time.perf_counter()
+    prefixes = []
+    for first in candidate_elements:
+        if len(players) == 1:
+            prefixes.append((((first, first_class),)))
+            continue
+        for max_hp, count in classes:
+            if max_hp == first_class and count == 1:
+                continue
+            for second in candidate_elements:
+                prefixes.append(((first, first_class), (second, max_hp)))
+    jobs = [(focus, others, pmf, classes, prefix, rounds, tuple(candidate_elements), top) for prefix in prefixes]
+    workers = workers or os.cpu_count() or 1
+    if workers == 1:
+        results = list(map(_search_branch, jobs))
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            results = list(pool.map(_search_branch, jobs, chunksize=max(1, len(jobs) // (workers * 4))))
+    ranked = [composition for compositions, _ in results for composition in compositions]
+    ranked.sort(key=Composition.rank_key, reverse=True)
+    return SearchResult(ranked[:top], sum(evaluated for _, evaluated in results), time.perf_counter() - start)
+
+
+def seat_players(players, seats):
+    # the players in seat order, each given its seat's element and an initiative for the order
+    pool = {}
+    for player in players:
+        pool.setdefault(player.max_hp, []).append(player)
+    seated = []
+    for index, (element, max_hp) in enumerate(seats):
+        player = pool[max_hp].pop(0)
+        seated.append(Player(player.name, player.max_hp, player.ac, player.movement, 20 - index, element,
+                             player.temp_hp))
+    return seated
+
+
+def play_composition(players, enemies, target, rounds, fights, seed=0, dice=(8, 3), damage_override=None):
+    # mean damage per round of seated players on the real turn loop, focusing `target`
+    # with rolled dice; enemies deal no damage and nobody dies
+    rng = random.Random(seed)
+    total = 0.0
+    for _ in range(fights):
+        party = [Player(p.name, p.max_hp, p.ac, p.movement, p.initiative, p.element) for p in players]
+        foes = [Enemy(enemy.name, enemy.max_hp, defense=enemy.defense, initiative=0) for enemy in enemies]
+        focus = foes[[enemy.name for enemy in enemies].index(target)]
+        encounter = Encounter(party, foes, enemy_damage=0, rng=rng, history=0)
+        encounter.start()
+        for _ in range(rounds * len(party)):
+            for enemy in foes:
+                enemy.current_hp = ALIVE
+            encounter.attack(encounter.current_actor(), focus, roll_damage(*dice, damage_override, rng=rng))
+            total += hp_change(encounter.events, foes)
+    return total / (fights * rounds)
+
+
+# =======================================================================
+#                                  CLI
+# =======================================================================
+
+def format_report(result, players, rounds):
+    lines = [f"{result.evaluated} compositions over {rounds} rounds in {result.seconds:.1f} s"]
+    for rank, composition in enumerate(result.ranked, 1):
+        order = ' -> '.join(f"{player.name} ({player.element})" for player in seat_players(players, composition.seats))
+        common = ', '.join(f"{name} {count / rounds:.1f}" for name, count in composition.reactions.most_common(3))
+        lines.append(f"{rank:>2}. {composition.damage_per_round:7.1f} dmg/round  "
+                     f"reactions {composition.reaction_uptime * 100:3.0f}%  DoT {composition.dot_uptime * 100:3.0f}%  "
+                     f"{order}")
+        if common:
+            lines.append(f"    per round: {common}")
+    return '\n'.join(lines)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Rank party element assignments and turn orders by damage per "
+                                                 "round and reaction uptime.")
+    parser.add_argument('--party', default=None, help="roster saved by the menu (roster.db), or an old players.pkl")
+    parser.add_argument('--player', type=parse_player, action='append',
+                        help="NAME:HP:ELEMENT[:INITIATIVE], the element and initiative are what gets searched")
+    parser.add_argument('--size', type=int, default=4, help="party size when no players are given")
+    parser.add_argument('--hp', type=int, default=60, help="max HP of every player when no players are given")
+    parser.add_argument('--enemy', type=parse_enemy, action='append', help="NAME:HP[:DEFENSE], default is Harin/Sigurd")
+    parser.add_argument('--target', default=None, help="enemy the party focuses (default: the first)")
+    parser.add_argument('--elements', default=None, help="comma separated elements to choose from (default: all)")
+    parser.add_argument('--dice', type=parse_dice, default=(8, 3), help="player damage roll, e.g. 3d8")
+    parser.add_argument('--override', type=float, default=None, help="flat player damage instead of dice")
+    parser.add_argument('--rounds', type=int, default=10, help="rounds each composition is scored over")
+    parser.add_argument('--top', type=int, default=10)
+    parser.add_argument('--workers', type=int, default=None, help="processes (default: all cores)")
+    parser.add_argument('--verify', type=int, default=0, metavar='FIGHTS',
+                        help="play the best composition this many times on the real turn loop")
+    args = parser.parse_args(argv)
+
+    if args.player:
+        players = args.player
+    elif args.party:
+        players = load_party(args.party)
+        if not players:
+            parser.error(f"no party: nobody in {args.party}")
+    else:
+        players = [Player(f"P{index}", args.hp, 0, 0, 10, elements[0]) for index in range(1, args.size + 1)]
+    candidate_elements = elements
+    if args.elements:
+        candidate_elements = [name.strip().capitalize() for name in args.elements.split(',')]
+        unknown = [name for name in candidate_elements if name not in elements]
+        if unknown:
+            parser.error(f"unknown elements: {', '.join(unknown)} (have {', '.join(elements)})")
+    enemies = args.enemy or default_enemies()
+    try:
+        result = search(players, enemies, target=args.target, dice=args.dice, damage_override=args.override,
+                        rounds=args.rounds, top=args.top, candidate_elements=candidate_elements,
+                        workers=args.workers)
+    except ValueError as error:
+        parser.error(str(error))
+    print(format_report(result, players, args.rounds))
+    if args.verify and result.ranked:
+        seated = seat_players(players, result.ranked[0].seats)
+        target = args.target or enemies[0].name
+        played = play_composition(seated, enemies, target, args.rounds, args.verify, dice=args.dice,
+                                  damage_override=args.override)
+        print(f"Turn loop, best composition: {played:.1f} dmg/round over {args.verify} fights")
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,265 @@
+import math
+from bisect import bisect_right
+from functools import lru_cache
+from itertools import accumulate
+
+from engine import predict_reaction, dot_reactions
+
+
+# =======================================================================
+#                 Dice / damage distributions (no sampling)
+# =======================================================================
+# A distribution is a tuple of (value, probability) pairs sorted by value.
+
+# Totals of up to COUNTED_DICE dice are counted exactly in integers (quantity² * sides
+# steps); bigger rolls are convolved with FFTs, exact to double precision, with the
+# totals whose probability is below that precision left out of the distribution
+COUNTED_DICE = 50
+PMF_CACHE = 64  # distributions kept per cache; Action allows up to 0xFFFF dice
+
+@lru_cache(maxsize=PMF_CACHE)
+def dice_pmf(quantity, sides):
+    # distribution of the total of `quantity` d`sides`; no dice at all is a sure 0
+    if quantity < 0 or sides < 1:
+        raise ValueError(f"can't roll {quantity}d{sides}")
+    if quantity > COUNTED_DICE and sides > 1:
+        return _convolved_pmf(quantity, sides)
+    return _counted_pmf(quantity, sides)
+
+def _counted_pmf(quantity, sides):
+    ways = [1]  # ways to roll each total, offset by the number of dice so far
+    for _ in range(quantity):
+        # adding one die is a sliding window sum of width `sides`
+        next_ways = []
+        window = 0
+        for total in range(len(ways) + sides - 1):
+            if total < len(ways):
+                window += ways[total]
+            if total >= sides:
+                window -= ways[total - sides]
+            next_ways.append(window)
+        ways = next_ways
+    outcomes = sides ** quantity
+    return tuple((total + quantity, count / outcomes) for total, count in enumerate(ways))
+
+def _convolved_pmf(quantity, sides):
+    # one die's distribution raised to `quantity` by repeated squaring, each product an
+    # FFT convolution. The FFTs' rounding noise grows to about sqrt(length) * eps times
+    # the largest probability, the totals in the tails below that are dropped
+    import numpy as np  # only big rolls need numpy, the counting above is plain Python
+
+    def convolve(a, b):
+        length = len(a) + len(b) - 1
+        size = 1 << (length - 1).bit_length()
+        return np.fft.irfft(np.fft.rfft(a, size) * np.fft.rfft(b, size), size)[:length]
+
+    result = np.ones(1)
+    power = np.full(sides, 1 / sides)
+    remaining = quantity
+    while remaining:
+        if remaining & 1:
+            result = convolve(result, power)
+        remaining >>= 1
+        if remaining:
+            power = convolve(power, power)
+    kept = np.flatnonzero(result > len(result) ** 0.5 * np.finfo(float).eps * result.max())
+    probabilities = result[kept[0]:kept[-1] + 1].clip(min=0)
+    probabilities /= probabilities.sum()
+    return tuple(zip(range(quantity + int(kept[0]), quantity + int(kept[-1]) + 1), probabilities.tolist()))
+
+def damage_pmf(selected_dice=None, dice_quantity=None, damage_override=None):
+    # same precedence as engine.roll_damage: override, then dice, otherwise 1
+    if damage_override is not None:
+        return ((damage_override, 1.0),)
+    if selected_dice and dice_quantity is not None:
+        return dice_pmf(dice_quantity, selected_dice)
+    return ((1, 1.0),)
+
+# The UI preview has a frame to answer in: past PREVIEW_DICE dice it shows a normal
+# approximation instead of waiting on the exact distribution
+PREVIEW_DICE = 50
+NORMAL_SPAN = 8  # standard deviations either side of the mean an approximation covers
+
+@lru_cache(maxsize=PMF_CACHE)
+def normal_pmf(quantity, sides):
+    # integer totals within NORMAL_SPAN standard deviations of the mean, weighted by the
+    # normal density and renormalized; symmetric, so the mean stays exact
+    if quantity < 0 or sides < 1:
+        raise ValueError(f"can't roll {quantity}d{sides}")
+    if sides == 1:
+        return ((quantity, 1.0),)
+    mean = quantity * (sides + 1) / 2
+    deviation = math.sqrt(quantity * (sides * sides - 1) / 12)
+    low = max(quantity, math.floor(mean - NORMAL_SPAN * deviation))
+    high = min(quantity * sides, math.ceil(mean + NORMAL_SPAN * deviation))
+    weights = [math.exp(-0.5 * ((total - mean) / deviation) ** 2) for total in range(low, high + 1)]
+    scale = 1 / sum(weights)
+    return tuple((total, weight * scale) for total, weight in zip(range(low, high + 1), weights))
+
+def preview_pmf(selected_dice=None, dice_quantity=None, damage_override=None):
+    # damage_pmf, approximated for rolls too big to work out within a frame
+    if damage_override is None and selected_dice and dice_quantity is not None and dice_quantity > PREVIEW_DICE:
+        return normal_pmf(dice_quantity, selected_dice)
+    return damage_pmf(selected_dice, dice_quantity, damage_override)
+
+def expected_value(pmf):
+    return sum(value * probability for value, probability in pmf)
+
+def map_pmf(pmf, function):
+    # distribution of function(value), merging values that land on the same result
+    mapped = {}
+    for value, probability in pmf:
+        result = function(value)
+        mapped[result] = mapped.get(result, 0.0) + probability
+    return tuple(sorted(mapped.items()))
+
+
+@lru_cache(maxsize=PMF_CACHE)
+def damage_sampler(selected_dice=None, dice_quantity=None, damage_override=None):
+    # roll(rng) -> base damage, one rng.random() per roll against the distribution;
+    # engine.roll_damage draws every die, which is most of a simulated attack's cost
+    pmf = damage_pmf(selected_dice, dice_quantity, damage_override)
+    if len(pmf) == 1:
+        value = pmf[0][0]
+        return lambda rng: value
+    values = [value for value, _ in pmf]
+    cumulative = list(accumulate(probability for _, probability in pmf))
+    cumulative[-1] = 1.0
+
+    def roll(rng):
+        return values[bisect_right(cumulative, rng.random())]
+    return roll
+
+GUIDE_BUCKETS = 16  # guide table entries per value of a distribution
+LISTED_OUTCOMES = 1 << 12  # rolls with at most this many sides ** quantity outcomes draw one of them
+
+@lru_cache(maxsize=PMF_CACHE)
+def _outcome_table(selected_dice, dice_quantity):
+    # the total of every equally likely way the dice can land
+    import numpy as np
+    totals = np.zeros(1)
+    for _ in range(dice_quantity):
+        totals = np.add.outer(totals, np.arange(1, selected_dice + 1)).ravel()
+    return totals
+
+@lru_cache(maxsize=PMF_CACHE)
+def _sampler_table(pmf):
+    # values, the cumulative probabilities, and a guide table: the first value whose
+    # cumulative probability passes i / (len(guide) - 1), for every i
+    import numpy as np
+    values = np.array([value for value, _ in pmf], dtype=float)
+    cumulative = np.cumsum([probability for _, probability in pmf])
+    cumulative[-1] = 1.0
+    buckets = GUIDE_BUCKETS * len(values)
+    guide = cumulative.searchsorted(np.arange(buckets + 1) / buckets, side='right').clip(max=len(values) - 1)
+    return values, cumulative, guide
+
+def sample_damage(rng, size, selected_dice=None, dice_quantity=None, damage_override=None):
+    # `size` base damage rolls from a numpy Generator, one uniform draw per roll. A few
+    # dice draw one of their listed outcomes. Otherwise a draw whose guide bucket holds
+    # no step of the distribution is settled by the table, only the few that straddle
+    # one are searched for
+    import numpy as np
+    if (damage_override is None and selected_dice and dice_quantity is not None
+            and selected_dice ** dice_quantity <= LISTED_OUTCOMES):
+        totals = _outcome_table(selected_dice, dice_quantity)
+        # 16-bit draws are the Generator's cheapest and LISTED_OUTCOMES fits them
+        return totals.take(rng.integers(0, len(totals), size, dtype=np.int16))
+    values, cumulative, guide = _sampler_table(damage_pmf(selected_dice, dice_quantity, damage_override))
+    draws = rng.random(size)
+    bucket = (draws * (len(guide) - 1)).astype(np.intp)
+    index = guide.take(bucket)
+    straddling = np.flatnonzero(index != guide.take(bucket + 1))
+    if straddling.size:
+        index[straddling] = cumulative.searchsorted(draws[straddling], side='right').clip(max=len(values) - 1)
+    return values.take(index)
+
+
+# =======================================================================
+#                    What one attack does to one enemy
+# =======================================================================
+
+class HitPrediction:
+    def __init__(self, reaction, damage, dot_damage, hp_before, kill_chance):
+        self.reaction = reaction  # engine.Reaction or None
+        self.damage = damage  # distribution of damage the hit itself deals to the target
+        self.dot_damage = dot_damage  # DoT ticks and Toxic Spores going off on the target at the end of the attack
+        self.hp_before = hp_before  # target HP the hit lands on (after a Bloom heal)
+        self.kill_chance = kill_chance
+
+    def expected_damage(self):
+        return expected_value(self.damage) + self.dot_damage
+
+    def min_damage(self):
+        return self.damage[0][0] + self.dot_damage
+
+    def max_damage(self):
+        return self.damage[-1][0] + self.dot_damage
+
+# reactions whose hit on the target scales with the rolled damage; the rest ignore the roll
+ROLLED_DAMAGE_REACTIONS = ("Melt", "Vaporize", "Superconduct", "Electro-charged")
+
+def uses_rolled_damage(reaction):
+    return reaction is None or reaction.name in ROLLED_DAMAGE_REACTIONS
+
+def hit_damage(target_enemy, attacker, base_damage, reaction):
+    # HP calculate_elemental_reaction would take off the target for one base roll
+    if reaction is None:
+        damage = target_enemy.mitigate_damage(base_damage)
+    elif reaction.name in ("Melt", "Vaporize"):
+        damage = target_enemy.mitigate_damage(base_damage, reaction.multiplier)
+    elif reaction.name == "Superconduct":
+        # the debuff goes on before the damage, so this hit already gets the halved defense
+        damage = target_enemy.mitigate_damage(base_damage, reaction.multiplier, defense_halved=True)
+    elif reaction.name == "Electro-charged":
+        damage = target_enemy.mitigate_damage(base_damage, reaction.multiplier, attack_element=reaction.attack_element)
+    elif reaction.name == "Thunderstorm":
+        damage = target_enemy.mitigate_damage(attacker.max_hp * 0.4, attack_element='Electro')
+    else:
+        damage = 0
+    return damage or 0
+
+def end_of_attack_dot(target_enemy, reaction):
+    # every enemy's DoTs tick once after the attack, including one the reaction just applied
+    percentages = {}
+    for name, debuff in target_enemy.debuffs.items():
+        if debuff.percentage:
+            percentages[name] = debuff.percentage
+    if reaction and reaction.name in dot_reactions:
+        percentages[reaction.name] = dot_reactions[reaction.name][0]
+    return target_enemy.max_hp * sum(percentages.values()) / 100
+
+def end_of_attack_spores(target_enemy, attacker, reaction):
+    # Toxic Spores going off in the tick after this attack, after that tick's expiries
+    spores = target_enemy.debuffs.get("Toxic Spores")
+    if spores is None or target_enemy.remaining(spores) != 1 or (reaction and reaction.name == "Toxic Spores"):
+        return 0
+    # only shields/Superconduct outlasting this tick still count; the ones reactions put
+    # up run out with it, apart from Stabilize
+    shield = target_enemy.shield
+    reduction = shield.reduction if shield and target_enemy.remaining(shield) > 1 else 0
+    if reaction and reaction.name == "Stabilize":
+        reduction = 0.3
+    elif reaction and reaction.name == "Crystallize" and (attacker.element != 'Geo' or target_enemy.newest_element(excluding='Geo')):
+        reduction = 0
+    superconduct = target_enemy.debuffs.get("Superconduct")
+    defense_halved = (superconduct is not None and target_enemy.remaining(superconduct) > 1
+                      and not (reaction and reaction.name == "Superconduct"))
+    damage = target_enemy.max_hp * 0.05 - target_enemy.defense * (0.5 if defense_halved else 1)
+    return max(damage * (1 - reduction), 0)
+
+def predict_hit(target_enemy, attacker, selected_dice=None, dice_quantity=None, damage_override=None,
+                approximate=False):
+    # `approximate` is for the UI preview, see preview_pmf
+    reaction = predict_reaction(target_enemy, attacker.element)
+    base = (preview_pmf if approximate else damage_pmf)(selected_dice, dice_quantity, damage_override)
+    damage = map_pmf(base, lambda value: hit_damage(target_enemy, attacker, value, reaction))
+    dot_damage = end_of_attack_dot(target_enemy, reaction) + end_of_attack_spores(target_enemy, attacker, reaction)
+    hp = target_enemy.current_hp
+    if reaction and reaction.name == "Bloom":
+        hp = min(target_enemy.max_hp, hp + target_enemy.max_hp * 0.25)
+    kill_chance = sum(probability for value, probability in damage if hp - value - dot_damage <= 0)
+    return HitPrediction(reaction, damage, dot_damage, hp, kill_chance)
+
+def kill_chance(target_enemy, attacker, selected_dice=None, dice_quantity=None, damage_override=None):
+    return predict_hit(target_enemy, attacker, selected_dice, dice_quantity, damage_override).kill_chance
@@ -1,17 +1,35 @@
-import pygame
 import sys
-import pickle
+import time
+
+# `--profile-startup` prints how long every import and setup step took on the way to the
+# menu; the timer has to start before the imports it measures
+if '--profile-startup' in sys.argv:
+    startup_ns = time.perf_counter_ns()
+    from profiling import StartupTimer
+    startup = StartupTimer(startup_ns)
+    startup.watch_imports()
+else:
+    startup = None
+
+import pygame
 import os
 import random
-import matplotlib.pyplot as plt
 
-# Initialize Pygame
-pygame.init()
+from engine import elements, Player, Enemy, default_enemies, format_event
+from render import TextCache, CardCache, DirtyRegions, VirtualGrid
+from roster import Roster
+from replay import Action, Fight, JournalWriter, Replay, fight_rng, check_seed, SEED_MAX
+from undo import UndoHistory, UNDO_DEPTH
+from tactics import parse_policy
+from dice import predict_hit
+from profiling import FrameTimer, Capture
+from analytics import analyze_journal
+
+if startup:
+    startup.step('imports')
 
 
 WIDTH, HEIGHT = 1300, 900
-window = pygame.display.set_mode((WIDTH, HEIGHT))
-pygame.display.set_caption("Elemental Combat System")
 
 # Colors
 WHITE = (255, 255, 255)
@@ -21,184 +39,128 @@ LIGHT_GRAY = (211, 211, 211)
 RED = (255, 0, 0)
 GREEN = (0, 255, 0)
 BLUE = (0, 0, 255)
-font = pygame.font.SysFont(None, 24)
-large_font = pygame.font.SysFont(None, 28)
-
-
-# =======================================================================
-#              Gameplay / Damge calculations and Reactions
-# =======================================================================
-
-elements = ["Pyro", "Cryo", "Hydro", "Electro", "Dendro", "Geo", "Anemo"]
-
-
-reactions = [
-    # Reactions are defined by the elements required (x,y, sometimes z)
-    # triple-element reactions (more specific reactions first)
-    (frozenset(["Anemo", "Hydro", "Electro"]), ("Thunderstorm", 1.0, "Strikes all targets with lightning, dealing 40% of caster's max HP.", ['ALL'], "Electro")),
-    (frozenset(["Dendro", "Hydro", "Cryo"]), ("Toxic Spores", 1.0, "3 Spores will emerge; after 3 turns, target takes 5% of Max HP as damage.", ['ALL'], None)),
-    # double-element reactions
-    (frozenset(["Pyro", "Cryo"]), ("Melt", 1.5, "Removes ALL applied elements.", ['ALL'], None)),
-    (frozenset(["Hydro", "Pyro"]), ("Vaporize", 1.5, "Removes ALL applied elements.", ['ALL'], None)),
-    (frozenset(["Cryo", "Hydro"]), ("Freeze", 0, "Freezes target for 1 turn.", [], None)),
-    (frozenset(["Electro", "Cryo"]), ("Superconduct", 1.0, "Reduces target defense by 50% for 1 turn. Removes ALL applied elements.", ['ALL'], None)),
-    (frozenset(["Electro", "Hydro"]), ("Electro-charged", 1.0, "Applies damage to ALL targets.", [], "Electro")),
-    # swirl reactions
-    (frozenset(["Anemo", "Pyro"]), ("Swirl", 1.0, "Applies Swirled Pyro to all targets. Removes Anemo element.", ['Anemo'], None)),
-    (frozenset(["Anemo", "Cryo"]), ("Swirl", 1.0, "Applies Swirled Cryo to all targets. Removes Anemo element.", ['Anemo'], None)),
-    (frozenset(["Anemo", "Hydro"]), ("Swirl", 1.0, "Applies Swirled Hydro to all targets. Removes Anemo element.", ['Anemo'], None)),
-    (frozenset(["Anemo", "Electro"]), ("Swirl", 1.0, "Applies Swirled Electro to all targets. Removes Anemo element.", ['Anemo'], None)),
-    # Other reactions
-    (frozenset(["Geo", "Pyro"]), ("Crystallize", 1.0, "Creates a shield granting immunity to Pyro for 1 turn. Removes ALL elements.", ['ALL'], None)),
-    (frozenset(["Geo", "Cryo"]), ("Crystallize", 1.0, "Creates a shield granting immunity to Cryo for 1 turn. Removes ALL elements.", ['ALL'], None)),
-    (frozenset(["Geo", "Hydro"]), ("Crystallize", 1.0, "Creates a shield granting immunity to Hydro for 1 turn. Removes ALL elements.", ['ALL'], None)),
-    (frozenset(["Geo", "Electro"]), ("Crystallize", 1.0, "Creates a shield granting immunity to Electro for 1 turn. Removes ALL elements.", ['ALL'], None)),
-    (frozenset(["Geo", "Geo"]), ("Stabilize", 1.0, "Creates a shield reducing incoming damage by 30% for 2 turns. Removes Geo elements.", ['Geo'], None)),
-    (frozenset(["Hydro", "Geo"]), ("Petrify", 0, "Petrifies target for 1 turn.", ['Geo'], None)),
-    (frozenset(["Electro", "Pyro"]), ("Overload", 1.0, "Disarms target for 1 turn. Removes ALL elements.", ['ALL'], None)),
-    (frozenset(["Dendro", "Hydro"]), ("Bloom", 0, "Heals target by 25% of max health.", ['ALL'], None)),
-    (frozenset(["Dendro", "Pyro"]), ("Burning", 1.0, "Applies 3% max HP DoT for 3 rounds.", ['ALL'], None)),
-    (frozenset(["Dendro", "Anemo"]), ("Healing Winds", 0, "Heals all party members by 20% max HP over 3 rounds.", ['ALL'], None)),
-    (frozenset(["Electro", "Dendro"]), ("Corrosion", 1.0, "Applies DoT equal to 5% max HP for 2 turns.", ['ALL'], None)),
-    (frozenset(["Anemo", "Geo"]), ("Sandstorm", 1.0, "Targets roll at disadvantage for 1 turn. Removes ALL applied elements.", ['ALL'], None)),
-    (frozenset(["Cryo", "Dendro"]), ("Frostbite", 1.0, "Applies DoT equal to 3% max HP for 3 turns and reduces movement speed by 50%.", ['ALL'], None)),
-]
-
-# Player class
-class Player:
-    def __init__(self, name, max_hp, ac, movement, initiative, element, temp_hp=0):
-        self.name = name
-        self.max_hp = max_hp
-        self.current_hp = max_hp
-        self.temp_hp = temp_hp
-        self.ac = ac
-        self.movement = movement
-        self.initiative = initiative
-        self.element = element
-        self.type = 'Player'  
-        self.actions_taken = 0
-        self.total_damage_dealt = 0
-        self.total_damage_taken = 0
-
-# Enemy class
-class Enemy:
-    def __init__(self, name, max_hp, defense=0, elements_applied=[], is_frozen=False, is_petrified=False, initiative=0):
-        self.name = name
-        self.max_hp = max_hp
-        self.current_hp = max_hp
-        self.elements = elements_applied.copy()  # Elements directly applied
-        self.swirled_elements = []  # Elements via Swirl
-        self.defense = defense
-        self.damage_log = []
-        self.debuffs = {} 
-        self.is_frozen = is_frozen
-        self.is_petrified = is_petrified
-        self.marked = False
-        self.shield = None
-        self.rect = None  # For enemy selection
-        self.initiative = initiative
-        self.type = 'Enemy'
-        self.actions_taken = 0
-        self.total_damage_dealt = 0
-        self.total_damage_taken = 0
-
-    def apply_element(self, element):
-        if element not in self.elements:
-            self.elements.append(element)
-            return f"{element} applied to {self.name}."
-        else:
-            return f"{self.name} already has {element} applied."
-
-    def calculate_damage(self, base_damage, multiplier=1.0, attack_element=None):
-        # Apply defense reduction from debuffs IT KEEPS GIVING ENEMIES THE SHIELDS
-        defense = self.defense
-        if "Superconduct" in self.debuffs:
-            defense *= 0.5
-        damage = (base_damage * multiplier) - defense
-        if self.shield:
-            if self.shield['type'] == 'Damage Reduction':
-                damage *= (1 - self.shield.get('reduction', 0))
-            elif self.shield['type'] == 'Elemental Immunity':
-                if attack_element == self.shield.get('element'):
-                    return f"{self.name} is immune to {attack_element} damage!"
-        damage = max(damage, 0)  # Prevent negative damage
-        self.current_hp -= damage
-        self.damage_log.append(damage)
-        self.total_damage_taken += damage
-        return f"{self.name} takes {damage:.2f} damage! Remaining HP: {self.current_hp:.2f}"
-
-    def reset_elements(self):
-        self.elements = []
-        self.swirled_elements = []
-
-    def apply_debuff(self, debuff_name, duration):
-        self.debuffs[debuff_name] = duration
-        return f"{self.name} is affected by {debuff_name} for {duration} turn(s)."
-
-    def update_debuffs(self):
-        to_remove = []
-        messages = []
-        for debuff in list(self.debuffs.keys()):
-            if isinstance(self.debuffs[debuff], dict):
-                # For DoT debuffs
-                self.debuffs[debuff]['duration'] -= 1
-                if self.debuffs[debuff]['duration'] <= 0:
-                    to_remove.append(debuff)
-            else:
-                self.debuffs[debuff] -= 1
-                if self.debuffs[debuff] <= 0:
-                    to_remove.append(debuff)
-                    if debuff == "Freeze":
-                        self.is_frozen = False
-                    if debuff == "Petrify":
-                        self.is_petrified = False
-        for debuff in to_remove:
-            del self.debuffs[debuff]
-        return messages
-
-    def update_shield(self):
-        messages = []
-        if self.shield:
-            self.shield['duration'] -= 1
-            if self.shield['duration'] <= 0:
-                self.shield = None
-        return messages
-
-    def apply_dot(self, percentage, duration, dot_name):
-        self.debuffs[dot_name] = {'duration': duration, 'percentage': percentage}
-        return f"{dot_name} will deal {self.max_hp * (percentage / 100):.2f} damage per turn for {duration} turns."
-
-    def process_dot(self):
-        total_dot_damage = 0
-        messages = []
-        for debuff in list(self.debuffs.keys()):
-            debuff_info = self.debuffs[debuff]
-            if isinstance(debuff_info, dict) and 'percentage' in debuff_info:
-                dot_damage = self.max_hp * (debuff_info['percentage'] / 100)
-                self.current_hp -= dot_damage
-                total_dot_damage += dot_damage
-                self.total_damage_taken += dot_damage
-        if total_dot_damage > 0:
-            messages.append(f"{self.name} takes {total_dot_damage:.2f} DoT damage! Remaining HP: {self.current_hp:.2f}")
-        return messages
-
-    def apply_heal(self, percentage):
-        heal_amount = self.max_hp * (percentage / 100)
-        self.current_hp = min(self.max_hp, self.current_hp + heal_amount)
-        return f"{self.name} heals for {heal_amount:.2f} HP! Current HP: {self.current_hp:.2f}"
-
-    def process_turn(self):
-        messages = []
-        messages.extend(self.process_dot())
-        messages.extend(self.update_debuffs())
-        messages.extend(self.update_shield())
-        if "Toxic Spores" in self.debuffs and self.debuffs["Toxic Spores"] == 0:
-            damage = self.max_hp * 0.05
-            damage_message = self.calculate_damage(damage)
-            messages.append(damage_message)
-            messages.append("Toxic Spores exploded!")
-            del self.debuffs["Toxic Spores"]
-        return messages
+
+# The window and fonts belong to the UI entry point, not to importing this module (the
+# benchmarks import it for the drawing functions). Only the pygame modules the UI uses
+# are started: pygame.init() would also open the audio device and joysticks.
+window = None
+font = large_font = small_font = None
+
+def init_display():
+    global window, font, large_font, small_font
+    pygame.display.init()
+    window = pygame.display.set_mode((WIDTH, HEIGHT))
+    pygame.display.set_caption("Elemental Combat System")
+    if startup:
+        startup.step('display')
+    pygame.font.init()
+    font = pygame.font.SysFont(None, 24)
+    large_font = pygame.font.SysFont(None, 28)
+    small_font = pygame.font.SysFont(None, 20)
+    if startup:
+        startup.step('fonts')
+
+# rendered text is reused across frames, cards are redrawn only when their combatant changes
+text_cache = TextCache()
+enemy_cards = CardCache((220, 240), WHITE)
+player_rows = CardCache((320, 70), WHITE)
+dirty = DirtyRegions()
+player_rows_drawn = 0
+
+# Enemies sit in a scrolling viewport between the dice controls, the player list and the
+# log, and only the cards inside it are drawn. The mouse wheel scrolls it, Ctrl+wheel
+# zooms the cards out and in, and Tab switches to a compact one-line-per-enemy list
+# (where fights with more than LIST_VIEW_AT enemies start)
+ENEMY_VIEWPORT = (210, 90, WIDTH - 540, 585)  # the scroll bar goes just right of it
+CARD_CELL, CARD_PITCH = (200, 240), (220, 340)
+ROW_CELL, ROW_PITCH = (740, 22), (760, 24)
+ZOOM_LEVELS = (1.0, 0.75, 0.5, 0.35)
+LIST_VIEW_AT = 24
+LIST_VIEW_KEY = pygame.K_TAB
+SCROLL_STEP = 60  # pixels per wheel notch
+enemy_view = VirtualGrid(ENEMY_VIEWPORT, CARD_CELL, CARD_PITCH)
+enemy_list_mode = False
+enemy_zoom = 0  # index into ZOOM_LEVELS
+zoomed_cards = {}  # zoom index -> CardCache of scaled-down cards
+enemy_rows = CardCache(ROW_CELL, WHITE)
+
+# above the enemies, what Attack would do to the selected (or hovered) enemy
+hit_previews = {}  # see preview_lines
+PREVIEW_CACHE_SIZE = 1024
+
+def render_text(text, text_font=None, color=BLACK):
+    return text_cache.render(text_font or font, text, color)
+
+def option(name):
+    # value following `name` on the command line, None if absent
+    return sys.argv[sys.argv.index(name) + 1] if name in sys.argv[:-1] else None
+
+# saved characters (see roster.py); `--campaign NAME` picks whose roster the menu shows
+ROSTER_PATH = 'roster.db'
+CAMPAIGN = option('--campaign') or ''
+PAGE_SIZE = 5  # roster rows that fit above the menu buttons
+
+# every fight is seeded and its actions journaled, so it can be replayed exactly:
+# `--seed N` fixes the seed, `--journal PATH` where the journal goes, and
+# `--replay PATH` opens a journal to step through instead of playing
+SEED = option('--seed')
+JOURNAL_PATH = option('--journal')
+REPLAY_PATH = option('--replay')
+# `--minions N` adds N weak enemies to the fight, for trying out large battles
+MINIONS = int(option('--minions') or 0)
+# Ctrl+Z undoes the last attack and Ctrl+Y (or Ctrl+Shift+Z) redoes it; `--undo-depth N`
+# is how many attacks back undo reaches
+UNDO_DEPTH = int(option('--undo-depth') or UNDO_DEPTH)
+# `--enemy-ai SPEC` picks whom enemies attack (see tactics.parse_policy); a lookahead
+# search gets LIVE_AI_MS per enemy turn unless the spec says otherwise
+ENEMY_AI = option('--enemy-ai')
+LIVE_AI_MS = 50
+LIVE_AI_NODES = 20000
+UNDO_KEY = pygame.K_z
+REDO_KEY = pygame.K_y
+
+# F3 shows how long each phase of a frame takes; F9 starts/stops a cProfile +
+# tracemalloc capture of the session, saved under profiles/ (print one with profiling.py)
+OVERLAY_KEY = pygame.K_F3
+CAPTURE_KEY = pygame.K_F9
+# F6 prints this fight's damage/reaction statistics and saves its charts under charts/;
+# `--report` also prints the statistics when a fight ends
+CHARTS_KEY = pygame.K_F6
+REPORT_AT_END = '--report' in sys.argv
+OVERLAY_REFRESH_MS = 500
+frame_timer = FrameTimer()
+capture = Capture('profiles')
+show_overlay = False
+overlay_lines = []
+overlay_refreshed = -OVERLAY_REFRESH_MS
+
+# Loops wait for input instead of redrawing at 30 FPS; nothing changes on screen without
+# input, so an idle table laptop sleeps. `--poll` keeps the old fixed-rate loop.
+POLLING = '--poll' in sys.argv
+ACTIVE_MS = 2000  # right after input, block on the queue itself for instant response
+DOZE_MS = 25  # later, check the queue at this interval (still under the old 33 ms frame)
+last_input_ticks = 0
+
+def next_events(clock, block=True):
+    global last_input_ticks
+    if POLLING:
+        clock.tick(30)
+        return pygame.event.get()
+    if not block:
+        return pygame.event.get()
+    idle_ms = pygame.time.get_ticks() - last_input_ticks
+    if idle_ms < ACTIVE_MS:
+        event = pygame.event.wait(ACTIVE_MS - idle_ms)
+        events = [] if event.type == pygame.NOEVENT else [event] + pygame.event.get()
+    else:
+        # pygame.event.wait wakes up every millisecond internally, which keeps a core
+        # ticking through a whole session; a plain sleep between checks lets it idle
+        pygame.time.wait(DOZE_MS)
+        events = pygame.event.get()
+    if events:
+        last_input_ticks = pygame.time.get_ticks()
+    return events
+
 
 class Button:
     def __init__(self, x, y, w, h, text, callback, image=None):
@@ -214,7 +176,7 @@ class Button:
             surface.blit(self.image, self.rect)
         else:
             pygame.draw.rect(surface, self.color, self.rect)
-            txt_surf = self.font.render(self.text, True, BLACK)
+            txt_surf = text_cache.render(self.font, self.text, BLACK)
             txt_rect = txt_surf.get_rect(center=self.rect.center)
             surface.blit(txt_surf, txt_rect)
 
@@ -256,363 +218,347 @@ class TextInput:
         surface.blit(self.txt_surface, (self.rect.x+5, self.rect.y+5))
         pygame.draw.rect(surface, self.color, self.rect, 2)
 
+    def draw_if_changed(self, surface):
+        # game screen: only touch the screen when the text or focus changed
+        if dirty.changed(('input', id(self)), self.rect, (self.text, self.color)):
+            surface.fill(WHITE, self.rect)
+            surface.set_clip(self.rect)
+            self.draw(surface)
+            surface.set_clip(None)
+
 # Functions
+def dice_settings():
+    # (selected_dice, dice_quantity, damage_override) as the inputs stand; ValueError
+    # while a field holds something that isn't a number
+    damage_override = float(damage_override_input.text) if damage_override_input.text else None
+    dice_quantity = int(dice_quantity_input.text) if dice_quantity_input.text else None
+    return selected_dice, dice_quantity, damage_override
+
 def perform_base_attack():
-    global current_actor_index
-    log_messages.clear()
-    actor = turn_order[current_actor_index]
-    if actor.type != 'Player':
+    global selected_enemy_index
+    actor = encounter.current_actor()
+    if actor is None:
         return
-    player = actor
-    if not enemies:
-        log_messages.append("No enemies to attack.")
-        return
-    target_enemy = enemies[selected_enemy_index]
-    # apply player's element to the enemy
-    message = target_enemy.apply_element(player.element)
-    log_messages.append(message)
-    # calculate base damage
-    base_damage = 0
-    if damage_override_input.text:
-        base_damage = float(damage_override_input.text)
-    elif selected_dice and dice_quantity_input.text:
-        dice_quantity = int(dice_quantity_input.text)
-        for _ in range(dice_quantity):
-            base_damage += random.randint(1, selected_dice)
-    else:
-        base_damage = 1  # default
-    player.actions_taken += 1
-    player.total_damage_dealt += base_damage
-    calculate_elemental_reaction(player, target_enemy, base_damage)
-    check_enemy_defeat(target_enemy)
-    advance_turn()
-
-def calculate_elemental_reaction(player, target_enemy, base_damage):
-    reaction_effects = None
-    applied_elements = set(target_enemy.elements)
-    swirled_elements = set(target_enemy.swirled_elements)
-    total_elements = applied_elements.union(swirled_elements)
-    elements_involved = total_elements.union({player.element})
-    # check reacts (triple-element reactions)
-    for element_combination, effect in reactions:
-        if element_combination.issubset(elements_involved):
-            reaction_effects = effect
-            break
-
-    if reaction_effects:
-        reaction_name, multiplier, effect_desc, elements_to_remove, attack_element = reaction_effects
-        log_messages.append(f"Reaction triggered: {reaction_name}")
-        log_messages.append(f"Effect: {effect_desc}")
-
-        # Handle specific reactions
-        if reaction_name in ["Melt", "Vaporize"]:
-            damage_message = target_enemy.calculate_damage(base_damage, multiplier)
-            log_messages.append(damage_message)
-        elif reaction_name == "Freeze":
-            debuff_message = target_enemy.apply_debuff("Freeze", 1)
-            target_enemy.is_frozen = True
-            log_messages.append(debuff_message)
-        elif reaction_name == "Superconduct":
-            debuff_message = target_enemy.apply_debuff("Superconduct", 1)
-            log_messages.append(debuff_message)
-            damage_message = target_enemy.calculate_damage(base_damage, multiplier)
-            log_messages.append(damage_message)
-        elif reaction_name == "Electro-charged":
-            for enemy in enemies[:]:
-                damage_message = enemy.calculate_damage(base_damage, multiplier, attack_element=attack_element)
-                log_messages.append(damage_message)
-            log_messages.append("Damage applied to all targets.")
-        elif reaction_name == "Swirl":
-            elements_to_swirl = [elem for elem in target_enemy.elements if elem != 'Anemo']
-            for elem in elements_to_swirl:
-                for enemy in enemies:
-                    if elem not in enemy.swirled_elements:
-                        enemy.swirled_elements.append(elem)
-            log_messages.append("Swirl reaction applied.")
-        elif reaction_name == "Crystallize":
-            elements_to_crystallize = [elem for elem in target_enemy.elements if elem != 'Geo']
-            for elem in elements_to_crystallize:
-                target_enemy.shield = {'type': 'Elemental Immunity', 'duration': 1, 'element': elem}
-            log_messages.append(f"{target_enemy.name} gains a shield granting immunity to certain damage.")
-        elif reaction_name == "Stabilize":
-            target_enemy.shield = {'type': 'Damage Reduction', 'duration': 2, 'reduction': 0.3}
-            log_messages.append(f"{target_enemy.name} gains a shield reducing incoming damage.")
-        elif reaction_name == "Petrify":
-            debuff_message = target_enemy.apply_debuff("Petrify", 1)
-            target_enemy.is_petrified = True
-            log_messages.append(debuff_message)
-        elif reaction_name == "Overload":
-            debuff_message = target_enemy.apply_debuff("Disarmed", 1)
-            log_messages.append(debuff_message)
-        elif reaction_name == "Burning":
-            dot_message = target_enemy.apply_dot(3, 3, "Burning")
-            log_messages.append(dot_message)
-        elif reaction_name == "Corrosion":
-            dot_message = target_enemy.apply_dot(5, 2, "Corrosion")
-            log_messages.append(dot_message)
-        elif reaction_name == "Frostbite":
-            dot_message = target_enemy.apply_dot(3, 3, "Frostbite")
-            log_messages.append(dot_message)
-            debuff_message = target_enemy.apply_debuff("Movement Speed Reduction", 3)
-            log_messages.append(debuff_message)
-        elif reaction_name == "Bloom":
-            heal_message = target_enemy.apply_heal(25)
-            log_messages.append(heal_message)
-        elif reaction_name == "Healing Winds":
-            for player in players:
-                heal_message = player_heal(player, 20)
-                log_messages.append(heal_message)
-            log_messages.append("Healing Winds heals all players.")
-        elif reaction_name == "Toxic Spores":
-            target_enemy.debuffs["Toxic Spores"] = 3 # time delay for spores
-            log_messages.append("Toxic Spores applied to target.")
-        elif reaction_name == "Sandstorm":
-            for enemy in enemies:
-                debuff_message = enemy.apply_debuff("Disadvantage", 1)
-                log_messages.append(debuff_message)
-            log_messages.append("Sandstorm affects all enemies.")
-        elif reaction_name == "Thunderstorm":
-            caster_max_hp = player.max_hp
-            for enemy in enemies[:]:
-                damage = caster_max_hp * 0.4
-                damage_message = enemy.calculate_damage(damage, attack_element='Electro')
-                log_messages.append(damage_message)
-            log_messages.append("Thunderstorm strikes all enemies.")
-        else:
-            damage_message = target_enemy.calculate_damage(base_damage, multiplier)
-            log_messages.append(damage_message)
-
-        if elements_to_remove == ['ALL']:
-            target_enemy.reset_elements()
-        else:
-            for elem in elements_to_remove:
-                if elem in target_enemy.elements:
-                    target_enemy.elements.remove(elem)
-                if elem in target_enemy.swirled_elements:
-                    target_enemy.swirled_elements.remove(elem)
-    else:
-        damage_message = target_enemy.calculate_damage(base_damage)
-        log_messages.append(damage_message)
-
-    for enemy in enemies[:]:
-        turn_messages = enemy.process_turn()
-        log_messages.extend(turn_messages)
-        check_enemy_defeat(enemy)
-
-def check_enemy_defeat(enemy):
-    if enemy.current_hp <= 0:
-        if enemy in enemies:
-            enemies.remove(enemy)
-        if enemy in turn_order:
-            index = turn_order.index(enemy)
-            turn_order.pop(index)
-            global current_actor_index
-            if index <= current_actor_index and current_actor_index > 0:
-                current_actor_index -= 1
-        log_messages.append(f"{enemy.name} has been defeated!")
-    if not enemies:
+    try:
+        selected, dice_quantity, damage_override = dice_settings()
+        enemy_damage = float(enemy_damage_input.text) if enemy_damage_input.text else 10
+        action = Action(selected_enemy_index, selected, dice_quantity, damage_override, enemy_damage)
+    except ValueError:
+        return  # not a valid attack yet, the preview says what's wrong
+    frame_timer.lap('events')
+    # journaled first: a session dying mid-action still replays up to and including it
+    journal.write(action)
+    fight.play(action)
+    undo_history.record(action)
+    frame_timer.lap('engine')
+    # the selected card may have been removed
+    selected_enemy_index = min(selected_enemy_index, max(len(encounter.enemies) - 1, 0))
+    if encounter.is_over():
         disable_buttons()
-        log_messages.append("All enemies have been defeated!")
+        if REPORT_AT_END:
+            print(analyze_journal(journal_path).report())
 
 def disable_buttons():
     for button in buttons:
         button.callback = lambda: None
 
-def enemies_turn(enemy):
-    if enemy.is_frozen or enemy.is_petrified:
-        log_messages.append(f"{enemy.name} is unable to act.")
-        return
-    enemy.actions_taken += 1
-    enemy_damage = float(enemy_damage_input.text) if enemy_damage_input.text else 10
-    if not players:
-        return
-    target_player = random.choice(players)
-    target_player.current_hp -= enemy_damage
-    target_player.total_damage_taken += enemy_damage
-    enemy.total_damage_dealt += enemy_damage
-    log_messages.append(f"{enemy.name} attacks {target_player.name} for {enemy_damage} damage.")
-    if target_player.current_hp <= 0:
-        log_messages.append(f"{target_player.name} has been defeated!")
-        players.remove(target_player)
-        if target_player in turn_order:
-            index = turn_order.index(target_player)
-            turn_order.pop(index)
-            global current_actor_index
-            if index <= current_actor_index and current_actor_index > 0:
-                current_actor_index -= 1
-        if not players:
-            log_messages.append("All players have been defeated! Game Over.")
-            disable_buttons()
-
-def player_heal(player, percentage):
-    heal_amount = player.max_hp * (percentage / 100)
-    player.current_hp = min(player.max_hp, player.current_hp + heal_amount)
-    return f"{player.name} heals for {heal_amount:.2f} HP! Current HP: {player.current_hp:.2f}"
-
-def advance_turn():
-    global current_actor_index
-    if not turn_order:
+# Drawing functions (sourced from pygame libraries)
+def draw_enemy_card(card, enemy):
+    # card-local coordinates: content starts at (10, 10), the selection border sits on the edge
+    card.blit(render_text(f"Enemy: {enemy.name}", large_font), (10, 10))
+    hp_bar_length = 180
+    hp_bar_height = 25
+    fill = max((enemy.current_hp / enemy.max_hp) * hp_bar_length, 0)
+    pygame.draw.rect(card, RED, (10, 50, hp_bar_length, hp_bar_height))
+    pygame.draw.rect(card, GREEN, (10, 50, fill, hp_bar_height))
+    card.blit(render_text(f"HP: {enemy.current_hp:.2f}/{enemy.max_hp}"), (10, 80))
+
+    #elements
+    card.blit(render_text(f"Elements: {', '.join(enemy.elements)}"), (10, 110))
+    if enemy.swirled_elements:
+        card.blit(render_text(f"Swirled: {', '.join(enemy.swirled_elements)}"), (10, 140))
+
+    # debuffs
+    if enemy.debuffs:
+        card.blit(render_text(f"Debuffs: {', '.join(enemy.debuffs.keys())}"), (10, 170))
+
+    # status effects
+    status_effects = []
+    if enemy.is_frozen:
+        status_effects.append("Frozen")
+    if enemy.is_petrified:
+        status_effects.append("Petrified")
+    if enemy.shield:
+        status_effects.append(f"Shielded ({enemy.shield.type})")
+
+    if status_effects:
+        card.blit(render_text(f"Status: {', '.join(status_effects)}"), (10, 200))
+
+def draw_enemy_row(row, enemy):
+    # list view: name, HP bar and numbers, elements and whatever else is on the enemy
+    row.blit(render_text(enemy.name, small_font), (6, 4))
+    fill = max((enemy.current_hp / enemy.max_hp) * 100, 0)
+    pygame.draw.rect(row, RED, (150, 5, 100, 12))
+    pygame.draw.rect(row, GREEN, (150, 5, fill, 12))
+    row.blit(render_text(f"{enemy.current_hp:.0f}/{enemy.max_hp}", small_font), (258, 4))
+    effects = enemy.elements + [f"~{name}" for name in enemy.swirled_elements] + list(enemy.debuffs)
+    if enemy.shield:
+        effects.append(f"Shield ({enemy.shield.type})")
+    if effects:
+        row.blit(render_text(', '.join(effects), small_font), (340, 4))
+
+def draw_zoomed_card(card, enemy):
+    surface = enemy_cards.get(enemy, enemy.version, draw_enemy_card)
+    pygame.transform.smoothscale(surface, card.get_size(), card)
+
+def enemy_surface(enemy):
+    if enemy_list_mode:
+        return enemy_rows.get(enemy, enemy.version, draw_enemy_row)
+    if not enemy_zoom:
+        return enemy_cards.get(enemy, enemy.version, draw_enemy_card)
+    cards = zoomed_cards.get(enemy_zoom)
+    if cards is None:
+        zoom = ZOOM_LEVELS[enemy_zoom]
+        cards = zoomed_cards[enemy_zoom] = CardCache((int(CARD_PITCH[0] * zoom), int(CARD_CELL[1] * zoom)), WHITE)
+    return cards.get(enemy, enemy.version, draw_zoomed_card)
+
+def set_enemy_view(list_mode=None, zoom=None):
+    global enemy_list_mode, enemy_zoom
+    if list_mode is not None:
+        enemy_list_mode = list_mode
+    if zoom is not None:
+        enemy_zoom = max(0, min(zoom, len(ZOOM_LEVELS) - 1))
+    if enemy_list_mode:
+        enemy_view.reshape(ROW_CELL, ROW_PITCH)
+    else:
+        scale = ZOOM_LEVELS[enemy_zoom]
+        enemy_view.reshape((int(CARD_CELL[0] * scale), int(CARD_CELL[1] * scale)),
+                           (int(CARD_PITCH[0] * scale), int(CARD_PITCH[1] * scale)))
+
+def scroll_enemy_view(notches, zoom=False):
+    # a mouse wheel turn over the enemies; up is positive
+    if zoom and not enemy_list_mode:
+        set_enemy_view(zoom=enemy_zoom - notches)
+    else:
+        enemy_view.scroll_by(-notches * SCROLL_STEP)
+
+def draw_enemy_scrollbar(surface, view, layout):
+    track = (view.viewport.right + 4, view.viewport.y, 4, view.viewport.h)
+    if not dirty.changed('enemy scrollbar', track, layout):
         return
-    current_actor_index = (current_actor_index + 1) % len(turn_order)
-    if not turn_order:
+    surface.fill(WHITE, track)
+    extra = view.max_scroll()
+    if not extra:
         return
-    while turn_order[current_actor_index].type == 'Enemy':
-        enemy = turn_order[current_actor_index]
-        enemies_turn(enemy)
-        for player in players[:]:
-            if player.current_hp <= 0:
-                players.remove(player)
-                if player in turn_order:
-                    index = turn_order.index(player)
-                    turn_order.pop(index)
-                    if index <= current_actor_index and current_actor_index > 0:
-                        current_actor_index -= 1
-        if not players or not enemies or not turn_order:
-            break
-        current_actor_index = (current_actor_index + 1) % len(turn_order)
-        if current_actor_index >= len(turn_order):
-            current_actor_index = 0
-        if turn_order[current_actor_index].type != 'Enemy':
-            break
+    pygame.draw.rect(surface, LIGHT_GRAY, track)
+    thumb = max(20, view.viewport.h * view.viewport.h // (view.viewport.h + extra))
+    top = view.viewport.y + (view.viewport.h - thumb) * view.scroll // extra
+    pygame.draw.rect(surface, GRAY, (track[0], top, 4, thumb))
 
-# Drawing functions (sourced from pygame libraries)
 def draw_enemies_status(surface, enemies):
-    y_offset = 100
-    x_offset = 220 
-    enemy_width = 200
-    enemy_height = 240
-    spacing = 20
-    max_enemies_per_row = 4
-    for idx, enemy in enumerate(enemies):
-        row = idx // max_enemies_per_row
-        col = idx % max_enemies_per_row
-        enemy_x = x_offset + col * (enemy_width + spacing)
-        enemy_y = y_offset + row * (enemy_height + 100)
-
-        # enemy stuff 
-        name_text = large_font.render(f"Enemy: {enemy.name}", True, BLACK)
-        surface.blit(name_text, (enemy_x, enemy_y))
-        hp_bar_length = 180
-        hp_bar_height = 25
-        fill = max((enemy.current_hp / enemy.max_hp) * hp_bar_length, 0)
-        pygame.draw.rect(surface, RED, (enemy_x, enemy_y + 40, hp_bar_length, hp_bar_height))
-        pygame.draw.rect(surface, GREEN, (enemy_x, enemy_y + 40, fill, hp_bar_height))
-        hp_text = font.render(f"HP: {enemy.current_hp:.2f}/{enemy.max_hp}", True, BLACK)
-        surface.blit(hp_text, (enemy_x, enemy_y + 70))
-
-        #elements
-        elements_text = font.render(f"Elements: {', '.join(enemy.elements)}", True, BLACK)
-        surface.blit(elements_text, (enemy_x, enemy_y + 100))
-        if enemy.swirled_elements:
-            swirled_text = font.render(f"Swirled: {', '.join(enemy.swirled_elements)}", True, BLACK)
-            surface.blit(swirled_text, (enemy_x, enemy_y + 130))
-
-        # debuffs
-        if enemy.debuffs:
-            debuffs_text = font.render(f"Debuffs: {', '.join(enemy.debuffs.keys())}", True, BLACK)
-            surface.blit(debuffs_text, (enemy_x, enemy_y + 160))
-
-        # status effects
-        status_effects = []
-        if enemy.is_frozen:
-            status_effects.append("Frozen")
-        if enemy.is_petrified:
-            status_effects.append("Petrified")
-        if enemy.shield:
-            status_effects.append(f"Shielded ({enemy.shield['type']})")
-
-        if status_effects:
-            status_text = font.render(f"Status: {', '.join(status_effects)}", True, BLACK)
-            surface.blit(status_text, (enemy_x, enemy_y + 190))
-
-        # enemy selector
-        enemy_rect = pygame.Rect(enemy_x - 10, enemy_y - 10, enemy_width, enemy_height)
-        enemy.rect = enemy_rect
-        if enemies and enemy == enemies[selected_enemy_index]:
-            pygame.draw.rect(surface, BLUE, enemy_rect, 2)
-        else:
-            pygame.draw.rect(surface, BLACK, enemy_rect, 1)
+    view = enemy_view
+    view.set_count(len(enemies))
+    viewport = view.viewport
+    # scrolling, zooming, switching views or an enemy dying moves every slot: start over
+    # (a full redraw has just cleared the whole window already)
+    layout = (enemy_list_mode, enemy_zoom, view.scroll, len(enemies))
+    if dirty.changed('enemy view', viewport, layout) and not dirty.full:
+        surface.fill(WHITE, viewport)
+    if enemy_list_mode:
+        enemy_rows.prune(enemies)
+    else:
+        enemy_cards.prune(enemies)
+        for cards in zoomed_cards.values():
+            cards.prune(enemies)
+    cell_width, cell_height = view.cell
+    surface.set_clip(viewport)
+    for idx in view.visible():
+        enemy = enemies[idx]
+        x, y = view.slot(idx)
+        selected = idx == selected_enemy_index
+        slot = pygame.Rect(x, y, view.pitch[0], cell_height).clip(viewport)
+        if dirty.changed(('enemy', idx), slot, (id(enemy), enemy.version, selected, layout)):
+            surface.blit(enemy_surface(enemy), (x, y))
+            # enemy selector
+            if selected:
+                pygame.draw.rect(surface, BLUE, (x, y, cell_width, cell_height), 2)
+            else:
+                pygame.draw.rect(surface, BLACK, (x, y, cell_width, cell_height), 1)
+    surface.set_clip(None)
+    draw_enemy_scrollbar(surface, view, layout)
 
-def display_logs(surface, logs):
-    # log messages
+def display_logs(surface, events):
+    # log messages, formatted only when the shown events change
     max_logs = 10
     log_area_height = max_logs * 20 + 10
     start_y = HEIGHT - log_area_height - 10
     log_background = pygame.Rect(220, start_y - 5, WIDTH - 440, log_area_height + 10)
+    shown = events[-max_logs:]
+    if not dirty.changed('logs', log_background, tuple(shown)):
+        return
     pygame.draw.rect(surface, LIGHT_GRAY, log_background)
-    for i, message in enumerate(logs[-max_logs:]):
-        log_text = font.render(message, True, BLACK)
-        surface.blit(log_text, (230, start_y + i * 20))
+    surface.set_clip(log_background)
+    for i, event in enumerate(shown):
+        surface.blit(render_text(format_event(event)), (230, start_y + i * 20))
+    surface.set_clip(None)
 def draw_current_actor(surface):
-    if not turn_order:
+    actor = encounter.current_actor()
+    region = (220, 10, WIDTH - 540, 24)
+    if not dirty.changed('current actor', region, id(actor)):
+        return
+    surface.fill(WHITE, region)
+    if actor is None:
         return
-    actor = turn_order[current_actor_index]
     if actor.type == 'Player':
         player_info = f"Current Player: {actor.name} - Element: {actor.element}"
     else:
         player_info = f"Current Enemy: {actor.name}"
-    player_text = font.render(player_info, True, BLACK)
-    surface.blit(player_text, (220, 10))
+    surface.blit(render_text(player_info), (220, 10))
+
+def preview_lines(actor, enemy, dice):
+    # what Attack would do to `enemy`, worked out once per enemy state, attacker element
+    # and dice settings; the effect tick is in the key too (Toxic Spores going off
+    # depends on it) and the attacker's max HP (Thunderstorm hits with it)
+    key = (enemy, enemy.version, enemy.clock.now if enemy.clock else 0, actor.element, actor.max_hp, dice)
+    lines = hit_previews.get(key)
+    if lines is None:
+        if len(hit_previews) >= PREVIEW_CACHE_SIZE:
+            hit_previews.clear()
+        hit = predict_hit(enemy, actor, *dice, approximate=True)
+        reaction = hit.reaction.name if hit.reaction else "no reaction"
+        lines = hit_previews[key] = (
+            f"{actor.name} ({actor.element}) on {enemy.name}: {reaction}",
+            f"Damage {hit.expected_damage():.1f} expected, {hit.min_damage():.1f}-{hit.max_damage():.1f}, "
+            f"kill chance {hit.kill_chance * 100:.0f}%",
+        )
+    return lines
+
+def draw_outcome_preview(surface, pointer):
+    # the enemy under `pointer`, otherwise the selected one; hovering costs a grid lookup
+    # and a dict lookup per frame, the text is only redrawn when it changes
+    region = (220, 40, WIDTH - 540, 44)
+    actor = encounter.current_actor()
+    enemies = encounter.enemies
+    lines = ()
+    if actor is not None and actor.type == 'Player' and enemies:
+        hovered = enemy_view.index_at(pointer)
+        enemy = enemies[hovered if hovered is not None else min(selected_enemy_index, len(enemies) - 1)]
+        # settings Attack would refuse get no prediction, just what's wrong with them
+        try:
+            dice = dice_settings()
+            Action(0, *dice)
+        except ValueError:
+            lines = (f"Dice Quantity takes 0 to {Action.FIELD_MAX}, Damage Override a number",)
+        else:
+            lines = preview_lines(actor, enemy, dice)
+    if not dirty.changed('preview', region, lines):
+        return
+    surface.fill(WHITE, region)
+    for i, line in enumerate(lines):
+        surface.blit(render_text(line), (220, 40 + i * 22))
+
+def draw_player_row(row, player, idx, current):
+    current_marker = ">> " if current else ""
+    player_info = f"{current_marker}{idx + 1}. {player.name} - Element: {player.element}"
+    row.blit(render_text(player_info), (0, 0))
+
+    hp_bar_length = 180
+    hp_bar_height = 20
+    fill = max((player.current_hp / player.max_hp) * hp_bar_length, 0)
+    pygame.draw.rect(row, RED, (0, 30, hp_bar_length, hp_bar_height))
+    pygame.draw.rect(row, GREEN, (0, 30, fill, hp_bar_height))
+    row.blit(render_text(f"HP: {player.current_hp:.2f}/{player.max_hp}"), (0, 55))
 
 def draw_players_info(surface):
+    global player_rows_drawn
     y_offset = 10
     x_offset = WIDTH - 320  
-    for idx, player in enumerate(players):
-        current_marker = ">> " if turn_order and turn_order[current_actor_index] == player else ""
-        player_info = f"{current_marker}{idx + 1}. {player.name} - Element: {player.element}"
-        player_text = font.render(player_info, True, BLACK)
-        surface.blit(player_text, (x_offset, y_offset + idx * 70))
-
-    
-        hp_bar_length = 180
-        hp_bar_height = 20
-        fill = max((player.current_hp / player.max_hp) * hp_bar_length, 0)
-        pygame.draw.rect(surface, RED, (x_offset, y_offset + idx * 70 + 30, hp_bar_length, hp_bar_height))
-        pygame.draw.rect(surface, GREEN, (x_offset, y_offset + idx * 70 + 30, fill, hp_bar_height))
-        hp_text = font.render(f"HP: {player.current_hp:.2f}/{player.max_hp}", True, BLACK)
-        surface.blit(hp_text, (x_offset, y_offset + idx * 70 + 55))
+    current_actor = encounter.current_actor()
+    players = encounter.players
+    player_rows.prune(players)
+    for idx in range(max(len(players), player_rows_drawn)):
+        region = (x_offset, y_offset + idx * 70, 320, 70)
+        if idx >= len(players):
+            if dirty.changed(('player', idx), region, None):
+                surface.fill(WHITE, region)
+            continue
+        player = players[idx]
+        key = (player.version, idx, player is current_actor)
+        if dirty.changed(('player', idx), region, (id(player),) + key):
+            draw = lambda row, player: draw_player_row(row, player, key[1], key[2])
+            surface.blit(player_rows.get(player, key, draw), region)
+    player_rows_drawn = len(players)
 
 # =====================================================================================================
 #                                   Menu and character creation
 # =====================================================================================================
+def report_startup():
+    # once, when the menu is first on screen
+    global startup
+    startup.step('first menu frame')
+    startup.stop()
+    print(startup.report())
+    startup = None
+
 def main_menu():
     menu_running = True
     clock = pygame.time.Clock()
 
-    players = []
-    if os.path.exists('players.pkl'):
-        with open('players.pkl', 'rb') as f:
-            players = pickle.load(f)
-            # Reset players' current HP to max HP at the start of the game
-            for player in players:
-                player.current_hp = player.max_hp
+    # the roster lives in roster.db; only the page on screen is loaded, and every edit
+    # writes just that character's row
+    roster = Roster(ROSTER_PATH, CAMPAIGN)
+    roster.import_pickle('players.pkl')  # one-time migration of the old save file
+    if startup:
+        startup.step('roster')
+    players = []  # the party, filled in on Start Game
+    page_index = 0
+    page_rows = []  # (id, Player, in_party) shown on this page
+    roster_size = 0
+    initiative_inputs = []
+    list_top = 80
+
+    def load_page():
+        nonlocal page_index, page_rows, initiative_inputs, roster_size
+        roster_size = roster.count()
+        pages = max((roster_size + PAGE_SIZE - 1) // PAGE_SIZE, 1)
+        page_index = min(max(page_index, 0), pages - 1)
+        page_rows = roster.page(page_index * PAGE_SIZE, PAGE_SIZE)
+        initiative_inputs = [TextInput(700, list_top + idx * 60, 60, 30, str(player.initiative))
+                             for idx, (_, player, _) in enumerate(page_rows)]
+
+    load_page()
 
     # Buttons
     create_player_btn = Button(150, 400, 150, 40, "Create New Player", None)
     start_game_btn = Button(320, 400, 100, 40, "Start Game", None)
     roll_initiative_btn = Button(440, 400, 150, 40, "Roll Initiative", None)
+    previous_page_btn = Button(610, 400, 80, 40, "< Prev", None)
+    next_page_btn = Button(700, 400, 80, 40, "Next >", None)
 
     def create_player_callback():
         nonlocal creating_player
         creating_player = True
 
     def start_game_callback():
+        nonlocal menu_running, players
+        players = roster.party()
         if players:
-            nonlocal menu_running
             menu_running = False
-            with open('players.pkl', 'wb') as f:
-                pickle.dump(players, f)
 
     def roll_initiative_callback():
-        for idx, player in enumerate(players):
-            player.initiative = random.randint(1, 20)
-            if idx < len(initiative_inputs):
-                initiative_inputs[idx].text = str(player.initiative)
-                initiative_inputs[idx].txt_surface = font.render(initiative_inputs[idx].text, True, BLACK)
+        roster.roll_initiative()
+        load_page()
+
+    def turn_page(step):
+        nonlocal page_index
+        page_index += step
+        load_page()
 
     create_player_btn.callback = create_player_callback
     start_game_btn.callback = start_game_callback
     roll_initiative_btn.callback = roll_initiative_callback
+    previous_page_btn.callback = lambda: turn_page(-1)
+    next_page_btn.callback = lambda: turn_page(1)
 
     # text inputs for player attributes
     name_input = TextInput(150, 50, 200, 32, '')
@@ -645,13 +591,17 @@ def main_menu():
         element_buttons.append(btn)
 
     creating_player = False
-    initiative_inputs = [] 
-    remove_buttons = []     
+    remove_buttons = []
+    party_buttons = []
 
+    redraw = True
     while menu_running:
+        events = next_events(clock, block=not redraw)
+        if not events and not redraw and not POLLING:
+            continue
         window.fill(WHITE)
 
-        for event in pygame.event.get():
+        for event in events:
             if event.type == pygame.QUIT:
                 pygame.quit()
                 sys.exit()
@@ -680,7 +630,8 @@ def main_menu():
                         initiative = int(initiative_input.text) if initiative_input.text else random.randint(1, 20)
                         if name and selected_element:
                             player = Player(name, max_hp, ac, movement, initiative, element=selected_element)
-                            players.append(player)
+                            roster.add(player)
+                            load_page()
                             name_input.text = ''
                             name_input.txt_surface = font.render('', True, BLACK)
                             hp_input.text = ''
@@ -703,17 +654,23 @@ def main_menu():
                         start_game_btn.callback()
                     elif roll_initiative_btn.is_clicked(pos):
                         roll_initiative_btn.callback()
+                    elif previous_page_btn.is_clicked(pos):
+                        previous_page_btn.callback()
+                    elif next_page_btn.is_clicked(pos):
+                        next_page_btn.callback()
                     for btn in element_buttons:
                         if btn.is_clicked(pos):
                             btn.callback()
-                    for btn, idx in remove_buttons:
+                    for btn, player_id in remove_buttons:
                         if btn.is_clicked(pos):
-                            del players[idx]
-                            del initiative_inputs[idx]
-                            # Save updated players list to players.pkl
-                            with open('players.pkl', 'wb') as f:
-                                pickle.dump(players, f)
-                            break 
+                            roster.remove(player_id)
+                            load_page()
+                            break
+                    for btn, player_id, in_party in party_buttons:
+                        if btn.is_clicked(pos):
+                            roster.set_in_party(player_id, not in_party)
+                            load_page()
+                            break
 
         if creating_player:
             # draw stiuff
@@ -732,145 +689,285 @@ def main_menu():
             for btn in element_buttons:
                 btn.draw(window)
 
-            selected_element_text = font.render(f"Selected Element: {selected_element}", True, BLACK)
+            selected_element_text = render_text(f"Selected Element: {selected_element}")
             window.blit(selected_element_text, (150, y + button_height + 10))
             create_player_btn.draw(window)
         else:
-            y_offset = 50
-            window.blit(large_font.render("Existing Players:", True, BLACK), (50, y_offset))
+            y_offset = list_top - 30
+            window.blit(render_text("Existing Players:", large_font), (50, y_offset))
             y_offset += 30
             remove_buttons = []
-            for idx, player in enumerate(players):
-                player_info = f"{idx + 1}. {player.name} - HP: {player.max_hp}, AC: {player.ac}, Movement: {player.movement}, Element: {player.element}"
-                player_text = font.render(player_info, True, BLACK)
+            party_buttons = []
+            for idx, (player_id, player, in_party) in enumerate(page_rows):
+                number = page_index * PAGE_SIZE + idx + 1
+                player_info = f"{number}. {player.name} - HP: {player.max_hp}, AC: {player.ac}, Movement: {player.movement}, Element: {player.element}"
+                player_text = render_text(player_info)
                 window.blit(player_text, (50, y_offset + idx * 60))
                 remove_btn = Button(600, y_offset + idx * 60, 80, 30, "Remove", None)
-                remove_buttons.append((remove_btn, idx))
+                remove_buttons.append((remove_btn, player_id))
                 remove_btn.draw(window)
-                if idx >= len(initiative_inputs):
-    
-                    init_input = TextInput(700, y_offset + idx * 60, 60, 30, str(player.initiative))
-                    initiative_inputs.append(init_input)
-                else:
-                    init_input = initiative_inputs[idx]
+                party_btn = Button(780, y_offset + idx * 60, 90, 30, "In party" if in_party else "Benched", None)
+                party_buttons.append((party_btn, player_id, in_party))
+                party_btn.draw(window)
+                init_input = initiative_inputs[idx]
 
-                init_label = font.render("Initiative:", True, BLACK)
+                init_label = render_text("Initiative:")
                 window.blit(init_label, (700, y_offset + idx * 60 - 20))
                 init_input.draw(window)
 
                 if init_input.text:
                     try:
-                        player.initiative = int(init_input.text)
+                        initiative = int(init_input.text)
                     except ValueError:
-                        pass 
+                        pass
+                    else:
+                        if initiative != player.initiative:
+                            player.initiative = initiative
+                            roster.set_initiative(player_id, initiative)
 
             create_player_btn.draw(window)
             start_game_btn.draw(window)
             roll_initiative_btn.draw(window)
+            previous_page_btn.draw(window)
+            next_page_btn.draw(window)
+            pages = max((roster_size + PAGE_SIZE - 1) // PAGE_SIZE, 1)
+            window.blit(render_text(f"Page {page_index + 1} of {pages} ({roster_size} characters)"), (610, 450))
 
         pygame.display.flip()
-        clock.tick(30)
-
-    players.sort(key=lambda x: x.initiative, reverse=True)
+        redraw = False
+        if startup:
+            report_startup()
 
+    roster.close()
     return players
 
 
-players = main_menu()
-current_actor_index = 0
-
-# hardcoded tests
-enemies = [
-    Enemy("Harin", 120, defense=0, initiative=random.randint(1, 20)),
-    Enemy("Sigurd", 300, defense=10, initiative=random.randint(1, 20)),
-]
-
-selected_enemy_index = 0
-log_messages = []
-
-# create rurn order from initiative
-turn_order = players + enemies
-turn_order.sort(key=lambda x: x.initiative, reverse=True)
-current_actor_index = 0
-
-buttons = []
-button_width, button_height = 180, 40  # Adjusted button width
-base_attack_btn = Button(10, 10, button_width, button_height, "Attack", perform_base_attack)
-buttons.append(base_attack_btn)
-dice_buttons = []
-dice_types = {'d4':4, 'd6':6, 'd8':8, 'd10':10, 'd12':12, 'd20':20}
-selected_dice = None
-
 def set_selected_dice(dice_value):
     global selected_dice
     selected_dice = dice_value
 
-x_offset = 10
-y_offset = 60
-for dice_name, dice_value in dice_types.items():
-    btn = Button(x_offset, y_offset, button_width, button_height, dice_name, lambda v=dice_value: set_selected_dice(v))
-    dice_buttons.append(btn)
-    y_offset += button_height + 5
+# replay: arrow keys step one action, Page Up/Down ten, Home/End jump to either end
+replay_steps = {pygame.K_RIGHT: 1, pygame.K_LEFT: -1, pygame.K_PAGEDOWN: 10, pygame.K_PAGEUP: -10,
+                pygame.K_END: 1 << 30, pygame.K_HOME: -(1 << 30)}
+
+def seek_replay(step):
+    global fight, encounter, replay_position, selected_enemy_index
+    replay_position = max(0, min(replay_position + step, len(replay)))
+    frame_timer.lap('events')
+    fight = replay.seek(replay_position)
+    frame_timer.lap('engine')
+    encounter = fight.encounter
+    selected_enemy_index = min(selected_enemy_index, max(len(encounter.enemies) - 1, 0))
+
+def undo_action(redo=False):
+    global selected_enemy_index
+    frame_timer.lap('events')
+    action = undo_history.redo() if redo else undo_history.undo()
+    if action is None:
+        return
+    # the journal follows, so replays and charts show the fight as it now stands
+    if redo:
+        journal.write(action)
+    else:
+        journal.rewind(fight.actions)
+    frame_timer.lap('engine')
+    selected_enemy_index = min(selected_enemy_index, max(len(encounter.enemies) - 1, 0))
+    if encounter.is_over():
+        disable_buttons()
+    else:
+        base_attack_btn.callback = perform_base_attack
 
-dice_quantity_input = TextInput(10, y_offset + 10, button_width, 32, '1')
-dice_quantity_label = font.render("Dice Quantity:", True, BLACK)
-damage_override_input = TextInput(10, y_offset + 60, button_width, 32, '')
-damage_override_label = font.render("Damage Override:", True, BLACK)
-enemy_damage_input = TextInput(10, y_offset + 110, button_width, 32, '10')
-enemy_damage_label = font.render("Enemy Damage:", True, BLACK)
-selected_dice_text_position = y_offset + 160
+def draw_replay_position(surface):
+    region = (220, 40, WIDTH - 540, 24)
+    if not dirty.changed('replay', region, replay_position):
+        return
+    surface.fill(WHITE, region)
+    surface.blit(render_text(f"Replay of fight {replay.seed}: action {replay_position} of {len(replay)} "
+                             f"(arrows step, Page Up/Down x10, Home/End)"), (220, 40))
+
+def save_battle_charts():
+    # read back from the journal, which always has every action played so far
+    analytics = analyze_journal(journal_path)
+    print(analytics.report())
+    for path in analytics.save_charts(os.path.join('charts', f'fight-{fight.seed}')):
+        print(f"Saved {path}")
+
+def toggle_overlay():
+    global show_overlay, overlay_refreshed
+    show_overlay = not show_overlay
+    overlay_refreshed = -OVERLAY_REFRESH_MS
+
+def toggle_capture():
+    saved = capture.toggle()
+    if saved:
+        print(f"Profile saved to {saved}.prof and {saved}.snapshot")
+    # shown in the title bar, so a capture is visible with the overlay off too
+    pygame.display.set_caption("Elemental Combat System" + (" - recording profile (F9 stops)" if capture.running else ""))
+
+def draw_profile_overlay(surface):
+    # below the dice controls; the numbers refresh twice a second, not every frame
+    global overlay_lines, overlay_refreshed
+    region = (10, 520, 200, 300)
+    now = pygame.time.get_ticks()
+    if show_overlay and now - overlay_refreshed >= OVERLAY_REFRESH_MS:
+        overlay_lines = frame_timer.summary()
+        overlay_refreshed = now
+    if not dirty.changed('profile overlay', region, tuple(overlay_lines) if show_overlay else None):
+        return
+    surface.fill(WHITE, region)
+    if not show_overlay:
+        return
+    pygame.draw.rect(surface, LIGHT_GRAY, region)
+    for i, line in enumerate(overlay_lines):
+        surface.blit(render_text(line, small_font), (15, 525 + i * 18))
 
-# GAME LOOP:
-running = True
-clock = pygame.time.Clock()
+selected_enemy_index = 0
+selected_dice = None
 
-while running:
-    window.fill(WHITE)
+# everything below runs the game; importing this module (benchmarks) only sets up the
+# window and the drawing functions
+if __name__ == '__main__':
+    try:
+        seed = check_seed(int(SEED)) if SEED is not None else random.randrange(1 << 63)
+    except ValueError:
+        sys.exit(f"--seed takes a whole number from 0 to {SEED_MAX}")
+    init_display()
+    if REPLAY_PATH:
+        replay = Replay.load(REPLAY_PATH)
+        journal_path = REPLAY_PATH
+        replay_position = 0
+        fight = replay.seek(replay_position)
+    else:
+        replay = None
+        players = main_menu()
+        setup_rng = fight_rng(seed, 'setup')
+        enemies = default_enemies(setup_rng)
+        enemies += [Enemy(f"Minion {index}", 20, initiative=setup_rng.randint(1, 20)) for index in range(1, MINIONS + 1)]
+        journal_path = JOURNAL_PATH or os.path.join('journals', f'fight-{seed}.journal')
+        enemy_policy = parse_policy(ENEMY_AI, nodes=LIVE_AI_NODES, time_ms=LIVE_AI_MS) if ENEMY_AI else None
+        journal = JournalWriter(journal_path, seed, players, enemies, enemy_policy)
+        fight = Fight(seed, players, enemies, enemy_policy=enemy_policy)
+        undo_history = UndoHistory(fight, UNDO_DEPTH)
+    encounter = fight.encounter
+    if len(encounter.enemies) > LIST_VIEW_AT:
+        set_enemy_view(list_mode=True)
+
+    buttons = []
+    button_width, button_height = 180, 40  # Adjusted button width
+    base_attack_btn = Button(10, 10, button_width, button_height, "Attack", perform_base_attack)
+    buttons.append(base_attack_btn)
+    dice_buttons = []
+    dice_types = {'d4':4, 'd6':6, 'd8':8, 'd10':10, 'd12':12, 'd20':20}
+    selected_dice = None
+
+    x_offset = 10
+    y_offset = 60
+    for dice_name, dice_value in dice_types.items():
+        btn = Button(x_offset, y_offset, button_width, button_height, dice_name, lambda v=dice_value: set_selected_dice(v))
+        dice_buttons.append(btn)
+        y_offset += button_height + 5
+
+    dice_quantity_input = TextInput(10, y_offset + 10, button_width, 32, '1')
+    dice_quantity_label = font.render("Dice Quantity:", True, BLACK)
+    damage_override_input = TextInput(10, y_offset + 60, button_width, 32, '')
+    damage_override_label = font.render("Damage Override:", True, BLACK)
+    enemy_damage_input = TextInput(10, y_offset + 110, button_width, 32, '10')
+    enemy_damage_label = font.render("Enemy Damage:", True, BLACK)
+    selected_dice_text_position = y_offset + 160
+
+    if replay is not None:
+        disable_buttons()
 
-    for event in pygame.event.get():
-        if event.type == pygame.QUIT:
-            running = False
+    # GAME LOOP:
+    running = True
+    clock = pygame.time.Clock()
 
-        dice_quantity_input.handle_event(event)
-        damage_override_input.handle_event(event)
-        enemy_damage_input.handle_event(event)
+    while running:
+        events = next_events(clock, block=not dirty.full)
+        if not events and not dirty.full and not POLLING:
+            continue
+        frame_timer.start()
+        for event in events:
+            if event.type == pygame.QUIT:
+                running = False
+            if event.type == pygame.KEYDOWN and event.key == OVERLAY_KEY:
+                toggle_overlay()
+            if event.type == pygame.KEYDOWN and event.key == CAPTURE_KEY:
+                toggle_capture()
+            if event.type == pygame.KEYDOWN and event.key == CHARTS_KEY:
+                save_battle_charts()
+            if event.type in (pygame.VIDEOEXPOSE, pygame.WINDOWEXPOSED):
+                dirty.invalidate()
+            if event.type == pygame.MOUSEWHEEL and enemy_view.viewport.collidepoint(pygame.mouse.get_pos()):
+                scroll_enemy_view(event.y, zoom=pygame.key.get_mods() & pygame.KMOD_CTRL)
+            typing = any(field.active for field in (dice_quantity_input, damage_override_input, enemy_damage_input))
+            if event.type == pygame.KEYDOWN and event.key == LIST_VIEW_KEY and not typing:
+                set_enemy_view(list_mode=not enemy_list_mode)
+            if (replay is None and event.type == pygame.KEYDOWN and event.key in (UNDO_KEY, REDO_KEY)
+                    and event.mod & pygame.KMOD_CTRL and not typing):
+                undo_action(redo=event.key == REDO_KEY or bool(event.mod & pygame.KMOD_SHIFT))
+            if replay is not None and event.type == pygame.KEYDOWN and event.key in replay_steps:
+                seek_replay(replay_steps[event.key])
+
+            dice_quantity_input.handle_event(event)
+            damage_override_input.handle_event(event)
+            enemy_damage_input.handle_event(event)
+
+            if event.type == pygame.MOUSEBUTTONDOWN and event.button in (1, 2, 3):
+                pos = pygame.mouse.get_pos()
+                for button in buttons:
+                    if button.is_clicked(pos):
+                        button.callback()
+                for btn in dice_buttons:
+                    if btn.is_clicked(pos):
+                        btn.callback()
+                idx = enemy_view.index_at(pos)
+                if idx is not None:
+                    selected_enemy_index = idx
+        frame_timer.lap('events')
 
-        if event.type == pygame.MOUSEBUTTONDOWN:
-            pos = pygame.mouse.get_pos()
+        if dirty.full:
+            # buttons and labels never change, they are only drawn on a full redraw
+            window.fill(WHITE)
             for button in buttons:
-                if button.is_clicked(pos):
-                    button.callback()
+                button.draw(window)
             for btn in dice_buttons:
-                if btn.is_clicked(pos):
-                    btn.callback()
-            for idx, enemy in enumerate(enemies):
-                if enemy.rect and enemy.rect.collidepoint(pos):
-                    selected_enemy_index = idx
-
-    for button in buttons:
-        button.draw(window)
-    for btn in dice_buttons:
-        btn.draw(window)
-
-    window.blit(dice_quantity_label, (10, dice_quantity_input.rect.y - 20))
-    dice_quantity_input.draw(window)
-
-    window.blit(damage_override_label, (10, damage_override_input.rect.y - 20))
-    damage_override_input.draw(window)
-
-    window.blit(enemy_damage_label, (10, enemy_damage_input.rect.y - 20))
-    enemy_damage_input.draw(window)
-
-    selected_dice_text = font.render(f"Selected Dice: d{selected_dice}", True, BLACK)
-    window.blit(selected_dice_text, (10, selected_dice_text_position))
-
-    draw_enemies_status(window, enemies)
-    draw_current_actor(window)
-    draw_players_info(window)
-    display_logs(window, log_messages)
-
-    pygame.display.flip()
-
-    clock.tick(30)
-pygame.quit()
-sys.exit()
+                btn.draw(window)
+            window.blit(dice_quantity_label, (10, dice_quantity_input.rect.y - 20))
+            window.blit(damage_override_label, (10, damage_override_input.rect.y - 20))
+            window.blit(enemy_damage_label, (10, enemy_damage_input.rect.y - 20))
+
+        dice_quantity_input.draw_if_changed(window)
+        damage_override_input.draw_if_changed(window)
+        enemy_damage_input.draw_if_changed(window)
+
+        selected_dice_region = (10, selected_dice_text_position, button_width, 20)
+        if dirty.changed('selected dice', selected_dice_region, selected_dice):
+            window.fill(WHITE, selected_dice_region)
+            window.blit(render_text(f"Selected Dice: d{selected_dice}"), (10, selected_dice_text_position))
+        frame_timer.lap('widgets')
+
+        draw_enemies_status(window, encounter.enemies)
+        frame_timer.lap('enemies')
+        draw_current_actor(window)
+        if replay is not None:
+            draw_replay_position(window)
+        else:
+            draw_outcome_preview(window, pygame.mouse.get_pos())
+        frame_timer.lap('actor')
+        draw_players_info(window)
+        frame_timer.lap('players')
+        display_logs(window, encounter.events)
+        frame_timer.lap('logs')
+        draw_profile_overlay(window)
+        frame_timer.lap('overlay')
+
+        dirty.flush()
+        frame_timer.lap('flip')
+        frame_timer.end()
+    if capture.running:
+        toggle_capture()
+    if replay is None:
+        journal.close()
+    pygame.quit()
+    sys.exit()
@@ -0,0 +1,1127 @@
+import bisect
+import itertools
+import random
+from collections import deque
+
+
+# =======================================================================
+#              Gameplay / Damge calculations and Reactions
+# =======================================================================
+
+elements = ["Pyro", "Cryo", "Hydro", "Electro", "Dendro", "Geo", "Anemo"]
+
+
+reactions = [
+    # Reactions are defined by the elements required (x,y, sometimes z)
+    # triple-element reactions (more specific reactions first)
+    (frozenset(["Anemo", "Hydro", "Electro"]), ("Thunderstorm", 1.0, "Strikes all targets with lightning, dealing 40% of caster's max HP.", ['ALL'], "Electro")),
+    (frozenset(["Dendro", "Hydro", "Cryo"]), ("Toxic Spores", 1.0, "3 Spores will emerge; after 3 turns, target takes 5% of Max HP as damage.", ['ALL'], None)),
+    # double-element reactions
+    (frozenset(["Pyro", "Cryo"]), ("Melt", 1.5, "Removes ALL applied elements.", ['ALL'], None)),
+    (frozenset(["Hydro", "Pyro"]), ("Vaporize", 1.5, "Removes ALL applied elements.", ['ALL'], None)),
+    (frozenset(["Cryo", "Hydro"]), ("Freeze", 0, "Freezes target for 1 turn.", [], None)),
+    (frozenset(["Electro", "Cryo"]), ("Superconduct", 1.0, "Reduces target defense by 50% for 1 turn. Removes ALL applied elements.", ['ALL'], None)),
+    (frozenset(["Electro", "Hydro"]), ("Electro-charged", 1.0, "Applies damage to ALL targets.", [], "Electro")),
+    # swirl reactions
+    (frozenset(["Anemo", "Pyro"]), ("Swirl", 1.0, "Applies Swirled Pyro to all targets. Removes Anemo element.", ['Anemo'], None)),
+    (frozenset(["Anemo", "Cryo"]), ("Swirl", 1.0, "Applies Swirled Cryo to all targets. Removes Anemo element.", ['Anemo'], None)),
+    (frozenset(["Anemo", "Hydro"]), ("Swirl", 1.0, "Applies Swirled Hydro to all targets. Removes Anemo element.", ['Anemo'], None)),
+    (frozenset(["Anemo", "Electro"]), ("Swirl", 1.0, "Applies Swirled Electro to all targets. Removes Anemo element.", ['Anemo'], None)),
+    # Other reactions
+    (frozenset(["Geo", "Pyro"]), ("Crystallize", 1.0, "Creates a shield granting immunity to Pyro for 1 turn. Removes ALL elements.", ['ALL'], None)),
+    (frozenset(["Geo", "Cryo"]), ("Crystallize", 1.0, "Creates a shield granting immunity to Cryo for 1 turn. Removes ALL elements.", ['ALL'], None)),
+    (frozenset(["Geo", "Hydro"]), ("Crystallize", 1.0, "Creates a shield granting immunity to Hydro for 1 turn. Removes ALL elements.", ['ALL'], None)),
+    (frozenset(["Geo", "Electro"]), ("Crystallize", 1.0, "Creates a shield granting immunity to Electro for 1 turn. Removes ALL elements.", ['ALL'], None)),
+    (frozenset(["Geo", "Geo"]), ("Stabilize", 1.0, "Creates a shield reducing incoming damage by 30% for 2 turns. Removes Geo elements.", ['Geo'], None)),
+    (frozenset(["Hydro", "Geo"]), ("Petrify", 0, "Petrifies target for 1 turn.", ['Geo'], None)),
+    (frozenset(["Electro", "Pyro"]), ("Overload", 1.0, "Disarms target for 1 turn. Removes ALL elements.", ['ALL'], None)),
+    (frozenset(["Dendro", "Hydro"]), ("Bloom", 0, "Heals target by 25% of max health.", ['ALL'], None)),
+    (frozenset(["Dendro", "Pyro"]), ("Burning", 1.0, "Applies 3% max HP DoT for 3 rounds.", ['ALL'], None)),
+    (frozenset(["Dendro", "Anemo"]), ("Healing Winds", 0, "Heals all party members by 20% max HP over 3 rounds.", ['ALL'], None)),
+    (frozenset(["Electro", "Dendro"]), ("Corrosion", 1.0, "Applies DoT equal to 5% max HP for 2 turns.", ['ALL'], None)),
+    (frozenset(["Anemo", "Geo"]), ("Sandstorm", 1.0, "Targets roll at disadvantage for 1 turn. Removes ALL applied elements.", ['ALL'], None)),
+    (frozenset(["Cryo", "Dendro"]), ("Frostbite", 1.0, "Applies DoT equal to 3% max HP for 3 turns and reduces movement speed by 50%.", ['ALL'], None)),
+]
+
+# one bit per element, in the same order as `elements`
+element_bits = {name: 1 << i for i, name in enumerate(elements)}
+ALL_ELEMENTS = (1 << len(elements)) - 1
+# 3-bit code per element for Enemy.element_order, 0 means "no more elements"
+element_codes = {name: i + 1 for i, name in enumerate(elements)}
+element_bit_codes = {name: (element_bits[name], element_codes[name]) for name in elements}
+ELEMENT_CODE_BITS = 3
+
+def element_mask(names):
+    mask = 0
+    for name in names:
+        mask |= element_bits[name]
+    return mask
+
+def mask_names(mask):
+    return [name for name in elements if mask & element_bits[name]]
+
+
+# Debuff records: plain timers, and DoTs that also deal % of max HP every tick.
+# `expires` is the effect tick they run out on (see EffectScheduler).
+class Debuff:
+    __slots__ = ('expires',)
+    percentage = 0
+
+    def __init__(self, expires):
+        self.expires = expires
+
+class DoT(Debuff):
+    __slots__ = ('percentage',)
+
+    def __init__(self, expires, percentage):
+        self.expires = expires
+        self.percentage = percentage
+
+class Shield:
+    __slots__ = ('type', 'expires', 'element', 'reduction')
+
+    def __init__(self, type, expires, element=None, reduction=0):
+        self.type = type  # 'Damage Reduction' or 'Elemental Immunity'
+        self.expires = expires
+        self.element = element
+        self.reduction = reduction
+
+
+# =======================================================================
+#                                 Events
+# =======================================================================
+# Everything that happens in a fight is recorded as a plain tuple
+#   (kind, actor, target, amount, hp_after, detail)
+# and only turned into text by format_event when something reads the log, so runs that
+# never look at it never pay for the formatting.
+
+def _note(text):
+    return ('note', None, None, None, None, text)
+
+def _area_damage_text(event):
+    # a few targets are listed one by one, a crowd only in total
+    label, targets, damages = event[5]
+    immune = damages.count(None)
+    text = f"{label} hits {len(targets) - immune} enemies for {event[3]:.2f} total damage!"
+    if len(targets) <= 4:
+        return text + ' ' + ', '.join(f"{enemy.name}: {'immune' if damage is None else f'{damage:.2f}'}"
+                                      for enemy, damage in zip(targets, damages))
+    return text + (f" {immune} immune." if immune else "")
+
+def _shield_text(event):
+    if event[5] == 'Elemental Immunity':
+        return f"{event[2].name} gains a shield granting immunity to certain damage."
+    return f"{event[2].name} gains a shield reducing incoming damage."
+
+event_formats = {
+    'note': lambda event: event[5],
+    'element': lambda event: f"{event[5]} applied to {event[2].name}.",
+    'element held': lambda event: f"{event[2].name} already has {event[5]} applied.",
+    'immune': lambda event: f"{event[2].name} is immune to {event[5]} damage!",
+    # detail is the effect that dealt it (Toxic Spores going off), None for a hit
+    'damage': lambda event: f"{event[2].name} takes {event[3]:.2f} damage! Remaining HP: {event[4]:.2f}",
+    'dot damage': lambda event: f"{event[2].name} takes {event[3]:.2f} DoT damage! Remaining HP: {event[4]:.2f}",
+    'heal': lambda event: f"{event[2].name} heals for {event[3]:.2f} HP! Current HP: {event[4]:.2f}",
+    'debuff': lambda event: f"{event[2].name} is affected by {event[5]} for {event[3]} turn(s).",
+    # area events stand for one operation on many enemies: detail is (label, targets, per-target
+    # damage with None for immune) or (debuff name, targets)
+    'area damage': _area_damage_text,
+    'area debuff': lambda event: f"{len(event[5][1])} enemies are affected by {event[5][0]} for {event[3]} turn(s).",
+    # detail is (DoT name, duration), amount the damage per tick
+    'dot': lambda event: f"{event[5][0]} will deal {event[3]:.2f} damage per turn for {event[5][1]} turns.",
+    'shield': _shield_text,
+    'reaction': lambda event: f"Reaction triggered: {event[5].name}",
+    'reaction effect': lambda event: f"Effect: {event[5].description}",
+    'unable': lambda event: f"{event[1].name} is unable to act.",
+    'attack': lambda event: f"{event[1].name} attacks {event[2].name} for {event[3]} damage.",
+    'defeated': lambda event: f"{event[2].name} has been defeated!",
+}
+
+def format_event(event):
+    return event_formats[event[0]](event)
+
+
+class EventLog:
+    # the last `capacity` events of a fight, oldest first; capacity 0 keeps nothing
+    def __init__(self, capacity=1000):
+        self.events = deque(maxlen=capacity)
+        self.appended = 0  # events ever added, kept or not
+
+    def __len__(self):
+        return len(self.events)
+
+    def __iter__(self):
+        return iter(self.events)
+
+    def extend(self, events):
+        self.events.extend(events)
+        self.appended += len(events)
+
+    def rewind(self, appended):
+        # back to when `appended` events had been added (undo): the newer ones go, and
+        # whatever had already fallen off the old end stays gone
+        events = self.events
+        for _ in range(min(self.appended - appended, len(events))):
+            events.pop()
+        self.appended = appended
+
+    def clear(self):
+        self.events.clear()
+
+    def lines(self, last=None):
+        # the log as text, only the `last` newest events if given
+        events = self.events
+        if last is not None and last < len(events):
+            events = reversed(list(itertools.islice(reversed(events), last)))
+        return [format_event(event) for event in events]
+
+
+# Player class
+class Player:
+    __slots__ = ('name', 'max_hp', 'current_hp', 'temp_hp', 'ac', 'movement', 'initiative', 'element',
+                 'version', 'actions_taken', 'total_damage_dealt', 'total_damage_taken')
+    type = 'Player'
+
+    def __init__(self, name, max_hp, ac, movement, initiative, element, temp_hp=0):
+        self.name = name
+        self.max_hp = max_hp
+        self.current_hp = max_hp
+        self.temp_hp = temp_hp
+        self.ac = ac
+        self.movement = movement
+        self.initiative = initiative
+        self.element = element
+        self.version = 0  # bumped whenever HP changes, so the UI knows to redraw
+        self.actions_taken = 0
+        self.total_damage_dealt = 0
+        self.total_damage_taken = 0
+
+    def __setstate__(self, state):
+        # players.pkl written before __slots__ holds a plain attribute dict
+        if isinstance(state, tuple):
+            state = {**(state[0] or {}), **state[1]}
+        self.__init__(state['name'], state['max_hp'], state['ac'], state['movement'], state['initiative'],
+                      state['element'], state.get('temp_hp', 0))
+        for key, value in state.items():
+            if key in Player.__slots__:
+                setattr(self, key, value)
+
+# Enemy class
+class Enemy:
+    __slots__ = ('name', 'max_hp', 'current_hp', 'element_mask', 'element_order', 'swirled_mask', 'defense',
+                 'debuffs', 'is_frozen', 'is_petrified', 'marked', 'shield', 'clock', 'initiative', 'version', 'actions_taken', 'total_damage_dealt', 'total_damage_taken')
+    type = 'Enemy'
+
+    def __init__(self, name, max_hp, defense=0, elements_applied=[], is_frozen=False, is_petrified=False, initiative=0):
+        self.name = name
+        self.max_hp = max_hp
+        self.current_hp = max_hp
+        self.elements = elements_applied  # Elements directly applied
+        self.swirled_mask = 0  # Elements via Swirl
+        self.defense = defense
+        self.debuffs = {}  # name -> Debuff/DoT
+        self.is_frozen = is_frozen
+        self.is_petrified = is_petrified
+        self.marked = False
+        self.shield = None
+        self.clock = None  # EffectClock of the fight it is in
+        self.initiative = initiative
+        self.version = 0  # bumped whenever HP, elements, debuffs, shield or status change
+        self.actions_taken = 0
+        self.total_damage_dealt = 0
+        self.total_damage_taken = 0
+
+    # Applied elements are a bitmask for lookups plus their codes packed in application
+    # order (newest in the low bits), since Crystallize shields the newest element.
+    @property
+    def elements(self):
+        names = []
+        order = self.element_order
+        while order:
+            names.append(elements[(order & 7) - 1])
+            order >>= ELEMENT_CODE_BITS
+        names.reverse()
+        return names
+
+    @elements.setter
+    def elements(self, names):
+        self.element_mask = 0
+        self.element_order = 0
+        for name in names:
+            if not self.element_mask & element_bits[name]:
+                self.element_mask |= element_bits[name]
+                self.element_order = (self.element_order << ELEMENT_CODE_BITS) | element_codes[name]
+
+    @property
+    def swirled_elements(self):
+        return mask_names(self.swirled_mask)
+
+    @swirled_elements.setter
+    def swirled_elements(self, names):
+        self.swirled_mask = element_mask(names)
+
+    def apply_element(self, element):
+        bit, code = element_bit_codes[element]
+        if not self.element_mask & bit:
+            self.element_mask |= bit
+            self.element_order = (self.element_order << ELEMENT_CODE_BITS) | code
+            self.version += 1
+            return ('element', None, self, None, None, element)
+        else:
+            return ('element held', None, self, None, None, element)
+
+    def newest_element(self, excluding=None):
+        # most recently applied element still on the enemy, skipping `excluding`
+        skip = element_codes.get(excluding)
+        order = self.element_order
+        while order:
+            code = order & 7
+            if code != skip:
+                return elements[code - 1]
+            order >>= ELEMENT_CODE_BITS
+        return None
+
+    def mitigate_damage(self, base_damage, multiplier=1.0, attack_element=None, defense_halved=False):
+        # damage this hit would do without applying it, None if the shield makes it immune
+        # Apply defense reduction from debuffs IT KEEPS GIVING ENEMIES THE SHIELDS
+        defense = self.defense
+        if defense_halved or "Superconduct" in self.debuffs:
+            defense *= 0.5
+        damage = (base_damage * multiplier) - defense
+        shield = self.shield
+        if shield:
+            if shield.type == 'Damage Reduction':
+                damage *= (1 - shield.reduction)
+            elif shield.type == 'Elemental Immunity':
+                if attack_element == shield.element:
+                    return None
+        return max(damage, 0)  # Prevent negative damage
+
+    def calculate_damage(self, base_damage, multiplier=1.0, attack_element=None, source=None):
+        # `source` names an effect dealing the damage (Toxic Spores), None for a hit.
+        # mitigate_damage inline, every hit goes through here
+        defense = self.defense
+        if "Superconduct" in self.debuffs:
+            defense *= 0.5
+        damage = (base_damage * multiplier) - defense
+        shield = self.shield
+        if shield:
+            if shield.type == 'Damage Reduction':
+                damage *= (1 - shield.reduction)
+            elif shield.type == 'Elemental Immunity' and attack_element == shield.element:
+                return ('immune', None, self, None, None, attack_element)
+        if damage < 0:
+            damage = 0
+        self.current_hp -= damage
+        self.version += 1
+        self.total_damage_taken += damage
+        return ('damage', None, self, damage, self.current_hp, source)
+
+    def reset_elements(self):
+        self.element_mask = 0
+        self.element_order = 0
+        self.swirled_mask = 0
+        self.version += 1
+
+    def remove_elements(self, mask):
+        # drop these elements from both the applied and the swirled ones
+        if not (self.element_mask | self.swirled_mask) & mask:
+            return
+        self.swirled_mask &= ~mask
+        if self.element_mask & mask:
+            self.element_mask &= ~mask
+            kept = 0
+            shift = 0
+            order = self.element_order
+            while order:
+                code = order & 7
+                if not mask & (1 << (code - 1)):
+                    kept |= code << shift
+                    shift += ELEMENT_CODE_BITS
+                order >>= ELEMENT_CODE_BITS
+            self.element_order = kept
+        self.version += 1
+
+    # ------------------------------------------------------------- timed effects
+
+    # An effect lasting `duration` turns runs out on tick now + duration; the tick at the
+    # end of the current attack already counts, so a 1 turn debuff ends with this attack.
+    # Outside a fight there is no clock and ticks count from 0.
+
+    def remaining(self, record):
+        # ticks left on a debuff or shield record
+        return record.expires - (self.clock.now if self.clock is not None else 0)
+
+    def apply_debuff(self, debuff_name, duration):
+        clock = self.clock
+        self.debuffs[debuff_name] = record = Debuff((clock.now if clock else 0) + (duration if duration > 1 else 1))
+        if clock:
+            clock.incoming.append((self, debuff_name, record))
+        self.version += 1
+        return ('debuff', None, self, duration, None, debuff_name)
+
+    def apply_dot(self, percentage, duration, dot_name):
+        clock = self.clock
+        self.debuffs[dot_name] = record = DoT((clock.now if clock else 0) + (duration if duration > 1 else 1), percentage)
+        if clock:
+            clock.incoming.append((self, dot_name, record))
+        self.version += 1
+        return ('dot', None, self, self.max_hp * (percentage / 100), None, (dot_name, duration))
+
+    def apply_shield(self, shield_type, duration, element=None, reduction=0):
+        clock = self.clock
+        self.shield = record = Shield(shield_type, (clock.now if clock else 0) + (duration if duration > 1 else 1),
+                                      element, reduction)
+        if clock:
+            clock.incoming.append((self, None, record))
+        self.version += 1
+
+    def process_dot(self):
+        total_dot_damage = 0
+        events = []
+        for debuff in self.debuffs.values():
+            if debuff.percentage:
+                dot_damage = self.max_hp * (debuff.percentage / 100)
+                self.current_hp -= dot_damage
+                total_dot_damage += dot_damage
+                self.total_damage_taken += dot_damage
+        if total_dot_damage > 0:
+            self.version += 1
+            events.append(('dot damage', None, self, total_dot_damage, self.current_hp, None))
+        return events
+
+    def tick_effects(self, expired):
+        # this enemy's share of one effect tick: running DoTs deal damage, then the
+        # `expired` (enemy, name, record) entries end (name None is the shield), Toxic
+        # Spores going off last so it hits whatever shield/defense is left afterwards
+        events = self.process_dot()
+        if not expired:
+            return events
+        self.version += 1
+        detonate = False
+        for _, name, record in expired:
+            if name is None:
+                self.shield = None
+                continue
+            del self.debuffs[name]
+            if name == "Freeze":
+                self.is_frozen = False
+            if name == "Petrify":
+                self.is_petrified = False
+            if name == "Toxic Spores":
+                detonate = True
+        if detonate:
+            events.append(self.calculate_damage(self.max_hp * 0.05, source="Toxic Spores"))
+            events.append(_note("Toxic Spores exploded!"))
+        return events
+
+    def apply_heal(self, percentage):
+        heal_amount = self.max_hp * (percentage / 100)
+        self.current_hp = min(self.max_hp, self.current_hp + heal_amount)
+        self.version += 1
+        return ('heal', None, self, heal_amount, self.current_hp, None)
+
+
+
+# What an enemy sees of its fight's EffectScheduler: the tick count, and an inbox for
+# effects applied since the last tick. Enemies never point at the scheduler itself, so
+# a finished fight has no reference cycles and is freed without waiting for the gc.
+class EffectClock:
+    __slots__ = ('now', 'incoming')
+
+    def __init__(self, now=0):
+        self.now = now  # ticks done so far
+        self.incoming = []  # (enemy, name, record) applied since the last tick, name None is the shield
+
+# Effect timers of one fight, counted in effect ticks: every player attack ends with one
+# tick. Expiries and delayed triggers go in a timer wheel (tick -> entries due on it;
+# durations are a few ticks, so it stays tiny) and enemies with a DoT running are kept in
+# `burning`, so a tick only touches what is due instead of walking every debuff of every enemy.
+class EffectScheduler:
+    def __init__(self):
+        self.clock = EffectClock()
+        self.wheel = {}  # tick -> [(enemy, name, record), ...] running out on it
+        self.burning = {}  # enemies with a DoT running, as an insertion-ordered set
+
+    @property
+    def now(self):
+        return self.clock.now
+
+    def _schedule(self, enemy, name, record):
+        slot = self.wheel.get(record.expires)
+        if slot is None:
+            self.wheel[record.expires] = [(enemy, name, record)]
+        else:
+            slot.append((enemy, name, record))
+        if name is not None and record.percentage:
+            self.burning[enemy] = None
+
+    def adopt(self, enemy):
+        # move an enemy, with whatever effects it already has running, onto this clock
+        offset = self.clock.now - (enemy.clock.now if enemy.clock is not None else 0)
+        enemy.clock = self.clock
+        for name, record in enemy.debuffs.items():
+            record.expires += offset
+            self._schedule(enemy, name, record)
+        if enemy.shield:
+            enemy.shield.expires += offset
+            self._schedule(enemy, None, enemy.shield)
+
+    def rebuild(self, now, enemies):
+        # timers from scratch for `enemies` at tick `now`, out of the records they hold
+        # (undo puts whole fights back, effects included)
+        clock = self.clock
+        clock.now = now
+        clock.incoming.clear()
+        self.wheel = {}
+        self.burning = {}
+        for enemy in enemies:
+            enemy.clock = clock
+            for name, record in enemy.debuffs.items():
+                self._schedule(enemy, name, record)
+            if enemy.shield:
+                self._schedule(enemy, None, enemy.shield)
+
+    def forget(self, enemy):
+        # a defeated enemy; its wheel entries are skipped by the caller when they come up
+        self.burning.pop(enemy, None)
+
+    def advance(self):
+        # one tick: enemy -> its (enemy, name, record) entries that ran out, for every
+        # enemy something is due on (a running DoT counts, with possibly nothing expiring)
+        clock = self.clock
+        clock.now += 1
+        now = clock.now
+        wheel = self.wheel
+        burning = self.burning
+        entries = wheel.pop(now, None)
+        if clock.incoming:
+            # most effects last a single turn, those go straight to this tick
+            for entry in clock.incoming:
+                expires = entry[2].expires
+                if expires == now:
+                    if entries is None:
+                        entries = [entry]
+                    else:
+                        entries.append(entry)
+                else:
+                    slot = wheel.get(expires)
+                    if slot is None:
+                        wheel[expires] = [entry]
+                    else:
+                        slot.append(entry)
+                if entry[1] is not None and entry[2].percentage:
+                    burning[entry[0]] = None
+            clock.incoming.clear()
+        if entries is None:
+            return dict.fromkeys(burning, ()) if burning else {}
+        due = dict.fromkeys(burning, ())
+        dots_ended = None
+        for entry in entries:
+            enemy, name, record = entry
+            # entries of replaced records or of enemies moved to another fight are stale
+            current = enemy.shield if name is None else enemy.debuffs.get(name)
+            if current is record and enemy.clock is clock:
+                expired = due.get(enemy)
+                if expired:
+                    expired.append(entry)
+                else:
+                    due[enemy] = [entry]
+                if name is not None and record.percentage:
+                    dots_ended = dots_ended or []
+                    dots_ended.append(enemy)
+        if dots_ended:
+            for enemy in dots_ended:
+                if not any(debuff.percentage and debuff.expires > now for debuff in enemy.debuffs.values()):
+                    burning.pop(enemy, None)
+        return due
+
+def player_heal(player, percentage):
+    heal_amount = player.max_hp * (percentage / 100)
+    player.current_hp = min(player.max_hp, player.current_hp + heal_amount)
+    player.version += 1
+    return ('heal', None, player, heal_amount, player.current_hp, None)
+
+def roll_damage(selected_dice=None, dice_quantity=None, damage_override=None, rng=random):
+    # override wins, then dice, otherwise 1
+    if damage_override is not None:
+        return damage_override
+    if selected_dice and dice_quantity is not None:
+        base_damage = 0
+        for _ in range(dice_quantity):
+            base_damage += rng.randint(1, selected_dice)
+        return base_damage
+    return 1
+
+def default_enemies(rng=random):
+    # hardcoded tests
+    return [
+        Enemy("Harin", 120, defense=0, initiative=rng.randint(1, 20)),
+        Enemy("Sigurd", 300, defense=10, initiative=rng.randint(1, 20)),
+    ]
+
+
+# =======================================================================
+#                     Reaction lookup and handlers
+# =======================================================================
+
+# Each handler gets (encounter, player, target_enemy, base_damage, reaction) and applies
+# everything except the element removal, which calculate_elemental_reaction does after.
+def _damage_target(encounter, player, target_enemy, base_damage, reaction):
+    encounter.events.append(target_enemy.calculate_damage(base_damage, reaction.multiplier))
+
+def _freeze(encounter, player, target_enemy, base_damage, reaction):
+    event = target_enemy.apply_debuff("Freeze", 1)
+    target_enemy.is_frozen = True
+    encounter.events.append(event)
+
+def _superconduct(encounter, player, target_enemy, base_damage, reaction):
+    encounter.events.append(target_enemy.apply_debuff("Superconduct", 1))
+    encounter.events.append(target_enemy.calculate_damage(base_damage, reaction.multiplier))
+
+def _electro_charged(encounter, player, target_enemy, base_damage, reaction):
+    encounter.area_damage(base_damage, reaction.multiplier, attack_element=reaction.attack_element,
+                          label=reaction.name)
+    encounter.events.append(_note("Damage applied to all targets."))
+
+def _swirl(encounter, player, target_enemy, base_damage, reaction):
+    encounter.area_swirl(target_enemy.element_mask & ~element_bits['Anemo'])
+    encounter.events.append(_note("Swirl reaction applied."))
+
+def _crystallize(encounter, player, target_enemy, base_damage, reaction):
+    # the shield blocks the most recently applied non-Geo element
+    element = target_enemy.newest_element(excluding='Geo')
+    if element:
+        target_enemy.apply_shield('Elemental Immunity', 1, element=element)
+    encounter.events.append(('shield', None, target_enemy, None, None, 'Elemental Immunity'))
+
+def _stabilize(encounter, player, target_enemy, base_damage, reaction):
+    target_enemy.apply_shield('Damage Reduction', 2, reduction=0.3)
+    encounter.events.append(('shield', None, target_enemy, None, None, 'Damage Reduction'))
+
+def _petrify(encounter, player, target_enemy, base_damage, reaction):
+    event = target_enemy.apply_debuff("Petrify", 1)
+    target_enemy.is_petrified = True
+    encounter.events.append(event)
+
+def _overload(encounter, player, target_enemy, base_damage, reaction):
+    encounter.events.append(target_enemy.apply_debuff("Disarmed", 1))
+
+# DoT reactions: (% of max HP per tick, duration)
+dot_reactions = {
+    "Burning": (3, 3),
+    "Corrosion": (5, 2),
+    "Frostbite": (3, 3),
+}
+
+def _apply_dot_reaction(encounter, target_enemy, reaction):
+    percentage, duration = dot_reactions[reaction.name]
+    encounter.events.append(target_enemy.apply_dot(percentage, duration, reaction.name))
+
+def _burning(encounter, player, target_enemy, base_damage, reaction):
+    _apply_dot_reaction(encounter, target_enemy, reaction)
+
+def _corrosion(encounter, player, target_enemy, base_damage, reaction):
+    _apply_dot_reaction(encounter, target_enemy, reaction)
+
+def _frostbite(encounter, player, target_enemy, base_damage, reaction):
+    _apply_dot_reaction(encounter, target_enemy, reaction)
+    encounter.events.append(target_enemy.apply_debuff("Movement Speed Reduction", 3))
+
+def _bloom(encounter, player, target_enemy, base_damage, reaction):
+    encounter.events.append(target_enemy.apply_heal(25))
+
+def _healing_winds(encounter, player, target_enemy, base_damage, reaction):
+    for ally in encounter.players:
+        encounter.events.append(player_heal(ally, 20))
+    encounter.events.append(_note("Healing Winds heals all players."))
+
+def _toxic_spores(encounter, player, target_enemy, base_damage, reaction):
+    target_enemy.apply_debuff("Toxic Spores", 3) # time delay for spores, goes off in tick_effects
+    encounter.events.append(_note("Toxic Spores applied to target."))
+
+def _sandstorm(encounter, player, target_enemy, base_damage, reaction):
+    encounter.area_debuff("Disadvantage", 1)
+    encounter.events.append(_note("Sandstorm affects all enemies."))
+
+def _thunderstorm(encounter, player, target_enemy, base_damage, reaction):
+    encounter.area_damage(player.max_hp * 0.4, attack_element='Electro', label=reaction.name)
+    encounter.events.append(_note("Thunderstorm strikes all enemies."))
+
+# reactions that damage every enemy, not just the target
+aoe_reactions = ("Electro-charged", "Thunderstorm")
+
+reaction_handlers = {
+    "Melt": _damage_target,
+    "Vaporize": _damage_target,
+    "Freeze": _freeze,
+    "Superconduct": _superconduct,
+    "Electro-charged": _electro_charged,
+    "Swirl": _swirl,
+    "Crystallize": _crystallize,
+    "Stabilize": _stabilize,
+    "Petrify": _petrify,
+    "Overload": _overload,
+    "Burning": _burning,
+    "Corrosion": _corrosion,
+    "Frostbite": _frostbite,
+    "Bloom": _bloom,
+    "Healing Winds": _healing_winds,
+    "Toxic Spores": _toxic_spores,
+    "Sandstorm": _sandstorm,
+    "Thunderstorm": _thunderstorm,
+}
+
+# A reaction resolved for one element set: everything calculate_elemental_reaction needs
+class Reaction:
+    def __init__(self, name, multiplier, description, elements_to_remove, attack_element, elements):
+        self.name = name
+        self.multiplier = multiplier
+        self.description = description
+        self.elements_to_remove = elements_to_remove
+        self.remove_mask = ALL_ELEMENTS if elements_to_remove == ['ALL'] else element_mask(elements_to_remove)
+        self.attack_element = attack_element
+        self.elements = element_mask(elements)  # the elements that formed it
+        self.handler = reaction_handlers.get(name, _damage_target)
+        self.hits_all = name in aoe_reactions
+
+    def __reduce__(self):
+        # rules, not fight state: copied and pickled fights share the table's reactions
+        return (resolved_reaction, (self.index,))
+
+def build_reaction_table():
+    # every element set -> first matching entry of `reactions`, so triples still beat pairs
+    table = [None] * (ALL_ELEMENTS + 1)
+    resolved = [Reaction(*effect, element_combination) for element_combination, effect in reactions]
+    for index, reaction in enumerate(resolved):
+        reaction.index = index  # its place in `reactions`, how a pickle names it
+    resolved_reactions[:] = resolved
+    for mask in range(ALL_ELEMENTS + 1):
+        for reaction in resolved:
+            if reaction.elements & mask == reaction.elements:
+                table[mask] = reaction
+                break
+    return table
+
+resolved_reactions = []
+reaction_table = build_reaction_table()
+
+def resolved_reaction(index):
+    return resolved_reactions[index]
+
+def predict_reaction(target_enemy, element):
+    # the reaction an attack of `element` on `target_enemy` would trigger, or None
+    return reaction_table[target_enemy.element_mask | target_enemy.swirled_mask | element_bits[element]]
+
+
+# =======================================================================
+#                               Initiative
+# =======================================================================
+
+class Turn:
+    __slots__ = ('actor', 'key', 'prev', 'next')
+
+    def __init__(self, actor, key):
+        self.actor = actor
+        self.key = key
+        self.prev = self.next = self  # next is None once the actor has left the order
+
+
+class InitiativeOrder:
+    # combatants by initiative, highest first, ties going to whoever joined first. The
+    # turns form a circular linked list, so advancing and dropping out are O(1) and the
+    # cursor never needs fixing up. A newcomer has the latest join of all, so it goes
+    # right after the last turn of its initiative: `tails` keeps that turn for every
+    # initiative in the order, and only a newcomer with an initiative nobody has yet
+    # bisects the sorted list of those (a d20's worth, however big the fight).
+    def __init__(self, combatants=()):
+        self.first = None  # the turn every round starts with
+        self.turns = {}  # combatant -> its Turn
+        self.tails = {}  # -initiative -> the last turn with it
+        self.scores = []  # the keys of tails, sorted
+        self.cursor = None
+        self.resume = None  # once the cursor's actor has left: the turn due next, None for a new round
+        order = [Turn(combatant, (-combatant.initiative, joined)) for joined, combatant in enumerate(combatants, 1)]
+        order.sort(key=lambda turn: turn.key)
+        for turn in order:
+            self._place(turn)
+        self.joined = len(order)
+        self.cursor = self.first
+
+    def _key(self, combatant):
+        self.joined += 1
+        return (-combatant.initiative, self.joined)
+
+    def _place(self, turn):
+        # link `turn` in after every turn with a smaller key; no turn of its initiative
+        # may have a larger one
+        score = turn.key[0]
+        after = self.tails.get(score)
+        if after is None:
+            index = bisect.bisect_left(self.scores, score)
+            self.scores.insert(index, score)
+            if index:
+                after = self.tails[self.scores[index - 1]]
+        self.tails[score] = turn
+        self.turns[turn.actor] = turn
+        first = self.first
+        if first is None:
+            turn.prev = turn.next = turn
+            self.first = turn
+            return
+        if after is None:
+            # ahead of everyone, so it starts the round
+            after = first.prev
+            self.first = turn
+        turn.prev, turn.next = after, after.next
+        after.next.prev = turn
+        after.next = turn
+
+    @property
+    def order(self):
+        # the live turns, by key
+        order = []
+        turn = self.first
+        for _ in range(len(self.turns)):
+            order.append(turn)
+            turn = turn.next
+        return order
+
+    # copied and pickled as a flat list, walking the linked turns would recurse once per turn
+    def __getstate__(self):
+        cursor = self.cursor
+        return {
+            'turns': [(turn.actor, turn.key) for turn in self.order],
+            'joined': self.joined,
+            'cursor': None if cursor is None else (cursor.actor, cursor.key, cursor.next is not None),
+        }
+
+    def __setstate__(self, state):
+        self.__init__()
+        for actor, key in state['turns']:
+            self._place(Turn(actor, key))
+        self.joined = state['joined']
+        if state['cursor'] is not None:
+            actor, key, live = state['cursor']
+            if live:
+                self.cursor = self.turns[actor]
+            else:
+                self.cursor = Turn(actor, key)
+                self.cursor.next = None
+                self.resume = next((turn for turn in self.order if turn.key > key), None)
+
+    def __len__(self):
+        return len(self.turns)
+
+    def __contains__(self, combatant):
+        return combatant in self.turns
+
+    def __iter__(self):
+        return (turn.actor for turn in self.order)
+
+    @property
+    def current(self):
+        # a combatant dropping out on its own turn stays current until the turn advances
+        return self.cursor.actor if self.cursor is not None else None
+
+    def seek(self, combatant):
+        self.cursor = self.turns[combatant]
+        self.resume = None
+
+    def insert(self, combatant):
+        # a summon or reinforcement takes its place in the order; if that is ahead of the
+        # cursor it first acts next round
+        turn = Turn(combatant, self._key(combatant))
+        self._place(turn)
+        cursor = self.cursor
+        if cursor is None:
+            self.cursor = turn
+        elif cursor.next is None and turn.key > cursor.key and (self.resume is None or turn.key < self.resume.key):
+            self.resume = turn
+
+    def discard(self, combatant):
+        turn = self.turns.pop(combatant, None)
+        if turn is None:
+            return
+        score = turn.key[0]
+        if self.tails[score] is turn:
+            if turn.prev.key[0] == score and turn.prev is not turn:
+                self.tails[score] = turn.prev
+            else:
+                del self.tails[score]
+                del self.scores[bisect.bisect_left(self.scores, score)]
+        following = turn.next
+        turn.next = None
+        if following is turn:
+            self.first = self.cursor = self.resume = None
+            return
+        turn.prev.next = following
+        following.prev = turn.prev
+        if self.first is turn:
+            self.first = following
+        if turn is self.cursor or turn is self.resume:
+            # whoever follows is due next, unless that comes round again
+            self.resume = following if following.key > turn.key else None
+
+    def advance(self):
+        # move to the next actor; True when that wraps around into a new round
+        following = self.cursor.next
+        if following is None:
+            # the current actor left mid-turn: the next one is whoever now follows its key
+            resume = self.resume
+            self.cursor = resume if resume is not None else self.first
+            self.resume = None
+            return resume is None
+        self.cursor = following
+        return following is self.first
+
+
+# =======================================================================
+#                               Encounter
+# =======================================================================
+
+# Holds everything a fight needs so it can run without the UI (scripts, workers, sims)
+class Encounter:
+    def __init__(self, players, enemies, enemy_damage=10, rng=random, history=1000, enemy_policy=None):
+        self.players = list(players)
+        self.enemies = list(enemies)
+        self.enemy_damage = enemy_damage  # flat damage every enemy attack deals
+        self.rng = rng
+        self.enemy_policy = enemy_policy  # whom enemies attack (see tactics.py), None for a random player
+        self.events = []  # what the last action did, see format_event
+        self.history = EventLog(history)  # the events of earlier actions too; 0 keeps none
+        # create turn order from initiative
+        self.initiative = InitiativeOrder(self.players + self.enemies)
+        self.round_number = 1
+        # debuff/DoT/shield timers of every enemy, ticked once at the end of each attack
+        self.effects = EffectScheduler()
+        for enemy in self.enemies:
+            self.effects.adopt(enemy)
+        # living enemy -> its place in self.enemies, so ticks can keep that order cheaply
+        self.enemy_rank = {enemy: rank for rank, enemy in enumerate(self.enemies)}
+        self.fallen = []  # enemies the last area reaction brought to 0 HP
+
+    @property
+    def log_messages(self):
+        # the last action as text, formatted on the spot
+        return [format_event(event) for event in self.events]
+
+    def current_actor(self):
+        return self.initiative.current
+
+    def add_enemy(self, enemy):
+        # a summon or reinforcement joining mid-fight
+        self.enemy_rank[enemy] = self.enemy_rank[self.enemies[-1]] + 1 if self.enemies else 0
+        self.enemies.append(enemy)
+        self.effects.adopt(enemy)
+        self.initiative.insert(enemy)
+
+    def is_over(self):
+        return not self.players or not self.enemies
+
+    def start(self):
+        # enemies that rolled higher initiative than every player go first
+        if self.initiative and not self.is_over():
+            self._play_enemy_turns()
+        self.history.extend(self.events)
+
+    def attack(self, actor, target, damage):
+        # the hot path of every simulation: what a method call per step would cost is done
+        # inline here, the rarer cases still go through the methods that spell them out
+        events = self.events
+        events.clear()
+        if actor.type != 'Player':
+            return
+        if not self.enemies:
+            events.append(_note("No enemies to attack."))
+        else:
+            # apply player's element to the enemy (Enemy.apply_element)
+            element = actor.element
+            bit, code = element_bit_codes[element]
+            if target.element_mask & bit:
+                events.append(('element held', None, target, None, None, element))
+            else:
+                target.element_mask |= bit
+                target.element_order = (target.element_order << ELEMENT_CODE_BITS) | code
+                target.version += 1
+                events.append(('element', None, target, None, None, element))
+            actor.actions_taken += 1
+            actor.total_damage_dealt += damage
+            self.calculate_elemental_reaction(actor, target, damage)
+            # check_enemy_defeat has nothing to do for a living target with enemies left
+            if target.current_hp <= 0 or not self.enemies:
+                self.check_enemy_defeat(target)
+            self.advance()
+        history = self.history
+        if history.events.maxlen:
+            history.events.extend(events)
+        history.appended += len(events)
+
+    def calculate_elemental_reaction(self, player, target_enemy, base_damage):
+        events = self.events
+        # one lookup instead of scanning `reactions`, the table already has the priority baked in
+        reaction = reaction_table[target_enemy.element_mask | target_enemy.swirled_mask | element_bits[player.element]]
+        self.fallen = fallen = []
+
+        if reaction:
+            events.append(('reaction', player, target_enemy, None, None, reaction))
+            events.append(('reaction effect', player, target_enemy, None, None, reaction))
+            reaction.handler(self, player, target_enemy, base_damage, reaction)
+
+            if reaction.remove_mask == ALL_ELEMENTS:
+                target_enemy.element_mask = target_enemy.element_order = target_enemy.swirled_mask = 0
+                target_enemy.version += 1
+            else:
+                target_enemy.remove_elements(reaction.remove_mask)
+            if reaction.hits_all:
+                # an area reaction already knows which enemies it brought down
+                self._tick_effects(fallen)
+                return
+        else:
+            events.append(target_enemy.calculate_damage(base_damage))
+
+        effects = self.effects
+        clock = effects.clock
+        if clock.incoming or effects.burning or clock.now + 1 in effects.wheel:
+            self._tick_effects([target_enemy])
+        else:
+            # the usual tick, nothing running and nothing due: only the target needs a
+            # defeat check, and only once it is down (see attack)
+            clock.now += 1
+            if target_enemy.current_hp <= 0 and target_enemy in self.enemy_rank:
+                self.check_enemy_defeat(target_enemy)
+
+    # ------------------------------------------------------------- area effects
+
+    # One operation on every enemy in a single pass, for reactions that reach them all:
+    # no per-enemy method calls or events, one aggregated event instead. Per target it
+    # does exactly what Enemy.calculate_damage / apply_debuff / swirling one enemy would.
+
+    def area_damage(self, base_damage, multiplier=1.0, attack_element=None, label=None):
+        # defense (halved under Superconduct), damage reduction and elemental immunity per
+        # target; enemies brought to 0 HP go in self.fallen for the defeat checks
+        targets = self.enemies[:]
+        damages = []
+        fallen = self.fallen
+        raw = base_damage * multiplier
+        total = 0
+        for enemy in targets:
+            defense = enemy.defense
+            if "Superconduct" in enemy.debuffs:
+                defense *= 0.5
+            damage = raw - defense
+            shield = enemy.shield
+            if shield:
+                if shield.type == 'Damage Reduction':
+                    damage *= (1 - shield.reduction)
+                elif shield.type == 'Elemental Immunity' and attack_element == shield.element:
+                    damages.append(None)
+                    continue
+            if damage < 0:
+                damage = 0
+            enemy.current_hp -= damage
+            enemy.version += 1
+            enemy.total_damage_taken += damage
+            total += damage
+            damages.append(damage)
+            if enemy.current_hp <= 0:
+                fallen.append(enemy)
+        self.events.append(('area damage', None, None, total, None, (label, targets, damages)))
+
+    def area_swirl(self, mask):
+        # swirl `mask` onto every enemy that does not have all of it yet
+        for enemy in self.enemies:
+            if mask & ~enemy.swirled_mask:
+                enemy.swirled_mask |= mask
+                enemy.version += 1
+
+    def area_debuff(self, name, duration):
+        clock = self.effects.clock
+        expires = clock.now + (duration if duration > 1 else 1)
+        incoming = clock.incoming
+        targets = self.enemies[:]
+        for enemy in targets:
+            enemy.debuffs[name] = record = Debuff(expires)
+            incoming.append((enemy, name, record))
+            enemy.version += 1
+        self.events.append(('area debuff', None, None, duration, None, (name, targets)))
+
+    def _tick_effects(self, struck):
+        # the end-of-attack effect tick, then defeat checks for every enemy the tick or
+        # the attack (`struck`) could have hurt, in self.enemies order
+        due = self.effects.advance()
+        rank = self.enemy_rank
+        if not due:
+            # the usual case, nothing running out: `struck` is already in order
+            for enemy in struck:
+                if enemy in rank:
+                    self.check_enemy_defeat(enemy)
+            return
+        touched = [enemy for enemy in due if enemy in rank]
+        for enemy in struck:
+            if enemy in rank and enemy not in due:
+                touched.append(enemy)
+        if len(touched) > 1:
+            touched.sort(key=rank.__getitem__)
+        for enemy in touched:
+            expired = due.get(enemy)
+            if expired is not None:
+                self.events.extend(enemy.tick_effects(expired))
+            self.check_enemy_defeat(enemy)
+
+    def check_enemy_defeat(self, enemy):
+        if enemy.current_hp <= 0:
+            if enemy in self.enemies:
+                self.enemies.remove(enemy)
+                del self.enemy_rank[enemy]
+                self.effects.forget(enemy)
+            self.initiative.discard(enemy)
+            self.events.append(('defeated', None, enemy, None, None, None))
+        if not self.enemies:
+            self.events.append(_note("All enemies have been defeated!"))
+
+    def enemies_turn(self, enemy):
+        if enemy.is_frozen or enemy.is_petrified:
+            self.events.append(('unable', enemy, None, None, None, None))
+            return
+        enemy.actions_taken += 1
+        enemy_damage = self.enemy_damage
+        if not self.players:
+            return
+        if self.enemy_policy is None:
+            target_player = self.rng.choice(self.players)
+        else:
+            target_player = self.enemy_policy.choose(self, enemy)
+        target_player.current_hp -= enemy_damage
+        target_player.version += 1
+        target_player.total_damage_taken += enemy_damage
+        enemy.total_damage_dealt += enemy_damage
+        self.events.append(('attack', enemy, target_player, enemy_damage, target_player.current_hp, None))
+        if target_player.current_hp <= 0:
+            self.events.append(('defeated', enemy, target_player, None, None, None))
+            self.players.remove(target_player)
+            self.initiative.discard(target_player)
+            if not self.players:
+                self.events.append(_note("All players have been defeated! Game Over."))
+
+    def advance(self):
+        initiative = self.initiative
+        if not initiative.turns:
+            return
+        if initiative.advance():
+            self.round_number += 1
+        if initiative.cursor.actor.type == 'Enemy':
+            self._play_enemy_turns()
+
+    def _play_enemy_turns(self):
+        initiative = self.initiative
+        while initiative.cursor.actor.type == 'Enemy':
+            self.enemies_turn(initiative.cursor.actor)
+            for player in self.players[:]:
+                if player.current_hp <= 0:
+                    self.players.remove(player)
+                    initiative.discard(player)
+            if not self.players or not self.enemies or not initiative.turns:
+                break
+            if initiative.advance():
+                self.round_number += 1
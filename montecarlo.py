@@ -0,0 +1,308 @@
+import argparse
+import os
+import random
+import sys
+import time
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+
+from engine import Player, Enemy, Encounter, default_enemies
+from dice import damage_sampler
+from analytics import BattleAnalytics
+from roster import Roster, _PlayerUnpickler
+from tactics import parse_policy
+
+
+# =======================================================================
+#              Monte Carlo fights (runs the real engine rules)
+# =======================================================================
+# run_fight plays one fight through Encounter.attack. Even with the attack path inlined
+# that is a few microseconds an attack plus ~30 to set the fight up: ~15k two-enemy
+# fights/s per core for two players, ~3k for four (~56 attacks a fight), so simulate
+# hands plain fights (random targets, no analytics or enemy policy) to batch.py, which
+# plays the same rules in lockstep over a whole chunk at once: ~50k fights/s per core
+# for the party of four, ~35k for seven. lockstep=False keeps every fight in the engine.
+
+HP_BUCKETS = 10  # remaining HP is tracked in 10% buckets
+OBJECT_CHUNK = 2000  # fights per job through run_fight
+LOCKSTEP_CHUNK = 16384  # fights per job in lockstep, numpy wants big batches
+
+
+class SimulationResult:
+    def __init__(self):
+        self.fights = 0
+        self.wins = 0
+        self.losses = 0
+        self.draws = 0  # hit the action cap
+        self.rounds = Counter()  # rounds needed to kill every enemy (wins only)
+        self.hp_remaining = {}  # combatant name -> Counter of HP buckets
+        self.cpu_seconds = 0.0
+        self.analytics = None  # BattleAnalytics of every fight, when asked for
+        self.lockstep = False  # played by batch.py rather than one Encounter a fight
+
+    def add_fight(self, encounter, combatants, finished):
+        self.fights += 1
+        if not encounter.enemies:
+            self.wins += 1
+            self.rounds[encounter.round_number] += 1
+        elif not encounter.players:
+            self.losses += 1
+        elif not finished:
+            self.draws += 1
+        for combatant in combatants:
+            bucket = int(HP_BUCKETS * max(combatant.current_hp, 0) / combatant.max_hp) if combatant.max_hp else 0
+            self.hp_remaining.setdefault(combatant.name, Counter())[min(bucket, HP_BUCKETS)] += 1
+
+    def merge(self, other):
+        self.fights += other.fights
+        self.wins += other.wins
+        self.losses += other.losses
+        self.draws += other.draws
+        self.rounds.update(other.rounds)
+        for name, buckets in other.hp_remaining.items():
+            self.hp_remaining.setdefault(name, Counter()).update(buckets)
+        self.cpu_seconds += other.cpu_seconds
+        if other.analytics is not None:
+            self.analytics = other.analytics if self.analytics is None else self.analytics.merge(other.analytics)
+        return self
+
+    def win_rate(self):
+        return self.wins / self.fights if self.fights else 0.0
+
+    def mean_rounds(self):
+        total = sum(self.rounds.values())
+        if not total:
+            return 0.0
+        return sum(rounds * count for rounds, count in self.rounds.items()) / total
+
+    def rounds_percentile(self, q):
+        total = sum(self.rounds.values())
+        if not total:
+            return 0
+        seen = 0
+        for rounds in sorted(self.rounds):
+            seen += self.rounds[rounds]
+            if seen >= q * total:
+                return rounds
+        return max(self.rounds)
+
+    def mean_hp_fraction(self, name):
+        buckets = self.hp_remaining.get(name)
+        if not buckets:
+            return 0.0
+        return sum(bucket * count for bucket, count in buckets.items()) / (HP_BUCKETS * sum(buckets.values()))
+
+    def fights_per_cpu_second(self):
+        return self.fights / self.cpu_seconds if self.cpu_seconds else 0.0
+
+
+INITIATIVE_DIE = 20  # sides of the initiative roll
+
+def copy_player(player):
+    return Player(player.name, player.max_hp, player.ac, player.movement, player.initiative, player.element, player.temp_hp)
+
+def copy_enemy(enemy, rng):
+    # enemies roll initiative fresh every fight, same as the hardcoded list
+    return Enemy(enemy.name, enemy.max_hp, defense=enemy.defense, elements_applied=enemy.elements,
+                 initiative=rng.randint(1, INITIATIVE_DIE))
+
+def run_fight(party, enemy_templates, rng, dice=(8, 3), damage_override=None, enemy_damage=10,
+              max_actions=500, reroll_initiative=False, analytics=None, enemy_policy=None):
+    players = [copy_player(player) for player in party]
+    if reroll_initiative:
+        for player in players:
+            player.initiative = rng.randint(1, 20)
+    enemies = [copy_enemy(enemy, rng) for enemy in enemy_templates]
+    if enemy_policy is not None:
+        enemy_policy.dice = (*dice, damage_override)
+    roll = damage_sampler(*dice, damage_override)
+    encounter = Encounter(players, enemies, enemy_damage=enemy_damage, rng=rng, history=0, enemy_policy=enemy_policy)
+    encounter.start()
+    # players pick a random living enemy, like clicking a card. The loop is the hot path of
+    # every simulation: locals only, and a separate copy for the analytics run
+    attack = encounter.attack
+    initiative = encounter.initiative
+    alive = encounter.enemies  # the same list for the whole fight, attacks remove the dead from it
+    party_left = encounter.players
+    random_draw = rng.random
+    actions = 0
+    if analytics is None:
+        while party_left and alive and actions < max_actions:
+            attack(initiative.current, alive[int(random_draw() * len(alive))], roll(rng))
+            actions += 1
+    else:
+        analytics.observe(None, encounter.events, encounter.round_number)
+        while party_left and alive and actions < max_actions:
+            actor, round_number = initiative.current, encounter.round_number
+            attack(actor, alive[int(random_draw() * len(alive))], roll(rng))
+            analytics.observe(actor, encounter.events, round_number)
+            actions += 1
+    if analytics is not None:
+        analytics.end_battle(encounter)
+    return encounter, players + enemies, encounter.is_over()
+
+def lockstep_plays(options):
+    # whether batch.py can play fights with these run_fight options: it has no analytics
+    # and its enemies always hit a random player
+    return not options.get('analytics') and options.get('enemy_policy') is None
+
+def _run_chunk(job):
+    party, enemy_templates, fights, seed, options, lockstep = job
+    if lockstep:
+        from batch import simulate_batch  # numpy, and batch imports this module
+        options = {key: value for key, value in options.items() if key not in ('analytics', 'enemy_policy')}
+        return simulate_batch(party, enemy_templates, fights, batch_size=fights, seed=seed, **options)
+    rng = random.Random(seed)
+    result = SimulationResult()
+    # the job only says whether to collect analytics; each chunk fills its own, merged later
+    options = dict(options, analytics=BattleAnalytics() if options.get('analytics') else None)
+    result.analytics = options['analytics']
+    start = time.process_time()
+    for _ in range(fights):
+        encounter, combatants, finished = run_fight(party, enemy_templates, rng, **options)
+        result.add_fight(encounter, combatants, finished)
+    result.cpu_seconds = time.process_time() - start
+    return result
+
+def simulate(party, enemy_templates=None, fights=100000, workers=None, chunk_size=None, seed=None, lockstep=None,
+             **options):
+    # lockstep None plays in batch.py whatever it can (see lockstep_plays)
+    if enemy_templates is None:
+        enemy_templates = default_enemies()
+    if seed is None:
+        seed = random.randrange(2 ** 32)
+    workers = workers or os.cpu_count() or 1
+    if lockstep is None:
+        lockstep = lockstep_plays(options)
+    elif lockstep and not lockstep_plays(options):
+        raise ValueError("analytics and enemy policies need the object engine (lockstep=False)")
+    if chunk_size is None:
+        # big chunks so each worker only ships back one small result per few thousand
+        # fights, but no fewer than there are workers
+        chunk_size = min(LOCKSTEP_CHUNK, -(-fights // workers)) if lockstep else OBJECT_CHUNK
+    jobs = []
+    remaining = fights
+    chunk_index = 0
+    while remaining > 0:
+        size = min(chunk_size, remaining)
+        jobs.append((party, enemy_templates, size, seed + chunk_index, options, lockstep))
+        remaining -= size
+        chunk_index += 1
+
+    result = SimulationResult()
+    result.lockstep = lockstep
+    if workers == 1:
+        for job in jobs:
+            result.merge(_run_chunk(job))
+        return result
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        for chunk_result in pool.map(_run_chunk, jobs):
+            result.merge(chunk_result)
+    return result
+
+
+# =======================================================================
+#                                  CLI
+# =======================================================================
+
+def parse_player(spec):
+    # NAME:HP:ELEMENT[:INITIATIVE]
+    parts = spec.split(':')
+    if len(parts) not in (3, 4):
+        raise argparse.ArgumentTypeError(f"expected NAME:HP:ELEMENT[:INITIATIVE], got {spec!r}")
+    initiative = int(parts[3]) if len(parts) == 4 else 10
+    return Player(parts[0], int(parts[1]), 0, 0, initiative, parts[2])
+
+def parse_enemy(spec):
+    # NAME:HP[:DEFENSE]
+    parts = spec.split(':')
+    if len(parts) not in (2, 3):
+        raise argparse.ArgumentTypeError(f"expected NAME:HP[:DEFENSE], got {spec!r}")
+    defense = float(parts[2]) if len(parts) == 3 else 0
+    return Enemy(parts[0], int(parts[1]), defense=defense)
+
+def parse_dice(spec):
+    # [QUANTITY]dSIDES as (selected_dice, dice_quantity), the order engine.roll_damage
+    # and dice.damage_pmf take them in; zero dice deal no damage
+    quantity, _, sides = spec.lower().partition('d')
+    quantity, sides = int(quantity or 1), int(sides)
+    if quantity < 0 or sides < 1:
+        raise argparse.ArgumentTypeError(f"expected [QUANTITY]dSIDES with QUANTITY >= 0 and SIDES >= 1, got {spec!r}")
+    return sides, quantity
+
+def load_party(path='roster.db', campaign=''):
+    # the party the menu saved: who's in it in a roster database, or everyone in a
+    # players.pkl from before the roster; [] if there's no such file
+    if not os.path.exists(path):
+        return []
+    if path.endswith('.pkl'):
+        with open(path, 'rb') as f:
+            return _PlayerUnpickler(f).load()
+    roster = Roster(path, campaign)
+    try:
+        return roster.party()
+    finally:
+        roster.close()
+
+def format_report(result, wall_seconds, workers):
+    lines = [
+        f"Fights: {result.fights}  Wins: {result.wins}  Losses: {result.losses}  Unfinished: {result.draws}",
+        f"Win rate: {result.win_rate() * 100:.2f}%",
+        f"Rounds to kill: mean {result.mean_rounds():.2f}, p10 {result.rounds_percentile(0.1)}, "
+        f"median {result.rounds_percentile(0.5)}, p90 {result.rounds_percentile(0.9)}",
+        "HP remaining (mean, 10% buckets 0..100):",
+    ]
+    for name in sorted(result.hp_remaining):
+        buckets = result.hp_remaining[name]
+        histogram = ' '.join(str(buckets.get(bucket, 0)) for bucket in range(HP_BUCKETS + 1))
+        lines.append(f"  {name}: {result.mean_hp_fraction(name) * 100:.1f}%  [{histogram}]")
+    lines.append(f"Throughput: {result.fights / wall_seconds:.0f} fights/s on {workers} worker(s), "
+                 f"{result.fights_per_cpu_second():.0f} fights/s per core "
+                 f"({'lockstep, batch.py' if result.lockstep else 'object engine'})")
+    return '\n'.join(lines)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Monte Carlo fights of a party against an enemy list.")
+    parser.add_argument('-n', '--fights', type=int, default=100000)
+    parser.add_argument('--party', default='roster.db', help="roster saved by the menu, or an old players.pkl")
+    parser.add_argument('--player', type=parse_player, action='append', help="NAME:HP:ELEMENT[:INITIATIVE], overrides --party")
+    parser.add_argument('--enemy', type=parse_enemy, action='append', help="NAME:HP[:DEFENSE], default is Harin/Sigurd")
+    parser.add_argument('--dice', type=parse_dice, default=(8, 3), help="player damage roll, e.g. 3d8")
+    parser.add_argument('--override', type=float, default=None, help="flat player damage instead of dice")
+    parser.add_argument('--enemy-damage', type=float, default=10)
+    parser.add_argument('--enemy-policy', type=parse_policy, default=None,
+                        help="whom enemies attack: random (default), focus, threat or expectimax[:DEPTH[:NODES[:MS]]]")
+    parser.add_argument('--max-actions', type=int, default=500)
+    parser.add_argument('--reroll-initiative', action='store_true')
+    parser.add_argument('--workers', type=int, default=None)
+    parser.add_argument('--chunk-size', type=int, default=None,
+                        help=f"fights per job, default {OBJECT_CHUNK} ({LOCKSTEP_CHUNK} in lockstep)")
+    parser.add_argument('--object-engine', action='store_true',
+                        help="play every fight through engine.Encounter, as --analytics and --enemy-policy do")
+    parser.add_argument('--seed', type=int, default=None)
+    parser.add_argument('--analytics', action='store_true', help="damage and reaction statistics of every fight")
+    parser.add_argument('--charts', metavar='DIR', help="save damage-over-time and reaction charts here "
+                                                        "(implies --analytics)")
+    args = parser.parse_args(argv)
+
+    party = args.player or load_party(args.party)
+    if not party:
+        parser.error(f"no party: nobody in {args.party} and no --player given")
+    workers = args.workers or os.cpu_count() or 1
+
+    start = time.perf_counter()
+    result = simulate(party, args.enemy, fights=args.fights, workers=workers, chunk_size=args.chunk_size,
+                      seed=args.seed, dice=args.dice, damage_override=args.override,
+                      enemy_damage=args.enemy_damage, max_actions=args.max_actions,
+                      reroll_initiative=args.reroll_initiative, analytics=args.analytics or bool(args.charts),
+                      enemy_policy=args.enemy_policy, lockstep=False if args.object_engine else None)
+    print(format_report(result, time.perf_counter() - start, workers))
+    if result.analytics is not None:
+        print(result.analytics.report())
+    if args.charts:
+        for path in result.analytics.save_charts(args.charts):
+            print(f"Saved {path}")
+
+
+if __name__ == '__main__':
+    sys.exit(main())
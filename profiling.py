@@ -0,0 +1,209 @@
+import argparse
+import gc
+import io
+import os
+import sys
+import time
+from collections import deque
+
+perf_counter_ns = time.perf_counter_ns
+
+
+# =======================================================================
+#          Frame timing by phase, and cProfile/tracemalloc captures
+# =======================================================================
+# FrameTimer splits every frame of the game loop into phases with one perf_counter_ns
+# call per boundary: `lap(phase)` charges the time since the previous lap to `phase`,
+# so a phase can be entered several times in a frame (the engine runs in the middle
+# of event handling) and its laps add up. Time spent waiting for input is not part of
+# a frame. The last `frames` frames are kept for percentiles.
+
+def percentile(ordered, q):
+    # nearest rank on an already sorted list
+    if not ordered:
+        return 0
+    return ordered[min(len(ordered) - 1, int(q / 100 * len(ordered)))]
+
+
+class FrameTimer:
+    def __init__(self, frames=600):
+        self.phases = {}  # phase -> deque of ns per frame
+        self.totals = deque(maxlen=frames)  # whole frames, ns
+        self.blocks = deque(maxlen=frames)  # net allocated blocks per frame
+        self.frames = frames
+        self.current = {}
+        self.started = 0
+        self.last = 0
+        self.start_blocks = 0
+        self.start_collections = 0
+        self.collections = 0  # gc runs during timed frames
+
+    def start(self):
+        self.current.clear()
+        self.start_blocks = sys.getallocatedblocks()
+        self.start_collections = sum(stat['collections'] for stat in gc.get_stats())
+        self.started = self.last = perf_counter_ns()
+
+    def lap(self, phase):
+        now = perf_counter_ns()
+        self.current[phase] = self.current.get(phase, 0) + now - self.last
+        self.last = now
+
+    def end(self):
+        self.totals.append(self.last - self.started)
+        self.blocks.append(sys.getallocatedblocks() - self.start_blocks)
+        self.collections += sum(stat['collections'] for stat in gc.get_stats()) - self.start_collections
+        phases = self.phases
+        for phase, elapsed in self.current.items():
+            laps = phases.get(phase)
+            if laps is None:
+                laps = phases[phase] = deque(maxlen=self.frames)
+            laps.append(elapsed)
+        # phases that did not run this frame count as 0, so every deque lines up
+        for phase, laps in phases.items():
+            if phase not in self.current:
+                laps.append(0)
+
+    def summary(self):
+        # overlay lines: frame time percentiles, then p50/p95 of every phase, in ms
+        if not self.totals:
+            return ["No frames timed yet"]
+        totals = sorted(self.totals)
+        blocks = sorted(self.blocks)
+        lines = [f"{len(totals)} frames, ms",
+                 f"p50 {percentile(totals, 50) / 1e6:.2f}  p95 {percentile(totals, 95) / 1e6:.2f}",
+                 f"p99 {percentile(totals, 99) / 1e6:.2f}  max {totals[-1] / 1e6:.2f}"]
+        for phase, laps in self.phases.items():
+            ordered = sorted(laps)
+            lines.append(f"{phase:<8} {percentile(ordered, 50) / 1e6:.2f} / {percentile(ordered, 95) / 1e6:.2f}")
+        lines.append(f"blocks/frame {percentile(blocks, 50):+d} / {percentile(blocks, 95):+d}")
+        lines.append(f"gc runs {self.collections}")
+        return lines
+
+
+class Capture:
+    # a cProfile + tracemalloc recording of a live session, toggled on and off; each
+    # one is dumped as <directory>/capture-<time>.prof (pstats) and .snapshot (tracemalloc)
+    def __init__(self, directory='profiles', frames=25):
+        self.directory = directory
+        self.frames = frames  # traceback depth tracemalloc records
+        self.profile = None
+
+    @property
+    def running(self):
+        return self.profile is not None
+
+    def start(self):
+        # imported here, dndSim imports this module on every start
+        import cProfile
+        import tracemalloc
+        tracemalloc.start(self.frames)
+        self.profile = cProfile.Profile()
+        self.profile.enable()
+
+    def stop(self):
+        # the path the capture was saved under, without extension
+        import tracemalloc
+        self.profile.disable()
+        snapshot = tracemalloc.take_snapshot()
+        tracemalloc.stop()
+        os.makedirs(self.directory, exist_ok=True)
+        base = os.path.join(self.directory, time.strftime('capture-%Y%m%d-%H%M%S'))
+        self.profile.dump_stats(base + '.prof')
+        snapshot.dump(base + '.snapshot')
+        self.profile = None
+        return base
+
+    def toggle(self):
+        if self.running:
+            return self.stop()
+        self.start()
+        return None
+
+
+# =======================================================================
+#                     Startup time, by import and by step
+# =======================================================================
+# `dndSim.py --profile-startup` creates a StartupTimer before its first import. While it
+# watches, every module imported for the first time is timed including what it imports
+# in turn (like `python -X importtime`, nested the same way), and `step(name)` charges
+# the time since the previous step to `name`. Interpreter startup itself is not counted.
+
+class StartupTimer:
+    def __init__(self, started=None):
+        self.started = started if started is not None else perf_counter_ns()
+        self.last = self.started
+        self.steps = []  # (name, ns)
+        self.imports = []  # [depth, module, ns] in the order they started
+        self.depth = 0
+        self.original_import = None
+
+    def watch_imports(self):
+        import builtins
+        original = self.original_import = builtins.__import__
+        imports = self.imports
+
+        def timed_import(name, globals=None, locals=None, fromlist=(), level=0):
+            if level or name in sys.modules:
+                return original(name, globals, locals, fromlist, level)
+            entry = [self.depth, name, 0]
+            imports.append(entry)
+            self.depth += 1
+            start = perf_counter_ns()
+            try:
+                return original(name, globals, locals, fromlist, level)
+            finally:
+                entry[2] = perf_counter_ns() - start
+                self.depth -= 1
+
+        builtins.__import__ = timed_import
+
+    def stop(self):
+        if self.original_import is not None:
+            import builtins
+            builtins.__import__ = self.original_import
+            self.original_import = None
+
+    def step(self, name):
+        now = perf_counter_ns()
+        self.steps.append((name, now - self.last))
+        self.last = now
+
+    def report(self, threshold_ms=1.0, depth=3):
+        lines = ["Startup, ms"]
+        for name, elapsed in self.steps:
+            lines.append(f"  {name:<40}{elapsed / 1e6:>9.1f}")
+        lines.append(f"  {'total':<40}{(self.last - self.started) / 1e6:>9.1f}")
+        lines.append(f"Imports taking {threshold_ms:g} ms or more, including what they import")
+        for level, module, elapsed in self.imports:
+            if level < depth and elapsed >= threshold_ms * 1e6:
+                label = '  ' * (level + 1) + module
+                lines.append(f"{label:<42}{elapsed / 1e6:>9.1f}")
+        return '\n'.join(lines)
+
+
+def report(base, top=20):
+    # the slowest functions and the biggest allocation sites of a saved capture
+    import pstats
+    import tracemalloc
+    out = io.StringIO()
+    stats = pstats.Stats(base + '.prof', stream=out)
+    stats.sort_stats('cumulative').print_stats(top)
+    snapshot = tracemalloc.Snapshot.load(base + '.snapshot')
+    out.write(f"Top {top} allocation sites (still allocated when the capture stopped):\n")
+    for stat in snapshot.statistics('lineno')[:top]:
+        out.write(f"  {stat}\n")
+    return out.getvalue()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Print a capture saved from dndSim.py with F9.")
+    parser.add_argument('capture', help="capture path, with or without .prof/.snapshot")
+    parser.add_argument('--top', type=int, default=20, help="rows of each table")
+    args = parser.parse_args(argv)
+    base = os.path.splitext(args.capture)[0] if args.capture.endswith(('.prof', '.snapshot')) else args.capture
+    print(report(base, args.top))
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,171 @@
+from collections import OrderedDict
+
+import pygame
+
+
+# =======================================================================
+#          Render caches (text surfaces, combatant cards, dirty rects)
+# =======================================================================
+
+class TextCache:
+    # bounded LRU of rendered strings, the UI shows the same few hundred labels every frame
+    def __init__(self, maxsize=1024):
+        self.maxsize = maxsize
+        self.surfaces = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def render(self, font, text, color, antialias=True):
+        # fonts live for the whole program, so their id is a stable key
+        key = (id(font), text, color, antialias)
+        surface = self.surfaces.get(key)
+        if surface is not None:
+            self.surfaces.move_to_end(key)
+            self.hits += 1
+            return surface
+        self.misses += 1
+        surface = font.render(text, antialias, color)
+        self.surfaces[key] = surface
+        if len(self.surfaces) > self.maxsize:
+            self.surfaces.popitem(last=False)
+        return surface
+
+    def clear(self):
+        self.surfaces.clear()
+
+
+class CardCache:
+    # one off-screen Surface per combatant, redrawn only when its key (normally the
+    # combatant's version counter) changes
+    def __init__(self, size, background):
+        self.size = size
+        self.background = background
+        self.cards = {}  # id(combatant) -> (combatant, key, surface)
+        self.redraws = 0
+
+    def get(self, combatant, key, draw):
+        entry = self.cards.get(id(combatant))
+        if entry is not None and entry[0] is combatant and entry[1] == key:
+            return entry[2]
+        surface = entry[2] if entry is not None else pygame.Surface(self.size)
+        surface.fill(self.background)
+        draw(surface, combatant)
+        self.cards[id(combatant)] = (combatant, key, surface)
+        self.redraws += 1
+        return surface
+
+    def prune(self, combatants):
+        # drop cards of combatants that left the fight
+        if len(self.cards) > len(combatants):
+            keep = {id(combatant) for combatant in combatants}
+            for combatant_id in list(self.cards):
+                if combatant_id not in keep:
+                    del self.cards[combatant_id]
+
+
+class DirtyRegions:
+    # remembers what every screen region showed last frame; a region is redrawn only
+    # when its key changes, and only those rects are handed to pygame.display.update
+    def __init__(self):
+        self.keys = {}
+        self.rects = []
+        self.full = True  # first frame (or after invalidate) redraws and flips everything
+
+    def changed(self, region, rect, key):
+        if not self.full and self.keys.get(region, self) == key:
+            return False
+        self.keys[region] = key
+        self.rects.append(pygame.Rect(rect))
+        return True
+
+    def invalidate(self):
+        self.full = True
+
+    def flush(self):
+        if self.full:
+            pygame.display.flip()
+            self.full = False
+        elif self.rects:
+            pygame.display.update(self.rects)
+        self.rects = []
+
+
+# =======================================================================
+#              Virtual grid (scrolling, zoom levels, hit testing)
+# =======================================================================
+
+class VirtualGrid:
+    # `count` equal slots laid out row by row inside a viewport and scrolled vertically.
+    # Only the rows inside the viewport are visited when drawing, and a point maps straight
+    # to the one slot under it (the grid is its own bucket index), so neither drawing nor
+    # clicking depends on how many items there are
+    def __init__(self, viewport, cell, pitch):
+        self.viewport = pygame.Rect(viewport)
+        self.cell = cell  # (w, h) of the clickable part of a slot
+        self.pitch = pitch  # (w, h) from one slot to the next
+        self.scroll = 0  # pixels scrolled down
+        self.count = 0
+
+    @property
+    def columns(self):
+        return max(1, self.viewport.w // self.pitch[0])
+
+    def max_scroll(self):
+        rows = -(-self.count // self.columns)
+        content = rows * self.pitch[1] - (self.pitch[1] - self.cell[1]) if rows else 0
+        return max(0, content - self.viewport.h)
+
+    def set_count(self, count):
+        self.count = count
+        self.scroll = min(self.scroll, self.max_scroll())
+
+    def scroll_by(self, pixels):
+        # True if the view moved
+        scroll = max(0, min(self.scroll + pixels, self.max_scroll()))
+        moved = scroll != self.scroll
+        self.scroll = scroll
+        return moved
+
+    def reshape(self, cell, pitch):
+        # new slot size, keeping the first visible item at the top
+        first = self.visible().start
+        self.cell = cell
+        self.pitch = pitch
+        self.scroll = 0
+        self.scroll_by(first // self.columns * pitch[1])
+
+    def scroll_to(self, index):
+        # scroll just far enough for slot `index` to be fully visible
+        top = index // self.columns * self.pitch[1]
+        if top < self.scroll:
+            return self.scroll_by(top - self.scroll)
+        bottom = top + self.cell[1] - self.viewport.h
+        if bottom > self.scroll:
+            return self.scroll_by(bottom - self.scroll)
+        return False
+
+    def visible(self):
+        # indices of the slots at least partly inside the viewport
+        pitch = self.pitch[1]
+        first_row = self.scroll // pitch
+        last_row = (self.scroll + self.viewport.h - 1) // pitch
+        columns = self.columns
+        return range(min(first_row * columns, self.count), min((last_row + 1) * columns, self.count))
+
+    def slot(self, index):
+        # screen position of slot `index`, top left
+        row, column = divmod(index, self.columns)
+        return (self.viewport.x + column * self.pitch[0], self.viewport.y + row * self.pitch[1] - self.scroll)
+
+    def index_at(self, pos):
+        # the slot under `pos`, None for the gaps between slots and outside the grid
+        if not self.viewport.collidepoint(pos):
+            return None
+        x = pos[0] - self.viewport.x
+        y = pos[1] - self.viewport.y + self.scroll
+        column, x = divmod(x, self.pitch[0])
+        row, y = divmod(y, self.pitch[1])
+        if column >= self.columns or x >= self.cell[0] or y >= self.cell[1]:
+            return None
+        index = row * self.columns + column
+        return index if index < self.count else None
@@ -0,0 +1,230 @@
+import argparse
+import json
+import os
+import pickle
+import random
+import struct
+import sys
+
+from engine import Player, Enemy, Encounter, roll_damage
+from tactics import parse_policy
+
+
+# =======================================================================
+#        Seeded fights, the action journal, and replay with seeking
+# =======================================================================
+# A Fight draws all of its randomness from streams seeded off one number: enemy
+# targeting (`fight`), damage dice (`dice`) and setup such as enemy initiative
+# (`setup`). Separate streams keep a changed dice setting from shifting whom the enemies
+# attack afterwards. Given the seed, the starting combatants and the list of actions,
+# the whole fight can be played again exactly.
+
+def fight_rng(seed, stream):
+    # str seeds hash the same in every process, unlike hash()
+    return random.Random(f"{seed}:{stream}")
+
+
+class Action:
+    # one Attack click: target index into encounter.enemies, the dice settings and the
+    # enemy damage field at that moment
+    __slots__ = ('target', 'dice', 'quantity', 'override', 'enemy_damage')
+
+    # kind, flags, target, dice sides, quantity, override, enemy damage
+    RECORD = struct.Struct('<BBHHHdd')
+    FIELD_MAX = 0xFFFF  # target, dice sides and quantity are unsigned 16-bit fields
+    ATTACK = 1
+    HAS_QUANTITY = 1
+    HAS_OVERRIDE = 2
+
+    def __init__(self, target, dice=None, quantity=None, override=None, enemy_damage=10):
+        # ValueError for what a record can't hold, before anything is played or written
+        for name, value in (('target', target), ('dice', dice), ('quantity', quantity)):
+            if value is not None and not 0 <= value <= self.FIELD_MAX:
+                raise ValueError(f"{name} {value} is out of range 0-{self.FIELD_MAX}")
+        self.target = target
+        self.dice = dice
+        self.quantity = quantity
+        self.override = override
+        self.enemy_damage = enemy_damage
+
+    def pack(self):
+        flags = (self.HAS_QUANTITY if self.quantity is not None else 0) | \
+                (self.HAS_OVERRIDE if self.override is not None else 0)
+        return self.RECORD.pack(self.ATTACK, flags, self.target, self.dice or 0, self.quantity or 0,
+                                self.override or 0.0, self.enemy_damage)
+
+    @classmethod
+    def unpack(cls, record):
+        kind, flags, target, dice, quantity, override, enemy_damage = cls.RECORD.unpack(record)
+        if kind != cls.ATTACK:
+            raise ValueError(f"unknown journal record kind {kind}")
+        return cls(target, dice or None, quantity if flags & cls.HAS_QUANTITY else None,
+                   override if flags & cls.HAS_OVERRIDE else None, enemy_damage)
+
+
+class Fight:
+    # a seeded encounter and the actions played on it so far
+    def __init__(self, seed, players, enemies, history=1000, enemy_policy=None):
+        self.seed = seed
+        self.dice_rng = fight_rng(seed, 'dice')
+        self.encounter = Encounter(players, enemies, rng=fight_rng(seed, 'fight'), history=history,
+                                   enemy_policy=enemy_policy)
+        self.actions = 0
+        self.encounter.start()
+
+    def play(self, action):
+        encounter = self.encounter
+        target = encounter.enemies[action.target] if encounter.enemies else None
+        damage = roll_damage(action.dice, action.quantity, action.override, rng=self.dice_rng)
+        encounter.enemy_damage = action.enemy_damage
+        if encounter.enemy_policy is not None:
+            # the enemies expect the party to keep rolling this
+            encounter.enemy_policy.dice = (action.dice, action.quantity, action.override)
+        encounter.attack(encounter.current_actor(), target, damage)
+        self.actions += 1
+
+
+# =======================================================================
+#                               Journal
+# =======================================================================
+# MAGIC, version, seed, length of the setup JSON, the setup (starting stats of every
+# combatant), then one fixed-size Action record per attack. Records are appended and
+# flushed as they happen, so the journal of a crashed session is still complete.
+
+MAGIC = b'DNDJ'
+VERSION = 1
+HEADER = struct.Struct('<4sHQI')
+SEED_MAX = (1 << 64) - 1  # the seed is an unsigned 64-bit field
+
+def check_seed(seed):
+    # ValueError for a seed a journal can't hold; masking it would name a different fight
+    if not 0 <= seed <= SEED_MAX:
+        raise ValueError(f"seed {seed} is out of range 0-{SEED_MAX}")
+    return seed
+
+
+def describe_setup(players, enemies, enemy_policy=None):
+    setup = {
+        'players': [[p.name, p.max_hp, p.ac, p.movement, p.initiative, p.element, p.temp_hp] for p in players],
+        'enemies': [[e.name, e.max_hp, e.defense, e.initiative, e.elements] for e in enemies],
+    }
+    if enemy_policy is not None:
+        setup['enemy_policy'] = enemy_policy.spec
+    return setup
+
+def build_setup(setup):
+    players = [Player(*fields) for fields in setup['players']]
+    enemies = [Enemy(name, max_hp, defense=defense, elements_applied=applied, initiative=initiative)
+               for name, max_hp, defense, initiative, applied in setup['enemies']]
+    return players, enemies
+
+def build_policy(setup):
+    # journals from before enemy policies have none: random targets
+    spec = setup.get('enemy_policy')
+    return parse_policy(spec) if spec else None
+
+
+class JournalWriter:
+    def __init__(self, path, seed, players, enemies, enemy_policy=None):
+        check_seed(seed)
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        setup = json.dumps(describe_setup(players, enemies, enemy_policy)).encode('utf-8')
+        self.file = open(path, 'wb')
+        self.file.write(HEADER.pack(MAGIC, VERSION, seed, len(setup)))
+        self.file.write(setup)
+        self.file.flush()
+        self.start = HEADER.size + len(setup)  # where the action records begin
+
+    def write(self, action):
+        self.file.write(action.pack())
+        self.file.flush()
+
+    def rewind(self, actions):
+        # keep only the first `actions` records, the rest were undone
+        end = self.start + actions * Action.RECORD.size
+        self.file.truncate(end)
+        self.file.seek(end)
+
+    def close(self):
+        self.file.close()
+
+
+def read_journal(path):
+    # (seed, setup, [Action, ...])
+    with open(path, 'rb') as f:
+        data = f.read()
+    magic, version, seed, setup_length = HEADER.unpack_from(data)
+    if magic != MAGIC or version != VERSION:
+        raise ValueError(f"{path} is not a version {VERSION} fight journal")
+    offset = HEADER.size + setup_length
+    setup = json.loads(data[HEADER.size:offset].decode('utf-8'))
+    size = Action.RECORD.size
+    # a torn last record (the session died mid-write) is dropped
+    actions = [Action.unpack(data[start:start + size]) for start in range(offset, len(data) - size + 1, size)]
+    return seed, setup, actions
+
+
+# =======================================================================
+#                                Replay
+# =======================================================================
+
+class Replay:
+    # a journal that can be played to any point. Loading plays it through once and
+    # pickles the fight every `interval` actions, so no seek, not even the first one,
+    # replays more than interval - 1 actions. Pickling a snapshot costs a fraction of
+    # a deepcopy, which made loading several times slower than playing the journal.
+    # The fights keep no event history by default, it would go into every snapshot
+    def __init__(self, seed, setup, actions, interval=25, history=0):
+        self.seed = seed
+        self.setup = setup
+        self.actions = actions
+        self.interval = interval
+        fight = Fight(seed, *build_setup(setup), history=history, enemy_policy=build_policy(setup))
+        self.checkpoints = {0: pickle.dumps(fight, pickle.HIGHEST_PROTOCOL)}
+        for action in actions:
+            fight.play(action)
+            if fight.actions % interval == 0:
+                self.checkpoints[fight.actions] = pickle.dumps(fight, pickle.HIGHEST_PROTOCOL)
+
+    @classmethod
+    def load(cls, path, interval=25, history=0):
+        return cls(*read_journal(path), interval=interval, history=history)
+
+    def __len__(self):
+        return len(self.actions)
+
+    def seek(self, index):
+        # a fresh Fight as it stood after `index` actions
+        index = max(0, min(index, len(self.actions)))
+        start = index - index % self.interval
+        fight = pickle.loads(self.checkpoints[start])
+        for position in range(start, index):
+            fight.play(self.actions[position])
+        return fight
+
+    def run(self):
+        # the fight as the journal leaves it
+        return self.seek(len(self.actions))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Replay a fight journal headless and print where it ends up.")
+    parser.add_argument('journal', help="journal written by dndSim.py")
+    parser.add_argument('--to', type=int, default=None, help="stop after this many actions (default: all)")
+    parser.add_argument('--log', action='store_true', help="print the log of the last action played")
+    args = parser.parse_args(argv)
+
+    replay = Replay.load(args.journal)
+    fight = replay.seek(len(replay) if args.to is None else args.to)
+    encounter = fight.encounter
+    print(f"Seed {replay.seed}, action {fight.actions} of {len(replay)}, round {encounter.round_number}")
+    for combatant in encounter.players + encounter.enemies:
+        print(f"  {combatant.name}: {combatant.current_hp:.2f}/{combatant.max_hp} HP")
+    if args.log:
+        print('\n'.join(encounter.log_messages))
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,150 @@
+import argparse
+import os
+import pickle
+import random
+import sqlite3
+import sys
+
+from engine import Player
+
+
+# =======================================================================
+#                 Roster: the saved characters, in SQLite
+# =======================================================================
+# One row per character, so adding, removing or editing one is a single-row write and
+# the menu only ever loads the page it shows. Characters are stored as plain columns
+# rather than pickled Players, so changing the Player class does not break old saves.
+# `in_party` marks who joins the next fight.
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS players (
+    id INTEGER PRIMARY KEY,
+    campaign TEXT NOT NULL DEFAULT '',
+    name TEXT NOT NULL,
+    max_hp INTEGER NOT NULL,
+    ac INTEGER NOT NULL,
+    movement INTEGER NOT NULL,
+    initiative INTEGER NOT NULL,
+    element TEXT NOT NULL,
+    temp_hp INTEGER NOT NULL DEFAULT 0,
+    in_party INTEGER NOT NULL DEFAULT 1
+);
+CREATE INDEX IF NOT EXISTS players_by_campaign ON players (campaign, name, id);
+CREATE INDEX IF NOT EXISTS players_by_name ON players (name);
+-- pickles already imported, so starting the game twice does not import them twice
+CREATE TABLE IF NOT EXISTS imports (path TEXT PRIMARY KEY, players INTEGER NOT NULL);
+"""
+
+COLUMNS = "id, name, max_hp, ac, movement, initiative, element, temp_hp, in_party"
+
+
+def _player(row):
+    return Player(row[1], row[2], row[3], row[4], row[5], row[6], row[7])
+
+
+class _PlayerUnpickler(pickle.Unpickler):
+    # players.pkl saved before the engine split pickled dndSim's own Player, run as __main__
+    def find_class(self, module, name):
+        if name == 'Player' and module in ('__main__', 'dndSim'):
+            return Player
+        return super().find_class(module, name)
+
+
+class Roster:
+    def __init__(self, path='roster.db', campaign=''):
+        self.path = path
+        self.campaign = campaign
+        self.db = sqlite3.connect(path)
+        self.db.executescript(SCHEMA)
+
+    def close(self):
+        self.db.close()
+
+    def count(self):
+        return self.db.execute("SELECT COUNT(*) FROM players WHERE campaign = ?", (self.campaign,)).fetchone()[0]
+
+    def page(self, offset, limit):
+        # (id, Player, in_party) for one screenful, in name order
+        rows = self.db.execute(f"SELECT {COLUMNS} FROM players WHERE campaign = ? ORDER BY name, id LIMIT ? OFFSET ?",
+                               (self.campaign, limit, offset))
+        return [(row[0], _player(row), bool(row[8])) for row in rows]
+
+    def find(self, name):
+        # every character called `name`, across campaigns
+        rows = self.db.execute(f"SELECT {COLUMNS} FROM players WHERE name = ? ORDER BY id", (name,))
+        return [(row[0], _player(row)) for row in rows]
+
+    def party(self):
+        # fresh Players (full HP) for everyone in the party, highest initiative first
+        rows = self.db.execute(f"SELECT {COLUMNS} FROM players WHERE campaign = ? AND in_party "
+                               f"ORDER BY initiative DESC, id", (self.campaign,))
+        return [_player(row) for row in rows]
+
+    def add(self, player, in_party=True):
+        with self.db:
+            cursor = self.db.execute(
+                "INSERT INTO players (campaign, name, max_hp, ac, movement, initiative, element, temp_hp, in_party) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (self.campaign, player.name, player.max_hp, player.ac, player.movement, player.initiative,
+                 player.element, player.temp_hp, int(in_party)))
+        return cursor.lastrowid
+
+    def remove(self, player_id):
+        with self.db:
+            self.db.execute("DELETE FROM players WHERE id = ?", (player_id,))
+
+    def set_initiative(self, player_id, initiative):
+        with self.db:
+            self.db.execute("UPDATE players SET initiative = ? WHERE id = ?", (initiative, player_id))
+
+    def set_in_party(self, player_id, in_party):
+        with self.db:
+            self.db.execute("UPDATE players SET in_party = ? WHERE id = ?", (int(in_party), player_id))
+
+    def roll_initiative(self, rng=random):
+        # d20 for everyone in the party, one transaction
+        ids = [row[0] for row in self.db.execute("SELECT id FROM players WHERE campaign = ? AND in_party",
+                                                 (self.campaign,))]
+        with self.db:
+            self.db.executemany("UPDATE players SET initiative = ? WHERE id = ?",
+                                [(rng.randint(1, 20), player_id) for player_id in ids])
+
+    def import_pickle(self, path='players.pkl'):
+        # one-time migration of a players.pkl from before the roster; returns how many
+        # characters came in (0 if there is no such file or it was imported already)
+        if not os.path.exists(path):
+            return 0
+        key = os.path.abspath(path)
+        if self.db.execute("SELECT 1 FROM imports WHERE path = ?", (key,)).fetchone():
+            return 0
+        with open(path, 'rb') as f:
+            players = _PlayerUnpickler(f).load()
+        with self.db:
+            for player in players:
+                self.db.execute(
+                    "INSERT INTO players (campaign, name, max_hp, ac, movement, initiative, element, temp_hp) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                    (self.campaign, player.name, player.max_hp, player.ac, player.movement, player.initiative,
+                     player.element, player.temp_hp))
+            self.db.execute("INSERT INTO imports (path, players) VALUES (?, ?)", (key, len(players)))
+        return len(players)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Import players.pkl files into the roster, or list it.")
+    parser.add_argument('pickles', nargs='*', help="players.pkl files to import")
+    parser.add_argument('--db', default='roster.db', help="roster database")
+    parser.add_argument('--campaign', default='', help="campaign the characters belong to")
+    args = parser.parse_args(argv)
+    roster = Roster(args.db, args.campaign)
+    for path in args.pickles:
+        print(f"{path}: imported {roster.import_pickle(path)} character(s)")
+    if not args.pickles:
+        for player_id, player, in_party in roster.page(0, roster.count()):
+            print(f"{player_id:>6} {'*' if in_party else ' '} {player.name} - HP: {player.max_hp}, AC: {player.ac}, "
+                  f"Movement: {player.movement}, Initiative: {player.initiative}, Element: {player.element}")
+    roster.close()
+
+
+if __name__ == '__main__':
+    sys.exit(main())
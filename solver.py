@@ -0,0 +1,491 @@
+import argparse
+import itertools
+import math
+import sys
+import time
+
+from engine import Player, Enemy, Encounter, Debuff, DoT, Shield, default_enemies, predict_reaction
+from dice import damage_pmf, uses_rolled_damage
+from montecarlo import INITIATIVE_DIE, parse_player, parse_enemy, parse_dice, load_party
+
+
+# =======================================================================
+#          Exact fight outcomes (Markov chain over engine states)
+# =======================================================================
+# A state is the fight at a player's decision point: whose turn it is plus every
+# living combatant's HP, elements, debuffs and shield. Transitions come from running
+# the real Encounter.attack on a rebuilt fight, so the solver can't drift from the rules.
+# Players pick a uniformly random living enemy, same as the Monte Carlo fights, and
+# enemies roll a fresh 1d20 initiative every fight like there: every turn order those
+# rolls can give is solved on its own and the answers weighted by its probability.
+
+WIN = 'win'
+LOSS = 'loss'
+
+
+class ScriptedChoices:
+    # stands in for the encounter rng: replays a list of choice indexes, then picks the
+    # first option, and remembers how many options every call had
+    def __init__(self, script):
+        self.script = script
+        self.taken = []
+        self.sizes = []
+
+    def choice(self, seq):
+        depth = len(self.taken)
+        index = self.script[depth] if depth < len(self.script) else 0
+        self.taken.append(index)
+        self.sizes.append(len(seq))
+        return seq[index]
+
+def enumerate_choices(run):
+    # every way the rng.choice calls made by run(rng) can go, with its probability
+    pending = [()]
+    while pending:
+        script = pending.pop()
+        rng = ScriptedChoices(script)
+        result = run(rng)
+        probability = 1.0
+        for size in rng.sizes:
+            probability /= size
+        yield probability, result
+        for depth in range(len(script), len(rng.sizes)):
+            prefix = tuple(rng.taken[:depth])
+            for alternative in range(1, rng.sizes[depth]):
+                pending.append(prefix + (alternative,))
+
+
+class _HeldTurnEncounter(Encounter):
+    # attack() without the turn advance, so the enemy phase can be memoized on its own
+    def advance(self):
+        pass
+
+
+class SolverStats:
+    def __init__(self):
+        self.states = 0  # distinct non-terminal states expanded
+        self.engine_runs = 0  # attacks and enemy phases run on rebuilt encounters
+        self.lookups = 0  # successor states looked up in the transposition table
+        self.hits = 0  # ...that were already there
+        self.phase_lookups = 0  # post-attack positions looked up in the enemy-phase cache
+        self.phase_hits = 0
+        self.loops = 0  # groups of states that can lead back to each other
+        self.largest_loop = 0
+        self.sweeps = 0  # passes over those groups until they converged
+        self.seconds = 0.0
+
+    def hit_rate(self):
+        return self.hits / self.lookups if self.lookups else 0.0
+
+    def phase_hit_rate(self):
+        return self.phase_hits / self.phase_lookups if self.phase_lookups else 0.0
+
+    def merge(self, other):
+        for name in ('states', 'engine_runs', 'lookups', 'hits', 'phase_lookups', 'phase_hits', 'loops', 'sweeps',
+                     'seconds'):
+            setattr(self, name, getattr(self, name) + getattr(other, name))
+        self.largest_loop = max(self.largest_loop, other.largest_loop)
+
+
+class SolveResult:
+    def __init__(self, win, loss, win_rounds, finished_rounds, stats):
+        self.win = win
+        self.loss = loss
+        self.unresolved = max(0.0, 1.0 - win - loss)  # fights that can loop forever
+        self._win_rounds = win_rounds  # E[final round_number, wins only] * P(win)
+        self._finished_rounds = finished_rounds
+        self.stats = stats
+
+    def mean_rounds_to_win(self):
+        # matches SimulationResult.mean_rounds: round_number when the last enemy dies
+        return self._win_rounds / self.win if self.win else 0.0
+
+    def mean_rounds(self):
+        finished = self.win + self.loss
+        return self._finished_rounds / finished if finished else 0.0
+
+    @classmethod
+    def mix(cls, weighted):
+        # the result of a fight that goes like each of `weighted` ((probability, result), ...)
+        stats = SolverStats()
+        win = loss = win_rounds = finished_rounds = 0.0
+        for probability, result in weighted:
+            win += probability * result.win
+            loss += probability * result.loss
+            win_rounds += probability * result._win_rounds
+            finished_rounds += probability * result._finished_rounds
+            stats.merge(result.stats)
+        return cls(win, loss, win_rounds, finished_rounds, stats)
+
+
+class FightSolver:
+    def __init__(self, players, enemies, dice=(8, 3), damage_override=None, enemy_damage=10,
+                 hp_quantum=None, max_states=2000000):
+        self.players = list(players)  # templates, indexed by position
+        self.enemies = list(enemies)
+        self.damage_pmf = damage_pmf(*dice, damage_override)
+        self.enemy_damage = enemy_damage
+        self.hp_quantum = hp_quantum  # None keeps exact HP, otherwise HP snaps to multiples of it
+        self.max_states = max_states
+        self.stats = SolverStats()
+        self.index_of = {WIN: 0, LOSS: 1}  # transposition table: state -> index
+        self.states = [WIN, LOSS]
+        self.transitions = [(), ()]  # index -> ((probability, next index, rounds added), ...)
+        self.enemy_phases = {}  # post-attack state -> ((probability, next state, rounds added), ...)
+
+    # ---------------------------------------------------------- state codec
+
+    def _hp_options(self, hp):
+        # HP above one quantum is split between the grid points either side so the mean is
+        # kept (plain rounding would let small hits round back up forever); below it stays exact
+        quantum = self.hp_quantum
+        if hp <= quantum:
+            return ((hp, 1.0),)
+        low = math.floor(hp / quantum) * quantum
+        fraction = (hp - low) / quantum
+        if fraction < 1e-9:
+            return ((low, 1.0),)
+        return ((low, 1.0 - fraction), (low + quantum, fraction))
+
+    def quantize(self, state):
+        if self.hp_quantum is None or state in (WIN, LOSS):
+            return ((1.0, state),)
+        actor, player_states, enemy_states = state
+        combatants = player_states + enemy_states
+        results = []
+        for choice in itertools.product(*(self._hp_options(combatant[1]) for combatant in combatants)):
+            probability = 1.0
+            rounded = []
+            for combatant, (hp, hp_probability) in zip(combatants, choice):
+                probability *= hp_probability
+                rounded.append((combatant[0], hp) + combatant[2:])
+            results.append((probability, (actor, tuple(rounded[:len(player_states)]), tuple(rounded[len(player_states):]))))
+        return results
+
+    def build(self, state, encounter_class=Encounter):
+        # a live Encounter at `state`, plus object id -> ('P'/'E', template index)
+        actor, player_states, enemy_states = state
+        keys = {}
+        players = []
+        for index, hp in player_states:
+            template = self.players[index]
+            player = Player(template.name, template.max_hp, template.ac, template.movement, template.initiative, template.element)
+            player.current_hp = hp
+            players.append(player)
+            keys[id(player)] = ('P', index)
+        enemies = []
+        for index, hp, applied, swirled, debuffs, shield, frozen, petrified in enemy_states:
+            template = self.enemies[index]
+            enemy = Enemy(template.name, template.max_hp, defense=template.defense, initiative=template.initiative)
+            enemy.current_hp = hp
+            enemy.element_mask, enemy.element_order = applied
+            enemy.swirled_mask = swirled
+            # not in a fight yet, so expiry ticks count from 0 and are the turns left
+            for name, duration, percentage in debuffs:
+                enemy.debuffs[name] = DoT(duration, percentage) if percentage else Debuff(duration)
+            enemy.shield = Shield(*shield) if shield else None
+            enemy.is_frozen = frozen
+            enemy.is_petrified = petrified
+            enemies.append(enemy)
+            keys[id(enemy)] = ('E', index)
+        encounter = encounter_class(players, enemies, enemy_damage=self.enemy_damage, history=0)
+        for combatant in encounter.initiative:
+            if keys[id(combatant)] == actor:
+                encounter.initiative.seek(combatant)
+        return encounter, keys
+
+    def key(self, encounter, keys):
+        if not encounter.enemies:
+            return WIN
+        if not encounter.players:
+            return LOSS
+        player_states = tuple((keys[id(player)][1], player.current_hp) for player in encounter.players)
+        enemy_states = []
+        for enemy in encounter.enemies:
+            debuffs = tuple(sorted((name, enemy.remaining(debuff), debuff.percentage) for name, debuff in enemy.debuffs.items()))
+            shield = enemy.shield
+            if shield:
+                shield = (shield.type, enemy.remaining(shield), shield.element, shield.reduction)
+            enemy_states.append((keys[id(enemy)][1], enemy.current_hp, (enemy.element_mask, enemy.element_order),
+                                 enemy.swirled_mask, debuffs, shield, enemy.is_frozen, enemy.is_petrified))
+        return keys[id(encounter.current_actor())], player_states, tuple(enemy_states)
+
+    def initial_state(self):
+        # the fight as given, with every combatant's current HP/elements/debuffs
+        keys = {}
+        for index, player in enumerate(self.players):
+            keys[id(player)] = ('P', index)
+        for index, enemy in enumerate(self.enemies):
+            keys[id(enemy)] = ('E', index)
+        encounter = Encounter(self.players, self.enemies, enemy_damage=self.enemy_damage, history=0)
+        return self.key(encounter, keys)
+
+    # ----------------------------------------------------------- expansion
+
+    def _lookup(self, state):
+        self.stats.lookups += 1
+        index = self.index_of.get(state)
+        if index is not None:
+            self.stats.hits += 1
+            return index
+        if len(self.states) - 2 >= self.max_states:
+            raise RuntimeError(f"more than {self.max_states} states, try a coarser hp_quantum")
+        index = len(self.states)
+        self.index_of[state] = index
+        self.states.append(state)
+        self.transitions.append(None)
+        return index
+
+    def _merge(self, outcomes):
+        merged = {}
+        for probability, state, rounds in outcomes:
+            edge = (self._lookup(state), rounds)
+            merged[edge] = merged.get(edge, 0.0) + probability
+        return tuple((probability, index, rounds) for (index, rounds), probability in merged.items())
+
+    def _start_outcomes(self):
+        # Encounter.start plays the enemies that outrolled every player before anyone decides
+        initial = self.initial_state()
+        def run(rng):
+            encounter, keys = self.build(initial)
+            encounter.rng = rng
+            encounter.start()
+            self.stats.engine_runs += 1
+            return self.key(encounter, keys), encounter.round_number - 1
+        return [(probability * rounded_probability, rounded, rounds)
+                for probability, (state, rounds) in enumerate_choices(run)
+                for rounded_probability, rounded in self.quantize(state)]
+
+    def _enemy_phase(self, held):
+        # everything advance() can do from a post-attack position: the enemies' random
+        # targets are the only branching, and many attacks land on the same position
+        self.stats.phase_lookups += 1
+        outcomes = self.enemy_phases.get(held)
+        if outcomes is not None:
+            self.stats.phase_hits += 1
+            return outcomes
+        def run(rng):
+            encounter, keys = self.build(held)
+            encounter.rng = rng
+            encounter.advance()
+            self.stats.engine_runs += 1
+            return self.key(encounter, keys), encounter.round_number - 1
+        outcomes = tuple((probability * rounded_probability, rounded, rounds)
+                         for probability, (state, rounds) in enumerate_choices(run)
+                         for rounded_probability, rounded in self.quantize(state))
+        self.enemy_phases[held] = outcomes
+        return outcomes
+
+    def _attack_outcomes(self, state):
+        outcomes = []
+        targets = len(state[2])
+        for target in range(targets):
+            encounter, keys = self.build(state, _HeldTurnEncounter)
+            rolls = self.damage_pmf
+            if not uses_rolled_damage(predict_reaction(encounter.enemies[target], encounter.current_actor().element)):
+                rolls = ((rolls[0][0], 1.0),)  # the roll can't change anything, run it once
+            for base_damage, roll_probability in rolls:
+                probability = roll_probability / targets
+                if encounter is None:
+                    encounter, keys = self.build(state, _HeldTurnEncounter)
+                encounter.attack(encounter.current_actor(), encounter.enemies[target], base_damage)
+                self.stats.engine_runs += 1
+                if encounter.is_over():
+                    # no enemies left to roll for, advance() only moves the cursor (and maybe the round)
+                    Encounter.advance(encounter)
+                    outcomes.append((probability, WIN, encounter.round_number - 1))
+                else:
+                    for phase_probability, next_state, rounds in self._enemy_phase(self.key(encounter, keys)):
+                        outcomes.append((probability * phase_probability, next_state, rounds))
+                encounter = None
+        return outcomes
+
+    def explore(self, root_edges):
+        # expands every reachable state depth-first and groups them with Tarjan's algorithm:
+        # each group is a set of states that can reach each other, and groups come out with
+        # everything they lead to already listed, so one backward pass solves the chain
+        groups = []
+        number = {}
+        low = {}
+        path = []
+        on_path = set()
+        for _, root, _ in root_edges:
+            if root <= 1 or root in number:
+                continue
+            number[root] = low[root] = len(number)
+            path.append(root)
+            on_path.add(root)
+            stack = [(root, None)]
+            while stack:
+                current, children = stack[-1]
+                if children is None:
+                    self.transitions[current] = self._merge(self._attack_outcomes(self.states[current]))
+                    self.stats.states += 1
+                    children = iter(self.transitions[current])
+                    stack[-1] = (current, children)
+                for _, child, _ in children:
+                    if child <= 1:
+                        continue
+                    if child not in number:
+                        number[child] = low[child] = len(number)
+                        path.append(child)
+                        on_path.add(child)
+                        stack.append((child, None))
+                        break
+                    if child in on_path:
+                        low[current] = min(low[current], number[child])
+                else:
+                    stack.pop()
+                    if stack:
+                        parent = stack[-1][0]
+                        low[parent] = min(low[parent], low[current])
+                    if low[current] == number[current]:
+                        group = []
+                        while True:
+                            index = path.pop()
+                            on_path.discard(index)
+                            group.append(index)
+                            if index == current:
+                                break
+                        groups.append(group)
+        return groups
+
+    # ------------------------------------------------------------- solving
+
+    def solve(self, tolerance=1e-12, max_sweeps=100000):
+        start = time.perf_counter()
+        root_edges = self._merge(self._start_outcomes())
+        groups = self.explore(root_edges)
+
+        size = len(self.states)
+        win = [0.0] * size
+        loss = [0.0] * size
+        win_rounds = [0.0] * size  # E[rounds still to come, wins only] weighted by P(win)
+        finished_rounds = [0.0] * size
+        win[0] = 1.0
+        loss[1] = 1.0
+        transitions = self.transitions
+        for group in groups:
+            # a lone state is exact in one pass; a loop (Bloom and Healing Winds undoing damage,
+            # HP snapping back onto a grid point) is swept until it stops changing
+            sweeps = 0
+            while True:
+                sweeps += 1
+                change = 0.0
+                for index in group:
+                    w = l = wr = fr = 0.0
+                    stay = stay_rounds = 0.0
+                    for probability, child, rounds in transitions[index]:
+                        if child == index:
+                            stay += probability
+                            stay_rounds += probability * rounds
+                            continue
+                        w += probability * win[child]
+                        l += probability * loss[child]
+                        wr += probability * (rounds * win[child] + win_rounds[child])
+                        fr += probability * (rounds * (win[child] + loss[child]) + finished_rounds[child])
+                    if stay:
+                        # leading straight back to itself is solved in closed form
+                        keep = 1.0 - stay
+                        if keep <= 1e-12:
+                            continue  # never leaves, stays unresolved
+                        w /= keep
+                        l /= keep
+                        wr = (wr + stay_rounds * w) / keep
+                        fr = (fr + stay_rounds * (w + l)) / keep
+                    change = max(change, abs(w - win[index]), abs(l - loss[index]))
+                    win[index], loss[index], win_rounds[index], finished_rounds[index] = w, l, wr, fr
+                if len(group) == 1 or change <= tolerance or sweeps >= max_sweeps:
+                    break
+            if len(group) > 1:
+                self.stats.loops += 1
+                self.stats.largest_loop = max(self.stats.largest_loop, len(group))
+                self.stats.sweeps += sweeps
+
+        w = l = wr = fr = 0.0
+        for probability, child, rounds in root_edges:
+            # round_number starts at 1
+            w += probability * win[child]
+            l += probability * loss[child]
+            wr += probability * ((1 + rounds) * win[child] + win_rounds[child])
+            fr += probability * ((1 + rounds) * (win[child] + loss[child]) + finished_rounds[child])
+        self.stats.seconds = time.perf_counter() - start
+        return SolveResult(w, l, wr, fr, self.stats)
+
+
+def initiative_rolls(players, enemies, sides=INITIATIVE_DIE):
+    # every turn order the enemies' 1d`sides` initiative rolls can give, as (probability,
+    # one roll giving it): only the order changes the fight. Ties go to whoever joined
+    # first (players, then enemies in list order), as in engine.InitiativeOrder
+    player_keys = [(-player.initiative, joined) for joined, player in enumerate(players)]
+    outcome = 1 / sides ** len(enemies)
+    orders = {}
+    for roll in itertools.product(range(1, sides + 1), repeat=len(enemies)):
+        keys = player_keys + [(-initiative, len(players) + index) for index, initiative in enumerate(roll)]
+        order = tuple(sorted(range(len(keys)), key=keys.__getitem__))
+        entry = orders.get(order)
+        if entry is None:
+            orders[order] = [outcome, roll]
+        else:
+            entry[0] += outcome
+    return [(probability, roll) for probability, roll in orders.values()]
+
+def solve(players, enemies=None, dice=(8, 3), damage_override=None, enemy_damage=10, hp_quantum=None,
+          max_states=2000000, roll_initiative=True):
+    # roll_initiative=False keeps the enemies' own initiative instead of averaging over rolls
+    if enemies is None:
+        enemies = default_enemies()
+    options = dict(dice=dice, damage_override=damage_override, enemy_damage=enemy_damage, hp_quantum=hp_quantum,
+                   max_states=max_states)
+    if not roll_initiative:
+        return FightSolver(players, enemies, **options).solve()
+    results = []
+    for probability, roll in initiative_rolls(players, enemies):
+        rolled = [Enemy(enemy.name, enemy.max_hp, defense=enemy.defense, elements_applied=enemy.elements,
+                        initiative=initiative) for enemy, initiative in zip(enemies, roll)]
+        results.append((probability, FightSolver(players, rolled, **options).solve()))
+    return SolveResult.mix(results)
+
+
+# =======================================================================
+#                                  CLI
+# =======================================================================
+
+def format_report(result):
+    stats = result.stats
+    return '\n'.join([
+        f"Win: {result.win * 100:.4f}%  Loss: {result.loss * 100:.4f}%  Unresolved: {result.unresolved * 100:.4f}%",
+        f"Rounds: mean {result.mean_rounds():.3f} (finished fights), {result.mean_rounds_to_win():.3f} to win",
+        f"Solver: {stats.states} states, {stats.engine_runs} engine runs, {stats.seconds:.2f} s",
+        f"Loops: {stats.loops} (largest {stats.largest_loop} states), {stats.sweeps} sweep(s)",
+        f"Cache hit rate: states {stats.hit_rate() * 100:.1f}%, enemy phases {stats.phase_hit_rate() * 100:.1f}%",
+    ])
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Exact win/loss odds for a small fight.")
+    parser.add_argument('--party', default='roster.db', help="roster saved by the menu, or an old players.pkl")
+    parser.add_argument('--player', type=parse_player, action='append', help="NAME:HP:ELEMENT[:INITIATIVE], overrides --party")
+    parser.add_argument('--enemy', type=parse_enemy, action='append', help="NAME:HP[:DEFENSE], default is Harin/Sigurd")
+    parser.add_argument('--dice', type=parse_dice, default=(8, 3), help="player damage roll, e.g. 3d8")
+    parser.add_argument('--override', type=float, default=None, help="flat player damage instead of dice")
+    parser.add_argument('--enemy-damage', type=float, default=10)
+    parser.add_argument('--hp-quantum', type=float, default=None, help="snap HP to multiples of this to bound the state count")
+    parser.add_argument('--max-states', type=int, default=2000000)
+    parser.add_argument('--fixed-initiative', action='store_true',
+                        help="use the enemies' initiative as given instead of averaging over 1d20 rolls")
+    args = parser.parse_args(argv)
+
+    party = args.player or load_party(args.party)
+    if not party:
+        parser.error(f"no party: nobody in {args.party} and no --player given")
+    try:
+        result = solve(party, args.enemy, dice=args.dice, damage_override=args.override, enemy_damage=args.enemy_damage,
+                       hp_quantum=args.hp_quantum, max_states=args.max_states,
+                       roll_initiative=not args.fixed_initiative)
+    except RuntimeError as error:
+        parser.error(str(error))
+    print(format_report(result))
+
+
+if __name__ == '__main__':
+    sys.exit(main())
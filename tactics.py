@@ -0,0 +1,308 @@
+import argparse
+import math
+import time
+
+from dice import predict_hit
+
+
+# =======================================================================
+#                Enemy policies: whom an enemy attacks on its turn
+# =======================================================================
+# An Encounter with no policy has every enemy hit a random player (encounter.rng), like
+# it always did. A policy object replaces that choice: choose(encounter, enemy) returns
+# the living player to attack. Policies are plain objects, picklable for Monte Carlo
+# workers, and a policy's `spec` string rebuilds it (parse_policy), which is what fight
+# journals store so replays attack the same players.
+#
+# Policies that look at the party's damage expect the players to keep rolling what they
+# rolled last: `dice` is (selected_dice, dice_quantity, damage_override) as for
+# dice.damage_pmf, and replay.Fight / montecarlo.run_fight keep it up to date.
+
+DEFAULT_DICE = (8, 3, None)
+
+# expectimax defaults: plies searched, and nodes per decision for bulk simulation (a
+# few ms). The live UI gives it far more nodes and a time budget (dndSim LIVE_AI_MS)
+EXPECTIMAX_DEPTH = 8
+EXPECTIMAX_NODES = 500
+EXPECTIMAX_OUTCOMES = 3  # a player's damage roll is split into this many equally likely buckets
+
+HIT_CACHE_SIZE = 4096
+WIN = 1e6  # leaf value of a fight the enemies have won
+
+
+class Policy:
+    name = None
+
+    def __init__(self):
+        self.dice = DEFAULT_DICE
+        self.hits = {}  # (enemy, version, tick, element, max_hp, dice) -> dice.HitPrediction
+
+    @property
+    def spec(self):
+        return self.name
+
+    def __getstate__(self):
+        # caches stay behind, they'd bloat replay checkpoints and worker jobs
+        state = dict(self.__dict__)
+        state['hits'] = {}
+        return state
+
+    def choose(self, encounter, enemy):
+        raise NotImplementedError
+
+    def hit(self, player, enemy):
+        # what `player` hitting `enemy` right now would do, until the enemy changes or
+        # its effects tick (Toxic Spores going off depends on the tick)
+        key = (enemy, enemy.version, enemy.clock.now if enemy.clock else 0, player.element, player.max_hp, self.dice)
+        prediction = self.hits.get(key)
+        if prediction is None:
+            if len(self.hits) >= HIT_CACHE_SIZE:
+                self.hits.clear()
+            prediction = self.hits[key] = predict_hit(enemy, player, *self.dice)
+        return prediction
+
+    def threats(self, encounter):
+        # each player's expected damage against the enemy the party is most likely to
+        # finish off next (the weakest one), relative to the party's mean
+        target = min(encounter.enemies, key=lambda enemy: enemy.current_hp)
+        damage = [self.hit(player, target).expected_damage() for player in encounter.players]
+        mean = sum(damage) / len(damage)
+        return [value / mean if mean > 0 else 1.0 for value in damage]
+
+
+class RandomPolicy(Policy):
+    # the default behaviour as a policy: same draw from the same stream
+    name = 'random'
+
+    def choose(self, encounter, enemy):
+        return encounter.rng.choice(encounter.players)
+
+
+class FocusPolicy(Policy):
+    # everyone on the player with the least HP left, first in party order on ties
+    name = 'focus'
+
+    def choose(self, encounter, enemy):
+        return min(encounter.players, key=lambda player: player.current_hp)
+
+
+class ThreatPolicy(Policy):
+    # the player with the most damage per enemy turn it takes to bring down
+    name = 'threat'
+
+    def choose(self, encounter, enemy):
+        damage = encounter.enemy_damage
+        best, best_score = None, -math.inf
+        for player, threat in zip(encounter.players, self.threats(encounter)):
+            turns = math.ceil(player.current_hp / damage) if damage > 0 else math.inf
+            score = threat / max(turns, 1)
+            if score > best_score:
+                best, best_score = player, score
+        return best
+
+
+class OutOfBudget(Exception):
+    pass
+
+
+class ExpectimaxPolicy(Policy):
+    # Depth-limited expectimax over the turns that follow, on a compact model of the
+    # fight: player and enemy HP tuples plus a position in the turn order. Enemy turns
+    # are max nodes (the enemies play the same policy), player turns are chance nodes
+    # over the damage roll, the party hitting its weakest enemy with the damage
+    # dice.predict_hit gives for the enemy's current elements and effects. Leaves score
+    # enemy HP left against player HP left weighted by threat, from the enemies' side.
+    #
+    # Iterative deepening one ply at a time until `depth`, `nodes` or `time_ms` runs
+    # out; the deepest finished search decides. A transposition table keyed on the
+    # model state keeps values of positions reached by different move orders (two
+    # enemies hitting two players either way round) and is reused by the deeper
+    # passes, leaf values are cached the same way. Node budgets are deterministic, a
+    # time budget is not: a fight where it cut a search short may replay differently
+    # on a faster or slower machine.
+    name = 'expectimax'
+
+    def __init__(self, depth=EXPECTIMAX_DEPTH, nodes=EXPECTIMAX_NODES, time_ms=None, outcomes=EXPECTIMAX_OUTCOMES):
+        super().__init__()
+        self.depth = depth
+        self.nodes = nodes
+        self.time_ms = time_ms
+        self.outcomes = outcomes
+        self.searched = 0  # nodes and finished depth of the last decision, for tuning budgets
+        self.reached = 0
+
+    @property
+    def spec(self):
+        spec = f"{self.name}:{self.depth}:{self.nodes}"
+        return spec + f":{self.time_ms:g}" if self.time_ms else spec
+
+    def choose(self, encounter, enemy):
+        players = encounter.players
+        if len(players) == 1:
+            return players[0]
+        search = _Search(self, encounter)
+        deadline = time.perf_counter() + self.time_ms / 1000 if self.time_ms else None
+        best = None
+        self.reached = 0
+        for depth in range(1, self.depth + 1):
+            try:
+                best = search.root(depth, self.nodes if depth > 1 else math.inf, deadline)
+            except OutOfBudget:
+                break
+            self.reached = depth
+        self.searched = search.nodes
+        # not even the first pass finished in time: the first player, like focus on a tie
+        return players[best] if best is not None else players[0]
+
+
+class _Search:
+    # one decision's model and tables
+    def __init__(self, policy, encounter):
+        self.policy = policy
+        players = encounter.players
+        enemies = encounter.enemies
+        self.players = players
+        self.enemies = enemies
+        self.player_hp = tuple(player.current_hp for player in players)
+        self.enemy_hp = tuple(enemy.current_hp for enemy in enemies)
+        self.player_max = tuple(player.max_hp for player in players)
+        self.enemy_max = tuple(enemy.max_hp for enemy in enemies)
+        self.threat = policy.threats(encounter)
+        self.damage = encounter.enemy_damage
+        # one lap of the turn order from the acting enemy: (is_player, index)
+        index = {combatant: i for i, combatant in enumerate(players)}
+        index.update({combatant: i for i, combatant in enumerate(enemies)})
+        order = []
+        turn = encounter.initiative.cursor
+        for _ in range(len(encounter.initiative)):
+            order.append((turn.actor.type == 'Player', index[turn.actor]))
+            turn = turn.next
+        self.order = order
+        self.outcomes = {}  # (player, enemy) -> ((probability, damage, heal), ...)
+        self.table = {}  # (player_hp, enemy_hp, slot) -> (depth, value)
+        self.leaves = {}  # (player_hp, enemy_hp) -> value
+        self.nodes = 0
+        self.limit = math.inf
+        self.deadline = None
+
+    def root(self, depth, limit, deadline):
+        # index into players of the best target at `depth` plies; `limit` counts the
+        # nodes of every pass so far
+        self.limit = limit
+        self.deadline = deadline
+        following = 1 % len(self.order)
+        best, best_value = None, -math.inf
+        for i, hp in enumerate(self.player_hp):
+            value = self.value(self.player_hp[:i] + (hp - self.damage,) + self.player_hp[i + 1:], self.enemy_hp,
+                               following, depth - 1)
+            if value > best_value:
+                best, best_value = i, value
+        return best
+
+    def hit_outcomes(self, player, enemy):
+        outcomes = self.outcomes.get((player, enemy))
+        if outcomes is None:
+            prediction = self.policy.hit(self.players[player], self.enemies[enemy])
+            heal = prediction.hp_before - self.enemies[enemy].current_hp
+            outcomes = tuple((probability, damage + prediction.dot_damage, heal)
+                             for probability, damage in _buckets(prediction.damage, self.policy.outcomes))
+            self.outcomes[(player, enemy)] = outcomes
+        return outcomes
+
+    def evaluate(self, player_hp, enemy_hp):
+        key = (player_hp, enemy_hp)
+        value = self.leaves.get(key)
+        if value is not None:
+            return value
+        # logs of the hits left to take: the same damage counts for more on whoever is
+        # closer to going down
+        party = 0.0
+        hit = self.damage if self.damage > 0 else 1
+        for hp, threat in zip(player_hp, self.threat):
+            if hp > 0:
+                party += threat * (1 + math.log1p(hp / hit))
+        if not party:
+            value = WIN
+        else:
+            foes = 0.0
+            for hp, maximum in zip(enemy_hp, self.enemy_max):
+                if hp > 0:
+                    foes += 1 + math.sqrt(hp / maximum)
+            value = foes - party if foes else -WIN
+        self.leaves[key] = value
+        return value
+
+    def value(self, player_hp, enemy_hp, slot, depth):
+        if depth <= 0:
+            return self.evaluate(player_hp, enemy_hp)
+        key = (player_hp, enemy_hp, slot)
+        entry = self.table.get(key)
+        if entry is not None and entry[0] >= depth:
+            return entry[1]
+        leaf = self.evaluate(player_hp, enemy_hp)
+        if leaf == WIN or leaf == -WIN:
+            return leaf
+        self.nodes += 1
+        if self.nodes > self.limit or (self.deadline is not None and not self.nodes & 63
+                                       and time.perf_counter() > self.deadline):
+            raise OutOfBudget
+        order = self.order
+        # whoever is next and still standing
+        is_player, index = order[slot]
+        while (player_hp if is_player else enemy_hp)[index] <= 0:
+            slot = (slot + 1) % len(order)
+            is_player, index = order[slot]
+        following = (slot + 1) % len(order)
+        if is_player:
+            target = min((hp, i) for i, hp in enumerate(enemy_hp) if hp > 0)[1]
+            hp = enemy_hp[target]
+            value = 0.0
+            for probability, damage, heal in self.hit_outcomes(index, target):
+                after = min(hp + heal, self.enemy_max[target]) - damage if heal else hp - damage
+                value += probability * self.value(player_hp, enemy_hp[:target] + (after,) + enemy_hp[target + 1:],
+                                                  following, depth - 1)
+        else:
+            value = -math.inf
+            for i, hp in enumerate(player_hp):
+                if hp > 0:
+                    child = self.value(player_hp[:i] + (hp - self.damage,) + player_hp[i + 1:], enemy_hp,
+                                       following, depth - 1)
+                    if child > value:
+                        value = child
+        self.table[key] = (depth, value)
+        return value
+
+
+def _buckets(pmf, count):
+    # `pmf` as at most `count` (probability, mean value) buckets of equal probability mass
+    if len(pmf) <= count:
+        return tuple((probability, value) for value, probability in pmf)
+    buckets = [[0.0, 0.0] for _ in range(count)]
+    cumulative = 0.0
+    for value, probability in pmf:
+        bucket = buckets[min(int((cumulative + probability / 2) * count), count - 1)]
+        bucket[0] += probability
+        bucket[1] += probability * value
+        cumulative += probability
+    return tuple((probability, total / probability) for probability, total in buckets if probability)
+
+
+POLICIES = {policy.name: policy for policy in (RandomPolicy, FocusPolicy, ThreatPolicy, ExpectimaxPolicy)}
+
+def parse_policy(spec, nodes=EXPECTIMAX_NODES, time_ms=None):
+    # random | focus | threat | expectimax[:DEPTH[:NODES[:MS]]]; `nodes` and `time_ms`
+    # are what an expectimax spec leaves out
+    name, *fields = spec.split(':')
+    if name not in POLICIES or (fields and name != 'expectimax') or len(fields) > 3:
+        raise argparse.ArgumentTypeError(f"expected random, focus, threat or expectimax[:DEPTH[:NODES[:MS]]], got {spec!r}")
+    if name != 'expectimax':
+        return POLICIES[name]()
+    try:
+        depth = int(fields[0]) if fields else EXPECTIMAX_DEPTH
+        nodes = int(fields[1]) if len(fields) > 1 else nodes
+        time_ms = float(fields[2]) if len(fields) > 2 else time_ms
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"expected expectimax[:DEPTH[:NODES[:MS]]], got {spec!r}")
+    if depth < 1 or nodes < 1 or (time_ms is not None and time_ms <= 0):
+        raise argparse.ArgumentTypeError(f"expectimax needs DEPTH and NODES of at least 1 and MS above 0, got {spec!r}")
+    return ExpectimaxPolicy(depth, nodes, time_ms)
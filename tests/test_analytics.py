@@ -0,0 +1,39 @@
+import random
+import statistics
+
+import pytest
+
+from analytics import DOT_SOURCE, BattleAnalytics, RunningStats
+from engine import Encounter, Enemy
+from montecarlo import parse_player
+
+
+def test_running_stats_merge_like_one_pass():
+    rng = random.Random(4)
+    values = [rng.uniform(0, 30) for _ in range(500)]
+    whole, left, right = RunningStats(), RunningStats(), RunningStats()
+    for index, value in enumerate(values):
+        whole.add(value)
+        (left if index < 170 else right).add(value)
+    left.merge(right)
+    for stats in (whole, left):
+        assert stats.mean == pytest.approx(statistics.mean(values))
+        assert stats.variance == pytest.approx(statistics.variance(values))
+        assert (stats.minimum, stats.maximum) == (min(values), max(values))
+
+def test_spores_going_off_count_for_dot():
+    # the spores detonate in the tick ending Ayla's Vaporize: neither hers nor the reaction's
+    ayla = parse_player('Ayla:60:Pyro:20')
+    harin = Enemy('Harin', 200, elements_applied=['Hydro'], initiative=1)
+    fight = Encounter([ayla], [harin], rng=random.Random(1), history=0)
+    fight.start()
+    harin.apply_debuff("Toxic Spores", 1)
+    analytics = BattleAnalytics()
+    fight.attack(ayla, harin, 10)
+    analytics.observe(ayla, fight.events, fight.round_number)
+
+    assert [event[3] for event in fight.events if event[0] == 'damage' and event[5] == "Toxic Spores"] == [10.0]
+    assert analytics.combatants['Ayla'].dealt.total == 15.0
+    assert analytics.reactions['Vaporize'].damage.total == 15.0
+    assert analytics.combatants[DOT_SOURCE].dealt.total == 10.0
+    assert analytics.combatants['Harin'].taken.total == 25.0
@@ -0,0 +1,94 @@
+import random
+
+import pytest
+
+from engine import Encounter, Enemy, element_bits, elements, format_event
+from montecarlo import parse_player
+
+
+def crowd(seed, size=12):
+    # enemies in every state an area effect reads: defense, Superconduct, both shields, swirls
+    rng = random.Random(seed)
+    enemies = []
+    for index in range(size):
+        enemy = Enemy(f'E{index}', rng.choice((20, 40, 80)), defense=rng.choice((0, 3, 8)))
+        if rng.random() < 0.3:
+            enemy.apply_debuff("Superconduct", rng.randint(1, 3))
+        shield = rng.random()
+        if shield < 0.25:
+            enemy.apply_shield('Damage Reduction', 2, reduction=0.3)
+        elif shield < 0.5:
+            enemy.apply_shield('Elemental Immunity', 1, element=rng.choice(('Electro', 'Pyro')))
+        enemy.swirled_mask = rng.choice((0, element_bits['Pyro'], element_bits['Pyro'] | element_bits['Cryo']))
+        enemies.append(enemy)
+    return enemies
+
+def fight(seed, size=12):
+    return Encounter([parse_player('Ayla:60:Anemo:20')], crowd(seed, size), rng=random.Random(seed))
+
+def same(enemies, reference):
+    assert [(e.current_hp, e.total_damage_taken, e.swirled_mask) for e in enemies] == \
+        [(e.current_hp, e.total_damage_taken, e.swirled_mask) for e in reference]
+
+def expiring(due):
+    return [(enemy.name, [name for _, name, _ in expired]) for enemy, expired in due.items()]
+
+
+@pytest.mark.parametrize('seed', range(6))
+def test_area_damage_hits_like_one_enemy_at_a_time(seed):
+    area, one_by_one = fight(seed), fight(seed)
+    for base_damage, multiplier, element in ((6, 1.0, 'Electro'), (24, 1.0, None), (10, 1.5, 'Pyro'), (30, 1.0, 'Electro')):
+        area.events.clear()
+        area.fallen = []
+        area.area_damage(base_damage, multiplier, attack_element=element, label='Thunderstorm')
+        hits = [enemy.calculate_damage(base_damage, multiplier, attack_element=element) for enemy in one_by_one.enemies]
+        damages = [None if hit[0] == 'immune' else hit[3] for hit in hits]
+        [(kind, _, _, total, _, (label, targets, area_damages))] = area.events
+        assert (kind, label, targets) == ('area damage', 'Thunderstorm', area.enemies)
+        assert area_damages == damages and total == pytest.approx(sum(damage or 0 for damage in damages))
+        assert area.fallen == [enemy for enemy, damage in zip(area.enemies, damages)
+                               if damage is not None and enemy.current_hp <= 0]
+        same(area.enemies, one_by_one.enemies)
+
+@pytest.mark.parametrize('seed', range(6))
+def test_area_debuff_runs_like_one_debuff_each(seed):
+    area, one_by_one = fight(seed), fight(seed)
+    for duration in (1, 3, 0):
+        area.area_debuff("Disadvantage", duration)
+        for enemy in one_by_one.enemies:
+            enemy.apply_debuff("Disadvantage", duration)
+        for _ in range(2):
+            ticks = [encounter.effects.advance() for encounter in (area, one_by_one)]
+            assert expiring(ticks[0]) == expiring(ticks[1])
+            for due in ticks:
+                for enemy, expired in due.items():
+                    enemy.tick_effects(expired)
+        assert [sorted((name, record.expires) for name, record in enemy.debuffs.items()) for enemy in area.enemies] == \
+            [sorted((name, record.expires) for name, record in enemy.debuffs.items()) for enemy in one_by_one.enemies]
+
+@pytest.mark.parametrize('element', [name for name in elements if name != 'Anemo'])
+def test_area_swirl_only_touches_enemies_it_changes(element):
+    area, one_by_one = fight(4), fight(4)
+    mask = element_bits[element] | element_bits['Cryo']
+    versions = [enemy.version for enemy in area.enemies]
+    area.area_swirl(mask)
+    for enemy in one_by_one.enemies:
+        enemy.swirled_mask |= mask
+    same(area.enemies, one_by_one.enemies)
+    assert [enemy.version != version for enemy, version in zip(area.enemies, versions)] == \
+        [bool(mask & ~enemy.swirled_mask) for enemy in fight(4).enemies]
+
+def test_area_reactions_defeat_in_enemy_order():
+    # Thunderstorm brings several enemies down at once, the defeats read in self.enemies order
+    encounter = fight(2, size=8)
+    target = encounter.enemies[5]
+    target.apply_element('Hydro')
+    target.apply_element('Electro')
+    enemies = encounter.enemies[:]
+    encounter.attack(encounter.players[0], target, 10)
+    assert format_event(encounter.events[1]) == "Reaction triggered: Thunderstorm"
+    downed = [enemy for enemy in enemies if enemy.current_hp <= 0]
+    assert len(downed) > 1
+    assert [format_event(event) for event in encounter.events if event[0] == 'defeated'] == \
+        [f"{enemy.name} has been defeated!" for enemy in downed]
+    assert encounter.enemies == [enemy for enemy in enemies if enemy.current_hp > 0]
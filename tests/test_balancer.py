@@ -0,0 +1,78 @@
+import math
+import statistics
+
+import pytest
+
+from balancer import Balancer, Candidate, _next_range, _spread, balance
+from batch import simulate_batch
+from engine import Enemy
+from montecarlo import parse_player, simulate
+
+
+def party():
+    return [parse_player('A:60:Pyro:14'), parse_player('B:50:Hydro:9')]
+
+def enemies():
+    return [Enemy('Harin', 120, defense=0, initiative=10), Enemy('Sigurd', 300, defense=10, initiative=5)]
+
+
+def test_candidate_sums_up_like_the_fights_it_played():
+    candidate = Candidate(100, 2, 6)
+    fight = [enemies()[0], Enemy('Sigurd', 100, defense=2)]
+    results = [simulate_batch(party(), fight, fights=fights, enemy_damage=6, seed=seed)
+               for fights, seed in ((700, 1), (400, 2))]
+    for result in results:
+        candidate.add(result)
+    rounds = [rounds for result in results for rounds in result.rounds.elements()]
+    assert candidate.fights == 1100 and candidate.wins == len(rounds)
+    assert candidate.win_rate() == sum(result.wins for result in results) / 1100
+    assert candidate.mean_rounds() == pytest.approx(statistics.mean(rounds))
+    assert candidate.rounds_stderr() == pytest.approx(statistics.stdev(rounds) / math.sqrt(len(rounds)))
+
+@pytest.mark.parametrize('low, high, log', [(75, 1200, True), (0, 20, False), (2.5, 30, True), (4, 4, False)])
+def test_grid_spans_the_range(low, high, log):
+    points = _spread(low, high, 3, log=log)
+    if low == high:
+        assert points == [low]
+        return
+    assert points[0] == pytest.approx(low) and points[-1] == pytest.approx(high)
+    if log:
+        assert points[1] == pytest.approx(math.sqrt(low * high))
+    else:
+        assert points[1] == pytest.approx((low + high) / 2)
+
+def test_window_follows_a_winner_on_its_edge_and_narrows_on_one_inside():
+    limits = (0.0, 100.0)
+    assert _next_range((40.0, 60.0), limits, 60.0) == (50.0, 70.0)
+    assert _next_range((40.0, 60.0), limits, 50.0) == (45.0, 55.0)
+    # against the starting limits it narrows instead, and never leaves them
+    assert _next_range((80.0, 100.0), limits, 100.0) == (95.0, 100.0)
+    low, high = _next_range((10.0, 1000.0), (10.0, 1000.0), 100.0, log=True)
+    assert (low, high) == (pytest.approx(10 ** 1.5), pytest.approx(10 ** 2.5))
+
+def test_race_drops_clear_losers_after_one_step():
+    balancer = Balancer(party(), enemies(), 1, target_win_rate=0.5, step=500, max_fights=4000, seed=1)
+    hopeless, close, closer = Candidate(4000, 20, 30), Candidate(300, 10, 10), Candidate(120, 5, 8)
+    best = balancer.race([hopeless, close, closer])
+    assert hopeless.fights == 500 and hopeless.win_rate() == 0.0
+    assert best is min((close, closer), key=balancer.score)
+
+@pytest.mark.parametrize('target_win_rate, target_rounds', [(0.4, None), (0.4, 20.0)])
+def test_balanced_enemy_plays_to_target_on_the_object_engine(target_win_rate, target_rounds):
+    balancer, result = balance(party(), enemies(), target_win_rate=target_win_rate, target_rounds=target_rounds,
+                               seed=1, step=500, max_fights=8000, rounds_tolerance=1.5)
+    best = result.best
+    assert result.met and balancer.tuned == 1
+    tuned = enemies()
+    tuned[1] = Enemy('Sigurd', best.max_hp, defense=best.defense)
+    check = simulate(party(), tuned, fights=2000, workers=1, seed=2, enemy_damage=best.damage, lockstep=False)
+    rate = check.win_rate()
+    assert abs(rate - target_win_rate) < balancer.win_tolerance + 3 * math.sqrt(rate * (1 - rate) / check.fights)
+    if target_rounds is not None:
+        rounds = list(check.rounds.elements())
+        spread = statistics.stdev(rounds) / math.sqrt(len(rounds))
+        assert abs(check.mean_rounds() - target_rounds) < balancer.rounds_tolerance + 3 * spread
+
+def test_tuning_an_unknown_enemy_is_an_error():
+    with pytest.raises(ValueError, match="no enemy named 'Nobody'"):
+        balance(party(), enemies(), tune='Nobody')
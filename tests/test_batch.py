@@ -0,0 +1,102 @@
+import itertools
+import random
+from collections import Counter
+
+import numpy as np
+import pytest
+
+import batch
+from engine import Encounter, Enemy, Player, element_bits, elements
+from montecarlo import parse_player, simulate
+
+APPLY_SHIELD = Enemy.apply_shield
+
+
+def one_attack(applied, element, monkeypatch):
+    # the same attack on an enemy holding `applied` (oldest first) in the object engine
+    # and in a one-encounter batch: (engine state, batch state) of the target afterwards
+    shields = []
+
+    def spy(self, shield_type, duration, element=None, reduction=0):
+        # a Crystallize shield runs out with the attack's own tick, so catch it going on
+        shields.append(element_bits[element] if element else 0)
+        APPLY_SHIELD(self, shield_type, duration, element, reduction)
+
+    monkeypatch.setattr(Enemy, 'apply_shield', spy)
+    player, enemy = Player('P', 100, 0, 0, 30, element), Enemy('T', 500, defense=2, elements_applied=list(applied))
+    fight = Encounter([player], [enemy], rng=random.Random(0), history=0)
+    fight.start()
+    fight.attack(player, enemy, 7)
+    # the batch only keeps the element order up when someone can Crystallize
+    order = enemy.element_order if 'Geo' in (element, *applied) else None
+    expected = (enemy.element_mask, order, round(enemy.current_hp, 9), shields[-1] if shields else 0)
+
+    rng = np.random.default_rng(0)
+    lockstep = batch.BatchEncounters([Player('P', 100, 0, 0, 30, element)],
+                                     [Enemy('T', 500, defense=2, elements_applied=list(applied))], 1, rng)
+    lockstep._player_attacks(np.array([True]), np.array([0]), rng, (8, 3), 7)
+    shielded = lockstep.shield_type[0, 0] == batch.SHIELD_IMMUNITY
+    order = int(lockstep.element_order[0, 0]) if lockstep.element_order is not None else None
+    got = (int(lockstep.elements[0, 0]), order, round(float(lockstep.hp[0, 0]), 9),
+           int(lockstep.shield_element[0, 0]) if shielded else 0)
+    return expected, got
+
+@pytest.mark.parametrize('size', [0, 1, 2, 3])
+def test_an_attack_matches_the_object_engine(size, monkeypatch):
+    # every element set an enemy can start with, in every order, hit by every element
+    for applied in itertools.permutations(elements, size):
+        for element in elements:
+            expected, got = one_attack(applied, element, monkeypatch)
+            assert got == expected, (applied, element)
+
+def test_crystallize_shields_the_newest_element(monkeypatch):
+    # Geo on Pyro then Dendro is Crystallize (Geo+Pyro), but Dendro went on last
+    expected, got = one_attack(['Pyro', 'Dendro'], 'Geo', monkeypatch)
+    assert got[3] == expected[3] == element_bits['Dendro']
+
+@pytest.mark.parametrize('width', [1, 2, 3, 5])
+def test_living_picks_are_uniform(width):
+    # every draw lands on a living combatant, each of them equally often
+    table = batch.living_picks(width)
+    for living in range(1, 1 << width):
+        picked = Counter(table[living].tolist())
+        assert sorted(picked) == [combatant for combatant in range(width) if living >> combatant & 1]
+        assert len(set(picked.values())) == 1
+
+def test_next_turns_walk_the_order():
+    rng = np.random.default_rng(3)
+    width = 5
+    orders = np.array([rng.permutation(width) for _ in range(3)], dtype=np.int32)
+    slots, actors = batch.next_turns(orders)
+    cases = itertools.product(range(len(orders)), range(1 << width), range(width))
+    for index, (row, living, cursor) in enumerate(cases):
+        order = orders[row]
+        expected = next((slot for slot in ((cursor + step) % width for step in range(1, width))
+                         if living >> order[slot] & 1), cursor)
+        assert (slots[index], actors[index]) == (expected, order[expected])
+
+PARTIES = {
+    # Crystallize, Superconduct and Freeze against enemies that start with elements
+    'reactions': ([parse_player(spec) for spec in ('G:60:Geo:12', 'C:60:Cryo:9', 'E:55:Electro:15', 'H:50:Hydro:5')],
+                  [Enemy('A', 40, defense=2, elements_applied=['Pyro']),
+                   Enemy('B', 20, defense=5, elements_applied=['Dendro'])]),
+    # too many turn orders for next_turns' table
+    'crowd': ([parse_player(f'P{index}:40:{element}:{index + 5}') for index, element in enumerate(elements)] +
+              [parse_player('P7:40:Pyro:12')],
+              [Enemy(f'E{index}', 45, defense=1) for index in range(8)]),
+    # more combatants than BatchEncounters.living holds
+    'wide': ([parse_player(f'P{index}:40:{element}:{index + 5}') for index, element in enumerate(elements)] +
+             [parse_player('P7:40:Pyro:12'), parse_player('P8:40:Hydro:13')],
+             [Enemy(f'E{index}', 60, defense=1) for index in range(8)]),
+}
+
+@pytest.mark.parametrize('name', sorted(PARTIES))
+def test_batch_plays_like_the_object_engine(name):
+    party, enemies = PARTIES[name]
+    lockstep = batch.simulate_batch(party, enemies, fights=20000, seed=1, reroll_initiative=True)
+    objects = simulate(party, enemies, fights=1000, workers=1, seed=1, lockstep=False, reroll_initiative=True)
+    rate = objects.win_rate()
+    assert abs(lockstep.win_rate() - rate) < 4 * (rate * (1 - rate) / objects.fights) ** 0.5
+    rounds = list(objects.rounds.elements())
+    spread = (sum((value - objects.mean_rounds()) ** 2 for value in rounds) / len(rounds) / len(rounds)) ** 0.5
+    assert abs(lockstep.mean_rounds() - objects.mean_rounds()) < 4 * spread
@@ -0,0 +1,67 @@
+import itertools
+import random
+
+import pytest
+
+from composer import FRESH, Composition, RotationModel, play_composition, search, seat_players
+from dice import damage_pmf
+from engine import Enemy, elements
+from montecarlo import parse_player
+
+
+def enemies():
+    return [Enemy('Harin', 120, defense=2), Enemy('Sigurd', 300, defense=10)]
+
+def party():
+    return [parse_player(spec) for spec in ('A:60:Pyro', 'B:50:Pyro', 'C:40:Pyro')]
+
+
+@pytest.mark.parametrize('seed', range(3))
+def test_model_deals_what_the_turn_loop_deals(seed):
+    # with a flat roll the turn loop is deterministic, so the two must agree exactly
+    rng = random.Random(seed)
+    foes = enemies()
+    model = RotationModel(foes[0], foes[1:], pmf=damage_pmf(8, 3, 12))
+    for _ in range(60):
+        seats = tuple((rng.choice(elements), player.max_hp) for player in party())
+        played = play_composition(seat_players(party(), seats), foes, 'Harin', 6, 1, damage_override=12)
+        assert model.evaluate(seats, 6)[0] / 6 == pytest.approx(played)
+
+def test_model_expects_what_rolled_dice_average():
+    foes = enemies()
+    model = RotationModel(foes[0], foes[1:], pmf=damage_pmf(8, 3))
+    seats = (('Hydro', 60), ('Pyro', 50), ('Cryo', 40))
+    played = play_composition(seat_players(party(), seats), foes, 'Harin', 5, 400, seed=3)
+    assert model.evaluate(seats, 5)[0] / 5 == pytest.approx(played, rel=0.03)
+
+@pytest.mark.parametrize('rounds', [1, 7, 25])
+def test_repeating_rounds_add_up_like_playing_them_all(rounds):
+    foes = enemies()
+    model = RotationModel(foes[0], foes[1:], pmf=damage_pmf(8, 3))
+    for seats in itertools.product([('Dendro', 60), ('Pyro', 60)], [('Hydro', 50), ('Geo', 50)], [('Cryo', 40)]):
+        state, totals = FRESH, [0.0, 0, 0]
+        for _ in range(rounds):
+            state = model.play_round(state, seats, totals)
+        assert model.evaluate(seats, rounds) == pytest.approx(tuple(totals))
+
+def test_search_finds_the_brute_force_ranking():
+    # every turn order and element choice scored from scratch, one per cycle of seats
+    players = party() + [parse_player('D:60:Pyro')]
+    chosen = ('Pyro', 'Hydro', 'Cryo')
+    foes = enemies()
+    model = RotationModel(foes[0], foes[1:], pmf=damage_pmf(8, 3))
+    cycles = set()
+    for order in itertools.permutations([player.max_hp for player in players]):
+        for picked in itertools.product(chosen, repeat=len(players)):
+            seats = tuple(zip(picked, order))
+            starts = [seats[index:] + seats[:index] for index in range(len(seats)) if seats[index][1] == 60]
+            cycles.add(min(starts))
+    scored = sorted((Composition(seats, 8, *model.evaluate(seats, 8)).rank_key() for seats in cycles), reverse=True)
+    result = search(players, foes, rounds=8, top=5, candidate_elements=chosen, workers=1)
+    assert result.evaluated == len(cycles)
+    assert [composition.rank_key() for composition in result.ranked] == pytest.approx(scored[:5])
+    assert {composition.seats for composition in result.ranked} <= cycles
+
+def test_unknown_target_is_an_error():
+    with pytest.raises(ValueError, match="no enemy named 'Nobody'"):
+        search(party(), enemies(), target='Nobody', workers=1)
@@ -0,0 +1,87 @@
+import random
+from collections import Counter
+
+import pytest
+
+import dice
+from dice import damage_pmf, damage_sampler, dice_pmf, expected_value, predict_hit
+from engine import Enemy, Player
+
+
+@pytest.mark.parametrize('quantity, sides', [(1, 1), (1, 6), (3, 8), (10, 20), (0, 6), (51, 6), (65535, 20)])
+def test_pmf_sums_to_one(quantity, sides):
+    pmf = dice_pmf(quantity, sides)
+    assert sum(probability for _, probability in pmf) == pytest.approx(1.0)
+    assert all(0 <= probability <= 1 for _, probability in pmf)
+    assert expected_value(pmf) == pytest.approx(quantity * (sides + 1) / 2)
+
+def test_no_dice_is_a_sure_zero():
+    assert dice_pmf(0, 20) == ((0, 1.0),)
+
+@pytest.mark.parametrize('quantity, sides', [(-1, 6), (2, 0), (2, -4)])
+def test_impossible_dice_are_rejected(quantity, sides):
+    with pytest.raises(ValueError):
+        dice_pmf(quantity, sides)
+
+def test_damage_pmf_rejects_what_dice_pmf_does():
+    with pytest.raises(ValueError):
+        damage_pmf(6, -1)
+    # no die picked rolls the flat 1, like engine.roll_damage
+    assert damage_pmf(0, 2) == ((1, 1.0),)
+
+def test_damage_pmf_precedence():
+    assert damage_pmf(8, 3, 12.5) == ((12.5, 1.0),)
+    assert damage_pmf(None, 3) == ((1, 1.0),)
+    assert damage_pmf(6, 2) == dice_pmf(2, 6)
+
+def test_kill_chance_is_a_probability():
+    enemy = Enemy("X", 20, elements_applied=['Pyro'])
+    hit = predict_hit(enemy, Player("A", 30, 0, 0, 10, 'Hydro'), 6, 4)
+    assert hit.reaction.name == "Vaporize"
+    assert 0 < hit.kill_chance < 1
+    assert sum(probability for _, probability in hit.damage) == pytest.approx(1.0)
+
+def test_big_rolls_stay_exact():
+    # convolved right past COUNTED_DICE, against the integer counts
+    quantity = dice.COUNTED_DICE + 1
+    convolved = dice_pmf(quantity, 8)
+    counted = dice._counted_pmf(quantity, 8)
+    counted = dict(counted)
+    assert all(total in counted for total, _ in convolved)
+    assert max(abs(counted[total] - probability) for total, probability in convolved) < 1e-15
+    # what the convolution leaves out is below double precision
+    assert 1 - sum(counted[total] for total, _ in convolved) < 1e-12
+
+def test_only_the_preview_approximates():
+    quantity = dice.PREVIEW_DICE + 1
+    assert dice.preview_pmf(8, quantity) == dice.normal_pmf(quantity, 8)
+    assert dice.preview_pmf(8, quantity, 4.0) == damage_pmf(8, quantity, 4.0)
+    assert dice.preview_pmf(8, dice.PREVIEW_DICE) == damage_pmf(8, dice.PREVIEW_DICE)
+    approximate = dict(dice.normal_pmf(quantity, 8))
+    exact = dict(dice_pmf(quantity, 8))
+    assert max(abs(exact.get(total, 0) - probability) for total, probability in approximate.items()) < 1e-4
+    variance = sum(probability * (total - 4.5 * quantity) ** 2 for total, probability in approximate.items())
+    assert variance == pytest.approx(quantity * 63 / 12, rel=1e-3)
+
+def test_caches_are_bounded():
+    for cached in (dice_pmf, dice.normal_pmf, damage_sampler, dice._sampler_table):
+        assert cached.cache_info().maxsize == dice.PMF_CACHE
+
+def test_sampler_draws_from_the_distribution():
+    rng = random.Random(1)
+    roll = damage_sampler(6, 2)
+    draws = [roll(rng) for _ in range(60000)]
+    for total, probability in dice_pmf(2, 6):
+        assert draws.count(total) / len(draws) == pytest.approx(probability, abs=0.01)
+    assert damage_sampler(6, 2, 7.5)(rng) == 7.5
+    assert damage_sampler(None, 3)(rng) == 1
+
+@pytest.mark.parametrize('quantity', [2, 5])
+def test_batch_rolls_draw_from_the_distribution(quantity):
+    # 6 ** 2 outcomes are listed, 6 ** 5 go through the guide table
+    np = pytest.importorskip('numpy')
+    draws = dice.sample_damage(np.random.default_rng(2), 200000, 6, quantity)
+    rolled = Counter(draws.tolist())
+    for total, probability in dice_pmf(quantity, 6):
+        assert rolled.pop(total, 0) / len(draws) == pytest.approx(probability, abs=0.005)
+    assert not rolled
@@ -0,0 +1,135 @@
+import random
+
+import pytest
+
+from engine import EffectScheduler, Enemy
+
+DEBUFFS = ["Freeze", "Petrify", "Superconduct", "Toxic Spores"]
+DOTS = ["Burning", "Bleed"]
+
+
+class Countdown:
+    # the effects of one enemy the way they used to run: every tick counts every
+    # duration down and whatever reaches 0 ends, Toxic Spores going off after that
+    def __init__(self, enemy):
+        self.enemy = enemy
+        self.hp = enemy.current_hp
+        self.debuffs = {}  # name -> [ticks left, DoT percentage]
+        self.shield = None  # [ticks left, type, reduction]
+
+    def tick(self):
+        # whether the enemy had anything to do this tick
+        enemy = self.enemy
+        burning = any(percentage for _, percentage in self.debuffs.values())
+        self.hp -= sum(enemy.max_hp * percentage / 100 for _, percentage in self.debuffs.values())
+        ended = [name for name, timer in self.debuffs.items() if timer[0] == 1]
+        for timer in self.debuffs.values():
+            timer[0] -= 1
+        for name in ended:
+            del self.debuffs[name]
+        if self.shield:
+            self.shield[0] -= 1
+            if not self.shield[0]:
+                self.shield = None
+                ended.append(None)
+        if "Toxic Spores" in ended:
+            defense = enemy.defense * (0.5 if "Superconduct" in self.debuffs else 1)
+            damage = enemy.max_hp * 0.05 - defense
+            if self.shield and self.shield[1] == 'Damage Reduction':
+                damage *= 1 - self.shield[2]
+            self.hp -= max(damage, 0)
+        return burning or bool(ended)
+
+def apply_random(rng, enemy, reference):
+    duration = rng.randint(0, 4)
+    kind = rng.random()
+    if kind < 0.5:
+        name = rng.choice(DEBUFFS)
+        enemy.apply_debuff(name, duration)
+        reference.debuffs[name] = [max(duration, 1), 0]
+        if name == "Freeze":
+            enemy.is_frozen = True
+        if name == "Petrify":
+            enemy.is_petrified = True
+    elif kind < 0.8:
+        name, percentage = rng.choice(DOTS), rng.choice([1, 2, 5])
+        enemy.apply_dot(percentage, duration, name)
+        reference.debuffs[name] = [max(duration, 1), percentage]
+    elif kind < 0.9:
+        enemy.apply_shield('Damage Reduction', duration, reduction=0.3)
+        reference.shield = [max(duration, 1), 'Damage Reduction', 0.3]
+    else:
+        enemy.apply_shield('Elemental Immunity', duration, element='Pyro')
+        reference.shield = [max(duration, 1), 'Elemental Immunity', 0]
+
+def assert_same(enemy, reference):
+    assert sorted(enemy.debuffs) == sorted(reference.debuffs)
+    assert (enemy.shield is None) == (reference.shield is None)
+    assert enemy.current_hp == pytest.approx(reference.hp)
+    assert enemy.is_frozen == ("Freeze" in reference.debuffs)
+    assert enemy.is_petrified == ("Petrify" in reference.debuffs)
+
+
+@pytest.mark.parametrize('seed', range(5))
+def test_timer_wheel_runs_effects_like_countdowns(seed):
+    rng = random.Random(seed)
+    effects = EffectScheduler()
+    references = []
+    for index in range(4):
+        enemy = Enemy(f'E{index}', 1000, defense=rng.choice([0, 4, 10]))
+        effects.adopt(enemy)
+        references.append(Countdown(enemy))
+    for step in range(300):
+        if step % 50 == 25:
+            # joining mid-fight with effects already running, on a clock of its own
+            enemy = Enemy(f'E{len(references)}', 1000, defense=2)
+            reference = Countdown(enemy)
+            for _ in range(3):
+                apply_random(rng, enemy, reference)
+            effects.adopt(enemy)
+            references.append(reference)
+        for _ in range(rng.randint(0, 3)):
+            reference = rng.choice(references)
+            apply_random(rng, reference.enemy, reference)
+        due = effects.advance()
+        for enemy, expired in due.items():
+            enemy.tick_effects(expired)
+        for reference in references:
+            # an enemy is only visited when something of it runs out or a DoT runs
+            assert (reference.enemy in due) == reference.tick()
+            assert_same(reference.enemy, reference)
+
+def test_spores_go_off_after_the_tick_expiries():
+    # Superconduct outlasts the detonation tick, the Damage Reduction shield ends on it
+    effects = EffectScheduler()
+    enemy = Enemy('Harin', 200, defense=4)
+    effects.adopt(enemy)
+    enemy.apply_debuff("Toxic Spores", 3)
+    enemy.apply_debuff("Superconduct", 4)
+    enemy.apply_dot(1, 3, "Burning")
+    ticks = []
+    for _ in range(3):
+        ticks.append(enemy.tick_effects(effects.advance()[enemy]))
+        if len(ticks) == 1:
+            enemy.apply_shield('Damage Reduction', 2, reduction=0.3)
+    assert ticks[:2] == [[('dot damage', None, enemy, 2.0, 198.0, None)],
+                         [('dot damage', None, enemy, 2.0, 196.0, None)]]
+    assert ticks[2][:2] == [('dot damage', None, enemy, 2.0, 194.0, None),
+                            ('damage', None, enemy, 8.0, 186.0, "Toxic Spores")]
+    assert sorted(enemy.debuffs) == ["Superconduct"] and enemy.shield is None
+
+def test_moved_enemies_leave_stale_entries_behind():
+    # the old fight's entries for a moved enemy are skipped, the new one runs them on its clock
+    first, second = EffectScheduler(), EffectScheduler()
+    enemy = Enemy('Sigurd', 300)
+    first.adopt(enemy)
+    for _ in range(5):
+        first.advance()
+    enemy.apply_debuff("Freeze", 2)
+    enemy.apply_debuff("Petrify", 3)
+    first.advance()
+    second.adopt(enemy)
+    assert [first.advance() for _ in range(3)] == [{}, {}, {}]
+    freeze, petrify = enemy.debuffs["Freeze"], enemy.debuffs["Petrify"]
+    assert [second.advance() for _ in range(3)] == [
+        {enemy: [(enemy, "Freeze", freeze)]}, {enemy: [(enemy, "Petrify", petrify)]}, {}]
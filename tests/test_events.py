@@ -0,0 +1,115 @@
+import random
+
+import pytest
+
+from engine import EventLog, Encounter, Enemy, event_formats, format_event, player_heal
+from montecarlo import parse_player
+from replay import Action, Fight
+
+
+def texts(events):
+    return [format_event(event) for event in events]
+
+def test_events_read_like_the_old_log_lines():
+    # every kind of event, against the f-strings the log was built from before events
+    seen = set()
+
+    def check(events, lines):
+        seen.update(event[0] for event in events)
+        assert texts(events) == lines
+
+    ayla, bram = parse_player('Ayla:60:Pyro:20'), parse_player('Bram:12:Geo:1')
+    harin = Enemy('Harin', 100, defense=2, elements_applied=['Hydro'])
+    sigurd = Enemy('Sigurd', 40, defense=10, elements_applied=['Pyro'], initiative=5)
+    fight = Encounter([ayla, bram], [harin, sigurd], rng=random.Random(1))
+    fight.start()
+
+    fight.attack(ayla, harin, 10)
+    check(fight.events, ["Pyro applied to Harin.",
+                         "Reaction triggered: Vaporize",
+                         "Effect: Removes ALL applied elements.",
+                         "Harin takes 13.00 damage! Remaining HP: 87.00",
+                         f"Sigurd attacks {fight.events[4][2].name} for 10 damage."])
+    fight.attack(bram, sigurd, 30)
+    check(fight.events, ["Geo applied to Sigurd.",
+                         "Reaction triggered: Crystallize",
+                         "Effect: Creates a shield granting immunity to Pyro for 1 turn. Removes ALL elements.",
+                         "Sigurd gains a shield granting immunity to certain damage.",
+                         f"Harin attacks {fight.events[4][2].name} for 10 damage."])
+    check([harin.apply_element('Pyro'), harin.apply_element('Pyro')],
+          ["Pyro applied to Harin.", "Harin already has Pyro applied."])
+    sigurd.apply_shield('Elemental Immunity', 1, element='Pyro')  # Crystallize's ran out with Bram's attack
+    check([sigurd.calculate_damage(50, attack_element='Pyro')], ["Sigurd is immune to Pyro damage!"])
+    sigurd.apply_shield('Damage Reduction', 2, reduction=0.3)
+    check([('shield', None, sigurd, None, None, 'Damage Reduction')], ["Sigurd gains a shield reducing incoming damage."])
+
+    check([harin.apply_debuff("Freeze", 1), harin.apply_dot(3, 3, "Burning")],
+          ["Harin is affected by Freeze for 1 turn(s).", "Burning will deal 3.00 damage per turn for 3 turns."])
+    check(harin.process_dot(), ["Harin takes 3.00 DoT damage! Remaining HP: 84.00"])
+    check([harin.calculate_damage(7, source="Toxic Spores")], ["Harin takes 5.00 damage! Remaining HP: 79.00"])
+    check([harin.apply_heal(10), player_heal(ayla, 25)],
+          ["Harin heals for 10.00 HP! Current HP: 89.00", f"Ayla heals for 15.00 HP! Current HP: {ayla.current_hp:.2f}"])
+    harin.is_frozen = True
+    fight.events.clear()
+    fight.enemies_turn(harin)
+    check(fight.events, ["Harin is unable to act."])
+
+    fight.events.clear()
+    fight.area_damage(40, attack_element='Pyro', label='Thunderstorm')
+    fight.area_debuff('Disadvantage', 1)
+    check(fight.events, ["Thunderstorm hits 2 enemies for 59.00 total damage! Harin: 38.00, Sigurd: 21.00",
+                         "2 enemies are affected by Disadvantage for 1 turn(s)."])
+    fight.events.clear()
+    sigurd.current_hp = 0
+    fight.check_enemy_defeat(sigurd)
+    harin.current_hp = 0
+    fight.check_enemy_defeat(harin)
+    check(fight.events, ["Sigurd has been defeated!", "Harin has been defeated!", "All enemies have been defeated!"])
+    assert seen == set(event_formats)
+
+def test_crowds_are_summed_up():
+    fight = Encounter([parse_player('Ayla:60:Pyro:20')],
+                      [Enemy(f'E{index}', 30, defense=index) for index in range(6)], rng=random.Random(1))
+    fight.enemies[2].apply_shield('Elemental Immunity', 1, element='Electro')
+    fight.area_damage(5, 2.0, attack_element='Electro', label='Electro-charged')
+    assert texts(fight.events) == ["Electro-charged hits 5 enemies for 37.00 total damage! 1 immune."]
+
+def seeded_fight(seed, history):
+    rng = random.Random(seed)
+    players = [parse_player(spec) for spec in ('Ayla:200:Anemo:15', 'Bram:180:Hydro:8', 'Cato:160:Cryo:5')]
+    enemies = [Enemy(f'E{index}', 60, defense=2, elements_applied=[rng.choice(['Pyro', 'Dendro', 'Electro'])],
+                     initiative=rng.randint(1, 20)) for index in range(4)]
+    return Fight(seed, players, enemies, history=history)
+
+@pytest.mark.parametrize('seed', range(4))
+def test_history_is_the_log_of_every_action(seed):
+    # formatted as they happen, one action at a time, against the kept events formatted at the end
+    rng = random.Random(seed)
+    whole, short = seeded_fight(seed, 100000), seeded_fight(seed, 25)
+    lines = texts(whole.encounter.events)
+    while not whole.encounter.is_over():
+        action = Action(rng.randrange(len(whole.encounter.enemies)), 8, 2, None, 10)
+        for fight in (whole, short):
+            fight.play(action)
+        lines.extend(whole.encounter.log_messages)
+        assert short.encounter.log_messages == whole.encounter.log_messages
+    assert whole.encounter.history.lines() == lines
+    assert short.encounter.history.lines() == lines[-25:]
+    assert short.encounter.history.lines(last=10) == lines[-10:]
+    assert short.encounter.history.appended == len(lines)
+
+def test_rewinding_drops_the_newest_events():
+    log, kept = EventLog(5), []
+    for count in (3, 4, 2):
+        events = [('note', None, None, None, None, f'{count}.{index}') for index in range(count)]
+        log.extend(events)
+        kept.extend(events)
+    log.rewind(7)
+    assert list(log) == kept[4:7] and log.appended == 7
+    log.rewind(5)
+    assert list(log) == kept[4:5]
+    log.extend(kept[5:9])
+    assert log.lines() == texts(kept[4:9]) and log.lines(last=2) == texts(kept[7:9])
+    silent = EventLog(0)
+    silent.extend(kept)
+    assert len(silent) == 0 and silent.appended == 9
@@ -0,0 +1,89 @@
+import bisect
+import pickle
+import random
+
+import pytest
+
+from engine import Enemy, InitiativeOrder
+
+
+class SortedOrder:
+    # the rules on a plain sorted list: (key, combatant) pairs and the cursor's key
+    def __init__(self, combatants):
+        self.entries = sorted(((-c.initiative, joined), c) for joined, c in enumerate(combatants, 1))
+        self.joined = len(self.entries)
+        self.cursor = self.entries[0][0] if self.entries else None
+        self.live = True
+        self.left = None
+
+    def current(self):
+        # a combatant that left on its own turn stays current until the turn advances
+        if self.cursor is None:
+            return None
+        return next(c for key, c in self.entries if key == self.cursor) if self.live else self.left
+
+    def insert(self, combatant):
+        self.joined += 1
+        key = (-combatant.initiative, self.joined)
+        bisect.insort(self.entries, (key, combatant), key=lambda entry: entry[0])
+        if self.cursor is None:
+            self.cursor, self.live = key, True
+
+    def discard(self, combatant):
+        for index, (key, c) in enumerate(self.entries):
+            if c is combatant:
+                del self.entries[index]
+                if key == self.cursor and self.live:
+                    self.live, self.left = False, combatant
+                if not self.entries:
+                    self.cursor = None
+                return
+
+    def advance(self):
+        keys = [key for key, _ in self.entries]
+        index = bisect.bisect_right(keys, self.cursor) if not self.live else keys.index(self.cursor) + 1
+        wrapped = index == len(keys)
+        self.cursor, self.live = keys[0 if wrapped else index], True
+        return wrapped
+
+    def seek(self, combatant):
+        self.cursor = next(key for key, c in self.entries if c is combatant)
+        self.live = True
+
+
+@pytest.mark.parametrize('seed', range(20))
+def test_matches_a_sorted_list(seed):
+    rng = random.Random(seed)
+    spread = rng.choice((3, 20, 1000))  # lots of ties, a d20, hardly any
+    made = iter(range(10 ** 6))
+
+    def enemy():
+        return Enemy(f"E{next(made)}", 10, initiative=rng.randint(1, spread))
+
+    start = [enemy() for _ in range(rng.randint(1, 12))]
+    order, reference = InitiativeOrder(start), SortedOrder(start)
+    for _ in range(400):
+        members = list(reference.entries)
+        roll = rng.random()
+        if roll < 0.3 or not members:
+            newcomer = enemy()
+            order.insert(newcomer)
+            reference.insert(newcomer)
+        elif roll < 0.55:
+            # often the one whose turn it is, like an enemy dying to its own reaction
+            victim = order.current if rng.random() < 0.4 and order.current in order else rng.choice(members)[1]
+            order.discard(victim)
+            reference.discard(victim)
+        elif roll < 0.9:
+            if reference.cursor is not None:
+                assert order.advance() == reference.advance()
+        elif roll < 0.95:
+            target = rng.choice(members)[1]
+            order.seek(target)
+            reference.seek(target)
+        else:
+            # copied together, so both still hold the same combatants
+            order, reference = pickle.loads(pickle.dumps((order, reference)))
+        assert list(order) == [c for _, c in reference.entries]
+        assert len(order) == len(reference.entries)
+        assert order.current is reference.current()
@@ -0,0 +1,25 @@
+import pytest
+
+from engine import default_enemies
+from montecarlo import parse_player, simulate
+from tactics import parse_policy
+
+
+def party():
+    return [parse_player('A:60:Pyro:14'), parse_player('B:50:Hydro:9')]
+
+def test_plain_fights_run_in_lockstep():
+    result = simulate(party(), default_enemies(), fights=3000, workers=1, seed=1)
+    assert result.lockstep and result.fights == 3000
+    assert result.wins + result.losses + result.draws == 3000
+
+@pytest.mark.parametrize('options', [dict(analytics=True), dict(enemy_policy=parse_policy('focus')),
+                                     dict(lockstep=False)])
+def test_what_lockstep_cannot_play_runs_fight_by_fight(options):
+    result = simulate(party(), default_enemies(), fights=200, workers=1, seed=1, **options)
+    assert not result.lockstep and result.fights == 200
+    assert (result.analytics is not None) == bool(options.get('analytics'))
+
+def test_lockstep_refuses_analytics():
+    with pytest.raises(ValueError):
+        simulate(party(), default_enemies(), fights=10, workers=1, lockstep=True, analytics=True)
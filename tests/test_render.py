@@ -0,0 +1,66 @@
+import itertools
+
+import pygame
+import pytest
+
+from render import VirtualGrid
+
+SHAPES = [((10, 20, 300, 200), (40, 30), (50, 45)),  # gaps between slots
+          ((0, 0, 95, 120), (48, 40), (48, 40)),  # no gaps, a column of spare width
+          ((5, 7, 30, 100), (60, 25), (64, 30))]  # narrower than one slot
+
+
+def card(grid, index):
+    # what a click used to test: the card's rect, only where it shows inside the viewport
+    return pygame.Rect(grid.slot(index), grid.cell).clip(grid.viewport)
+
+def scrolled(shape, count):
+    viewport, cell, pitch = shape
+    grid = VirtualGrid(viewport, cell, pitch)
+    grid.set_count(count)
+    for scroll in sorted({0, 1, pitch[1] - 1, pitch[1] + 7, grid.max_scroll() // 2, grid.max_scroll()}):
+        grid.scroll = 0
+        grid.scroll_by(scroll)
+        yield grid
+
+
+@pytest.mark.parametrize('shape', SHAPES)
+@pytest.mark.parametrize('count', [0, 1, 7, 40])
+def test_index_at_finds_the_card_under_the_pointer(shape, count):
+    for grid in scrolled(shape, count):
+        viewport = grid.viewport
+        cards = [card(grid, index) for index in range(count)]
+        for x, y in itertools.product(range(viewport.left - 3, viewport.right + 3, 3),
+                                      range(viewport.top - 3, viewport.bottom + 3, 3)):
+            under = [index for index, rect in enumerate(cards) if rect.collidepoint(x, y)]
+            assert grid.index_at((x, y)) == (under[0] if under else None)
+
+@pytest.mark.parametrize('shape', SHAPES)
+@pytest.mark.parametrize('count', [0, 1, 7, 40])
+def test_visible_rows_cover_every_card_in_view(shape, count):
+    for grid in scrolled(shape, count):
+        viewport = grid.viewport
+        showing = {index for index in range(count) if card(grid, index).size != (0, 0)}
+        # whole rows, counting the gap below a row as part of it
+        rows = {index for index in range(count)
+                if pygame.Rect(viewport.x, grid.slot(index)[1], viewport.w, grid.pitch[1]).colliderect(viewport)}
+        assert showing <= set(grid.visible()) == rows
+
+@pytest.mark.parametrize('shape', SHAPES[:2])
+def test_scroll_to_brings_a_card_fully_into_view(shape):
+    viewport, cell, pitch = shape
+    grid = VirtualGrid(viewport, cell, pitch)
+    grid.set_count(40)
+    for index in (39, 0, 17, 38, 3):
+        grid.scroll_to(index)
+        assert card(grid, index).size == tuple(cell)
+        assert grid.index_at(grid.slot(index)) == index
+
+def test_reshape_keeps_the_first_visible_card_on_top():
+    grid = VirtualGrid((0, 0, 300, 200), (40, 30), (50, 45))
+    grid.set_count(200)
+    grid.scroll_by(45 * 7)
+    first = grid.visible().start
+    grid.reshape((60, 40), (70, 50))
+    assert grid.visible().start == first // grid.columns * grid.columns
+    assert grid.index_at(grid.slot(first)) == first
@@ -0,0 +1,88 @@
+import pytest
+
+from engine import Enemy
+from montecarlo import parse_player
+from replay import Action, Fight, JournalWriter, Replay, read_journal
+from tactics import parse_policy
+
+
+def setup():
+    players = [parse_player('Ayla:60:Pyro:14'), parse_player('Bram:50:Hydro:9')]
+    enemies = [Enemy('Harin', 40, defense=2, initiative=11), Enemy('Sigurd', 55, initiative=5)]
+    return players, enemies
+
+def state(fight):
+    encounter = fight.encounter
+    return ([(c.name, c.current_hp, c.total_damage_dealt) for c in encounter.players + encounter.enemies],
+            [(e.name, e.element_mask, sorted(e.debuffs)) for e in encounter.enemies],
+            encounter.round_number, fight.actions)
+
+def actions(count):
+    # a mix of dice, flat damage and the default 1, at whichever enemy is still around
+    for i in range(count):
+        if i % 3 == 0:
+            yield Action(i % 2, 8, 2, enemy_damage=6)
+        elif i % 3 == 1:
+            yield Action(0, 6, None, 7.5, enemy_damage=6)
+        else:
+            yield Action(1, None, None, enemy_damage=4)
+
+def test_action_record_round_trip():
+    for action in (Action(3, 20, 65535, None, 12.5), Action(0, None, None, 4.25), Action(2, 6, 0)):
+        back = Action.unpack(action.pack())
+        assert [getattr(back, name) for name in Action.__slots__] == [getattr(action, name) for name in Action.__slots__]
+
+@pytest.mark.parametrize('fields', [(-1, 6, 2), (0, 6, -1), (0, 6, 65536), (65536, 6, 2), (0, 70000, 1)])
+def test_action_rejects_what_a_record_cannot_hold(fields):
+    with pytest.raises(ValueError):
+        Action(*fields)
+
+def test_journal_replays_the_live_fight(tmp_path):
+    path = tmp_path / 'fight.journal'
+    live = Fight(42, *setup(), enemy_policy=parse_policy('focus'))
+    journal = JournalWriter(str(path), 42, *setup(), enemy_policy=parse_policy('focus'))
+    states = [state(live)]
+    for action in actions(40):
+        if live.encounter.is_over():
+            break
+        action.target = min(action.target, len(live.encounter.enemies) - 1)
+        journal.write(action)
+        live.play(action)
+        states.append(state(live))
+    journal.close()
+
+    seed, _, recorded = read_journal(str(path))
+    assert seed == 42 and len(recorded) == live.actions
+    replay = Replay.load(str(path), interval=5)
+    assert state(replay.run()) == state(live)
+    # seeking either way lands where the live fight was, from snapshots or not
+    for index in (len(states) - 1, 3, 12, 0, 7):
+        assert state(replay.seek(index)) == states[index]
+
+def test_torn_last_record_is_dropped(tmp_path):
+    path = tmp_path / 'torn.journal'
+    journal = JournalWriter(str(path), 7, *setup())
+    journal.write(Action(0, 8, 2))
+    journal.file.write(Action(1, 8, 2).pack()[:5])
+    journal.close()
+    assert len(read_journal(str(path))[2]) == 1
+
+def test_snapshots_are_taken_at_load(tmp_path, monkeypatch):
+    path = tmp_path / 'long.journal'
+    journal = JournalWriter(str(path), 3, *setup())
+    for _ in range(23):
+        journal.write(Action(0, None, None, 0.5, enemy_damage=1))
+    journal.close()
+    replay = Replay.load(str(path), interval=5)
+    assert sorted(replay.checkpoints) == [0, 5, 10, 15, 20]
+    # a seek replays only what follows the nearest snapshot
+    played = []
+    monkeypatch.setattr(Fight, 'play', lambda fight, action: played.append(action))
+    replay.seek(23)
+    assert played == replay.actions[20:]
+
+@pytest.mark.parametrize('seed', [-1, 1 << 64])
+def test_journal_rejects_seeds_the_header_cannot_hold(tmp_path, seed):
+    with pytest.raises(ValueError):
+        JournalWriter(str(tmp_path / 'bad.journal'), seed, *setup())
+    assert not (tmp_path / 'bad.journal').exists()
@@ -0,0 +1,36 @@
+import pickle
+
+from engine import Player
+from montecarlo import load_party
+from roster import Roster
+
+
+def characters():
+    return [Player('Ayla', 60, 14, 30, 12, 'Pyro'), Player('Bram', 50, 12, 25, 17, 'Hydro', 5)]
+
+def fields(player):
+    return (player.name, player.max_hp, player.ac, player.movement, player.initiative, player.element, player.temp_hp)
+
+def test_party_comes_from_the_roster(tmp_path):
+    path = str(tmp_path / 'roster.db')
+    roster = Roster(path)
+    ayla, bram = characters()
+    roster.add(ayla)
+    roster.add(bram)
+    roster.add(Player('Cato', 40, 10, 30, 20, 'Cryo'), in_party=False)
+    roster.close()
+    # highest initiative first, benched characters left out
+    assert [fields(player) for player in load_party(path)] == [fields(bram), fields(ayla)]
+
+def test_old_pickles_still_load(tmp_path):
+    # saved by dndSim when it defined Player itself and ran as __main__
+    data = pickle.dumps(characters(), protocol=2).replace(b'cengine\nPlayer\n', b'c__main__\nPlayer\n')
+    assert b'__main__' in data
+    path = tmp_path / 'players.pkl'
+    path.write_bytes(data)
+    assert [fields(player) for player in load_party(str(path))] == [fields(player) for player in characters()]
+
+def test_missing_party_file_is_empty(tmp_path):
+    path = tmp_path / 'roster.db'
+    assert load_party(str(path)) == []
+    assert not path.exists()
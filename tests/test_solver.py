@@ -0,0 +1,31 @@
+import pytest
+
+from montecarlo import parse_enemy, parse_player, simulate
+from solver import INITIATIVE_DIE, initiative_rolls, solve
+
+
+def duel():
+    return [parse_player('A:30:Pyro:12')], [parse_enemy('X:25:2')]
+
+def test_initiative_rolls_cover_every_roll():
+    players, enemies = duel()
+    rolls = initiative_rolls(players, [enemies[0], enemies[0]])
+    assert sum(probability for probability, _ in rolls) == pytest.approx(1.0)
+    # beats, ties (the player joined first) or trails the player's 12, for each of two enemies
+    assert len(rolls) == 3 * 2
+    assert all(len(roll) == 2 and all(1 <= initiative <= INITIATIVE_DIE for initiative in roll) for _, roll in rolls)
+
+def test_solver_is_deterministic():
+    players, enemies = duel()
+    first = solve(players, enemies, dice=(6, 2), enemy_damage=6)
+    second = solve(players, enemies, dice=(6, 2), enemy_damage=6)
+    assert (first.win, first.loss, first.mean_rounds_to_win()) == (second.win, second.loss, second.mean_rounds_to_win())
+
+def test_solver_agrees_with_monte_carlo():
+    players, enemies = duel()
+    exact = solve(players, enemies, dice=(6, 2), enemy_damage=6)
+    assert exact.win + exact.loss == pytest.approx(1.0)
+    sampled = simulate(players, enemies, fights=20000, workers=1, seed=7, dice=(6, 2), enemy_damage=6)
+    error = (exact.win * (1 - exact.win) / sampled.fights) ** 0.5
+    assert abs(sampled.win_rate() - exact.win) < 4 * error
+    assert sampled.mean_rounds() == pytest.approx(exact.mean_rounds_to_win(), abs=0.05)
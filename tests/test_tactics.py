@@ -0,0 +1,45 @@
+import argparse
+import random
+
+import pytest
+
+import tactics
+from engine import Enemy, Encounter
+from montecarlo import parse_player
+from tactics import ExpectimaxPolicy, parse_policy
+
+
+def encounter(policy=None):
+    players = [parse_player('Ayla:60:Pyro:14'), parse_player('Bram:25:Hydro:9'), parse_player('Cato:40:Cryo:3')]
+    enemies = [Enemy('Harin', 40, defense=2, initiative=11), Enemy('Sigurd', 55, initiative=5)]
+    fight = Encounter(players, enemies, rng=random.Random(3), enemy_policy=policy)
+    fight.start()
+    return fight
+
+@pytest.mark.parametrize('spec', ['random', 'focus', 'threat', 'expectimax:8:500', 'expectimax:3:200:40'])
+def test_spec_round_trip(spec):
+    assert parse_policy(spec).spec == spec
+
+@pytest.mark.parametrize('spec', ['expectimax:0', 'expectimax:-2', 'expectimax:4:0', 'expectimax:4:-10',
+                                  'expectimax:4:100:0', 'expectimax:x', 'focus:3', 'nearest'])
+def test_bad_specs_are_rejected(spec):
+    with pytest.raises(argparse.ArgumentTypeError):
+        parse_policy(spec)
+
+@pytest.mark.parametrize('spec', ['random', 'focus', 'threat', 'expectimax:4:300'])
+def test_policies_pick_a_living_player(spec):
+    fight = encounter(parse_policy(spec))
+    assert fight.enemy_policy.choose(fight, fight.enemies[0]) in fight.players
+
+def test_focus_goes_for_the_weakest():
+    fight = encounter()
+    assert parse_policy('focus').choose(fight, fight.enemies[0]).name == 'Bram'
+
+def test_expectimax_falls_back_when_no_search_finished(monkeypatch):
+    def out_of_budget(self, depth, limit, deadline):
+        raise tactics.OutOfBudget
+    monkeypatch.setattr(tactics._Search, 'root', out_of_budget)
+    fight = encounter()
+    policy = ExpectimaxPolicy(depth=3, nodes=10)
+    assert policy.choose(fight, fight.enemies[0]) is fight.players[0]
+    assert policy.reached == 0
@@ -0,0 +1,78 @@
+import random
+
+import pytest
+
+from engine import Enemy, format_event
+from montecarlo import parse_player
+from replay import Action, Fight, Replay, describe_setup
+from undo import UndoHistory
+
+
+def setup(seed):
+    rng = random.Random(seed)
+    players = [parse_player(spec) for spec in
+               ('Ayla:300:Anemo:15', 'Bram:280:Hydro:8', 'Cato:260:Electro:5', 'Dara:290:Cryo:12', 'Edda:250:Pyro:2')]
+    enemies = [Enemy(f"E{index}", rng.choice((20, 40, 80)), defense=rng.choice((0, 2, 5)), initiative=rng.randint(1, 20))
+               for index in range(12)]
+    return players, enemies
+
+def state(fight):
+    # everything a later action can see: combatants, turn order, clock, events and both random streams
+    encounter = fight.encounter
+
+    def enemy(e):
+        return (e.name, round(e.current_hp, 9), e.element_mask, e.element_order, e.swirled_mask,
+                e.is_frozen, e.is_petrified, e.marked,
+                sorted((name, record.expires, getattr(record, 'percentage', 0)) for name, record in e.debuffs.items()),
+                None if e.shield is None else (e.shield.type, e.shield.expires, e.shield.element, e.shield.reduction),
+                e.actions_taken, round(e.total_damage_dealt, 9), round(e.total_damage_taken, 9))
+
+    def player(p):
+        return (p.name, round(p.current_hp, 9), p.temp_hp, p.actions_taken,
+                round(p.total_damage_dealt, 9), round(p.total_damage_taken, 9))
+
+    current = encounter.current_actor()
+    return ([player(p) for p in encounter.players], [enemy(e) for e in encounter.enemies],
+            [turn.actor.name for turn in encounter.initiative.order], current and current.name,
+            encounter.round_number, encounter.effects.clock.now, [format_event(event) for event in encounter.events],
+            fight.actions, encounter.rng.getstate(), fight.dice_rng.getstate())
+
+@pytest.mark.parametrize('seed', range(6))
+def test_undo_and_redo_match_a_replay(seed):
+    # random play, undo and redo; whatever is left played must be where a replay of it lands
+    moves = random.Random(seed + 1)
+    fight = Fight(seed, *setup(seed))
+    history = UndoHistory(fight, depth=20)
+    played = []
+    for step in range(150):
+        if fight.encounter.is_over():
+            break
+        roll = moves.random()
+        if roll < 0.3 and history.can_undo():
+            history.undo()
+            played.pop()
+        elif roll < 0.5 and history.can_redo():
+            played.append(history.redo())
+        else:
+            action = Action(moves.randrange(len(fight.encounter.enemies)), 6, 2, None, moves.choice((3, 10)))
+            fight.play(action)
+            history.record(action)
+            played.append(action)
+        if step % 5 == 0:
+            replay = Replay(seed, describe_setup(*setup(seed)), list(played))
+            assert state(replay.seek(len(played))) == state(fight), step
+    assert played
+
+def test_undo_stops_at_the_depth():
+    fight = Fight(0, *setup(0))
+    history = UndoHistory(fight, depth=3)
+    for _ in range(5):
+        action = Action(0, 6, 2)
+        fight.play(action)
+        history.record(action)
+    undone = 0
+    while history.can_undo():
+        history.undo()
+        undone += 1
+    assert undone == 3
+    assert fight.actions == 2
@@ -0,0 +1,199 @@
+from collections import deque
+
+from engine import Debuff, DoT, Shield
+
+
+# =======================================================================
+#            Undo/redo: per-action snapshots with shared records
+# =======================================================================
+# After every action the whole fight is snapshotted: combatants (HP, elements, debuffs,
+# shields, status, counters), who is in the fight, the turn order and cursor, the round,
+# the effect clock, the last action's events and the random streams. A snapshot is
+# mostly references: a combatant's record is an immutable tuple rebuilt only when the
+# combatant changed since the previous snapshot (its version counter or action counters
+# moved), otherwise the previous record is shared, and the same goes for the member
+# lists and the turn order. An action touching a few enemies costs a few tuples, however
+# many enemies the fight has, and undo writes back only the combatants that differ.
+#
+# Restoring never winds a version counter back, it bumps it past the current value, so
+# a (combatant, version) pair still names one state for good and render caches keyed on
+# it can't show a card of a state that was undone.
+
+UNDO_DEPTH = 200
+
+# leading fields of every record: what tells whether the combatant changed
+STAMP = 3
+
+
+def _player_record(player):
+    return (player.version, player.actions_taken, player.total_damage_dealt,
+            player.current_hp, player.temp_hp, player.total_damage_taken, player.element, player.initiative)
+
+def _restore_player(player, record):
+    (_, player.actions_taken, player.total_damage_dealt,
+     player.current_hp, player.temp_hp, player.total_damage_taken, player.element, player.initiative) = record
+    player.version += 1
+
+def _enemy_record(enemy):
+    shield = enemy.shield
+    return (enemy.version, enemy.actions_taken, enemy.total_damage_dealt,
+            enemy.current_hp, enemy.total_damage_taken, enemy.element_mask, enemy.element_order,
+            enemy.swirled_mask, enemy.is_frozen, enemy.is_petrified, enemy.marked,
+            tuple((name, type(record), record.expires, record.percentage) for name, record in enemy.debuffs.items()),
+            None if shield is None else (shield.type, shield.expires, shield.element, shield.reduction))
+
+def _restore_enemy(enemy, record):
+    (_, enemy.actions_taken, enemy.total_damage_dealt,
+     enemy.current_hp, enemy.total_damage_taken, enemy.element_mask, enemy.element_order,
+     enemy.swirled_mask, enemy.is_frozen, enemy.is_petrified, enemy.marked, debuffs, shield) = record
+    # fresh effect records, the scheduler is rebuilt around them
+    enemy.debuffs = {name: DoT(expires, percentage) if kind is DoT else Debuff(expires)
+                     for name, kind, expires, percentage in debuffs}
+    enemy.shield = None if shield is None else Shield(*shield)
+    enemy.version += 1
+
+
+class Snapshot:
+    __slots__ = ('records', 'players', 'enemies', 'turns', 'joined', 'cursor', 'round_number', 'enemy_damage',
+                 'now', 'events', 'logged', 'fight_rng', 'dice_rng', 'actions')
+
+
+class UndoHistory:
+    # the snapshots of the last `depth` actions of a replay.Fight (and the one before
+    # them), oldest evicted first, plus the undone ones for redo until a new action is
+    # played. Call record(action) after every fight.play(action)
+    def __init__(self, fight, depth=UNDO_DEPTH):
+        self.fight = fight
+        encounter = fight.encounter
+        self.roster = []  # every combatant ever seen, records are aligned with it
+        self.seen = set()
+        self._enroll(encounter.players + encounter.enemies)
+        self.past = deque(maxlen=depth + 1)  # (snapshot, action that led to it), newest is now
+        self.future = []  # undone (snapshot, action), the next redo last
+        self.live_turns = None  # turn order state the live InitiativeOrder holds
+        self.past.append((self._snapshot(None), None))
+
+    @property
+    def depth(self):
+        return self.past.maxlen - 1
+
+    def _enroll(self, combatants):
+        for combatant in combatants:
+            if combatant not in self.seen:
+                self.seen.add(combatant)
+                self.roster.append((combatant, _player_record if combatant.type == 'Player' else _enemy_record,
+                                    _restore_player if combatant.type == 'Player' else _restore_enemy))
+
+    def _snapshot(self, previous):
+        fight = self.fight
+        encounter = fight.encounter
+        initiative = encounter.initiative
+        if previous is not None and initiative.joined != previous.joined:
+            self._enroll(encounter.enemies)  # reinforcements came in
+        records = []
+        old = previous.records if previous is not None else ()
+        shared = len(old)
+        for index, (combatant, make, _) in enumerate(self.roster):
+            if index < shared:
+                record = old[index]
+                if (record[0] == combatant.version and record[1] == combatant.actions_taken
+                        and record[2] == combatant.total_damage_dealt):
+                    records.append(record)
+                    continue
+            records.append(make(combatant))
+
+        snapshot = Snapshot()
+        snapshot.records = tuple(records)
+        # members only ever leave (or join, which moves `joined`), so equal sizes mean equal lists
+        if (previous is not None and previous.joined == initiative.joined
+                and len(previous.players) == len(encounter.players) and len(previous.enemies) == len(encounter.enemies)):
+            snapshot.players = previous.players
+            snapshot.enemies = previous.enemies
+            snapshot.turns = previous.turns
+        else:
+            snapshot.players = tuple(encounter.players)
+            snapshot.enemies = tuple(encounter.enemies)
+            snapshot.turns = tuple((turn.actor, turn.key) for turn in initiative.order)
+        self.live_turns = snapshot.turns
+        snapshot.joined = initiative.joined
+        cursor = initiative.cursor
+        snapshot.cursor = None if cursor is None else (cursor.actor, cursor.key, cursor.next is not None)
+        snapshot.round_number = encounter.round_number
+        snapshot.enemy_damage = encounter.enemy_damage
+        snapshot.now = encounter.effects.clock.now
+        snapshot.events = tuple(encounter.events)
+        snapshot.logged = encounter.history.appended
+        snapshot.fight_rng = encounter.rng.getstate()
+        snapshot.dice_rng = fight.dice_rng.getstate()
+        snapshot.actions = fight.actions
+        return snapshot
+
+    def _restore(self, snapshot):
+        fight = self.fight
+        encounter = fight.encounter
+        for (combatant, _, restore), record in zip(self.roster, snapshot.records):
+            if (record[0] != combatant.version or record[1] != combatant.actions_taken
+                    or record[2] != combatant.total_damage_dealt):
+                restore(combatant, record)
+
+        encounter.players = list(snapshot.players)
+        encounter.enemies = list(snapshot.enemies)
+        encounter.enemy_rank = {enemy: rank for rank, enemy in enumerate(encounter.enemies)}
+        initiative = encounter.initiative
+        if snapshot.turns is not self.live_turns:
+            initiative.__setstate__({'turns': snapshot.turns, 'joined': snapshot.joined, 'cursor': snapshot.cursor})
+            self.live_turns = snapshot.turns
+        elif snapshot.cursor is not None:
+            actor, key, live = snapshot.cursor
+            if live:
+                initiative.seek(actor)
+            elif initiative.cursor.actor is not actor or initiative.cursor.next is not None:
+                initiative.__setstate__({'turns': snapshot.turns, 'joined': snapshot.joined, 'cursor': snapshot.cursor})
+        initiative.joined = snapshot.joined
+        encounter.round_number = snapshot.round_number
+        encounter.enemy_damage = snapshot.enemy_damage
+        encounter.effects.rebuild(snapshot.now, encounter.enemies)
+        encounter.fallen = []
+
+        # the history log goes back by whatever was added since; redo is one step, so
+        # going forward adds the events of that one action
+        history = encounter.history
+        if snapshot.logged < history.appended:
+            history.rewind(snapshot.logged)
+        elif snapshot.logged > history.appended:
+            history.extend(snapshot.events)
+        encounter.events[:] = snapshot.events
+
+        encounter.rng.setstate(snapshot.fight_rng)
+        fight.dice_rng.setstate(snapshot.dice_rng)
+        fight.actions = snapshot.actions
+        # the restored combatants carry new version numbers now, record them against those
+        return self._snapshot(snapshot)
+
+    def record(self, action):
+        self.future.clear()
+        self.past.append((self._snapshot(self.past[-1][0]), action))
+
+    def can_undo(self):
+        return len(self.past) > 1
+
+    def can_redo(self):
+        return bool(self.future)
+
+    def undo(self):
+        # back one action; the action undone, None if there was nothing to undo
+        if len(self.past) < 2:
+            return None
+        undone = self.past.pop()
+        self.future.append(undone)
+        _, action = self.past[-1]
+        self.past[-1] = (self._restore(self.past[-1][0]), action)
+        return undone[1]
+
+    def redo(self):
+        # the last undone action again; that action, None if there was nothing to redo
+        if not self.future:
+            return None
+        snapshot, action = self.future.pop()
+        self.past.append((self._restore(snapshot), action))
+        return action